@@ -0,0 +1,49 @@
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required, current_user
+try:
+    from backend.models.database import db
+    from backend.services.batch_service import BatchService
+    from backend.services.blob_service import get_blob_store
+except ImportError:
+    from models.database import db
+    from services.batch_service import BatchService
+    from services.blob_service import get_blob_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+batch_bp = Blueprint('batch_bp', __name__)
+
+@batch_bp.route('/api/batch', methods=['POST'])
+@login_required
+def run_batch():
+    """Apply many operations in one request and one transaction
+
+    Body: ``{"operations": [...]}``, applied in order, each one of::
+
+        {"op": "move", "ids": [1, 2], "destination_folder_id": 5}   # null moves to the root
+        {"op": "rename", "items": [{"id": 3, "new_name": "report.pdf"}]}
+        {"op": "tag", "ids": [1, 3], "add": ["work"], "remove": ["draft"]}  # or "tags" to replace
+        {"op": "delete", "ids": [4]}
+
+    Returns one result per item, in request order; items that fail (not
+    found, invalid name, cycle) are reported and the others still apply.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        operations = BatchService.parse(data.get('operations'), current_app.config['BATCH_MAX_ITEMS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    store = get_blob_store()
+    try:
+        results, unreferenced = BatchService.apply(operations, current_user.id, store)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in run_batch: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Failed to apply batch'}), 500
+
+    # Only unlink blobs whose last reference is gone, after the commit
+    store.unlink(unreferenced)
+    return jsonify({'success': all(r['success'] for r in results), 'results': results})
@@ -1,117 +1,220 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 try:
-    from backend.services.compression_service import CompressionService
+    from backend.services.compression_service import CompressionService, ExtractionFailed
+    from backend.services.archive_index_service import ArchiveIndexService
+    from backend.services.blob_service import get_blob_store
+    from backend.services.job_service import JobService
+    from backend.services.usage_service import UsageService, QuotaExceeded
+    from backend.services.tree_service import TreeService
     from backend.models.database import db, File
 except ImportError:
-    from services.compression_service import CompressionService
+    from services.compression_service import CompressionService, ExtractionFailed
+    from services.archive_index_service import ArchiveIndexService
+    from services.blob_service import get_blob_store
+    from services.job_service import JobService
+    from services.usage_service import UsageService, QuotaExceeded
+    from services.tree_service import TreeService
     from models.database import db, File
+from mimetypes import guess_type
 from pathlib import Path
+from werkzeug.utils import secure_filename
+import json
 
 compression_bp = Blueprint('compression_bp', __name__)
 
 @compression_bp.route('/api/compress/create', methods=['POST'])
 @login_required
 def create_archive():
-    """Create a compressed archive"""
+    """Queue creation of a compressed archive; poll /api/jobs/<job_id> for progress"""
     data = request.get_json()
     file_ids = data.get('file_ids', [])
     archive_name = data.get('archive_name', 'archive')
-    format_type = data.get('format', 'zip')  # zip, tar, 7z
+    format_type = data.get('format', 'zip')  # zip, tar, tar.gz, tar.bz2, tar.xz, 7z
     password = data.get('password')
     
+    if format_type not in ['zip', 'tar', 'tar.gz', 'tar.bz2', 'tar.xz', '7z']:
+        return jsonify({'error': 'Unsupported format'}), 400
+    
     # Get file paths
     files = File.query.filter(File.id.in_(file_ids), File.user_id == current_user.id).all()
-    file_paths = [f.filepath for f in files if not f.is_folder]
+    files = [f for f in files if not f.is_folder]
     
-    if not file_paths:
+    if not files:
         return jsonify({'error': 'No valid files selected'}), 400
     
-    # Create output path
-    output_dir = Path('FileFlow/user_files') / str(current_user.id)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    output_path = output_dir / f"{archive_name}.{format_type}"
+    # An archive is at most about as large as its inputs
+    try:
+        UsageService.check(current_user.id, sum(f.filesize or 0 for f in files))
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+    
+    # The archive is built in scratch space, then moved into the blob store
+    params = {
+        'entries': [(f.filepath, f.filename) for f in files],
+        'format': format_type,
+        'password': password,
+        'workers': current_app.config['COMPRESSION_WORKERS'],
+        'output_path': str(get_blob_store().new_temp_path()),
+        'upload_folder': str(current_app.config['UPLOAD_FOLDER']),
+        'filename': f"{archive_name}.{format_type}",
+        'mimetype': 'application/zip' if format_type == 'zip' else 'application/x-tar'
+    }
+    job = JobService.submit(current_app._get_current_object(), current_user.id, 'archive.create', params,
+                            CompressionService.run_create_job, _register_archive,
+                            bytes_total=sum(f.filesize or 0 for f in files), members_total=len(files))
     
+    return jsonify({'success': True, 'job_id': job.id}), 202
+
+def _register_archive(job, result):
+    """Job completion handler: add the finished archive to the user's files"""
+    params = json.loads(job.params)
+    new_file = File(
+        filename=params['filename'],
+        filepath=result['filepath'],
+        user_id=job.user_id,
+        filesize=result['filesize'],
+        mimetype=params['mimetype'],
+        file_hash=result['file_hash']
+    )
+    store = get_blob_store()
+    store.add_reference(result['file_hash'], result['filesize'])
     try:
-        if format_type == 'zip':
-            CompressionService.create_zip(file_paths, str(output_path), password)
-        elif format_type in ['tar', 'tar.gz', 'tar.bz2']:
-            compression = format_type.split('.')[-1] if '.' in format_type else None
-            CompressionService.create_tar(file_paths, str(output_path), compression)
-        elif format_type == '7z':
-            CompressionService.create_7z(file_paths, str(output_path), password)
-        else:
-            return jsonify({'error': 'Unsupported format'}), 400
-        
-        # Add to database
-        new_file = File(
-            filename=f"{archive_name}.{format_type}",
-            filepath=str(output_path),
-            user_id=current_user.id,
-            filesize=output_path.stat().st_size,
-            mimetype='application/zip' if format_type == 'zip' else 'application/x-tar'
-        )
-        db.session.add(new_file)
-        db.session.commit()
-        
-        return jsonify({'success': True, 'file_id': new_file.id})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        UsageService.charge(job.user_id, None, result['filesize'], enforce=True)
+    except QuotaExceeded:
+        # The job fails; drop the archive unless the same bytes are already stored
+        db.session.rollback()
+        store.unlink([result['filepath']])
+        raise
+    db.session.add(new_file)
+    db.session.flush()
+    return {'file_id': new_file.id}
 
 @compression_bp.route('/api/compress/extract/<int:file_id>', methods=['POST'])
 @login_required
 def extract_archive(file_id):
-    """Extract a compressed archive"""
+    """Queue extraction of a compressed archive; poll /api/jobs/<job_id> for progress"""
     file = File.query.get_or_404(file_id)
     
     if file.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    data = request.get_json()
+    data = request.get_json() or {}
     password = data.get('password')
     
-    # Create extraction directory
-    extract_dir = Path(file.filepath).parent / Path(file.filepath).stem
-    extract_dir.mkdir(parents=True, exist_ok=True)
+    format_type = CompressionService.archive_format(file.filename)
+    if format_type is None:
+        return jsonify({'error': 'Unsupported archive format'}), 400
+    
+    # Members stream into the blob store; the budget stops zip bombs and
+    # never lets an extraction outgrow the space the user has left
+    usage = UsageService.usage(current_user.id)
+    if usage['available'] == 0:
+        return jsonify({'error': 'Storage quota exceeded', 'used': usage['used'], 'quota': usage['quota']}), 413
+    max_bytes = current_app.config['EXTRACT_MAX_BYTES']
+    if usage['available'] is not None:
+        max_bytes = min(max_bytes, usage['available']) if max_bytes else usage['available']
     
+    params = {
+        'archive_path': file.filepath,
+        'upload_folder': str(current_app.config['UPLOAD_FOLDER']),
+        'format': format_type,
+        'password': password,
+        'max_members': current_app.config['EXTRACT_MAX_MEMBERS'],
+        'max_bytes': max_bytes,
+        'folder_name': Path(file.filename).stem,
+        'parent_folder_id': file.parent_folder_id
+    }
+    job = JobService.submit(current_app._get_current_object(), current_user.id, 'archive.extract', params,
+                            CompressionService.run_extract_job, _register_extracted_tree)
+    
+    return jsonify({'success': True, 'job_id': job.id}), 202
+
+def _register_extracted_tree(job, result):
+    """Job completion handler: add the extracted folders and files to the user's files"""
+    params = json.loads(job.params)
+    store = get_blob_store()
+    if 'error' in result:
+        # The extraction stopped part-way; drop what it stored that nothing else references
+        store.unlink(result['written'])
+        raise ExtractionFailed(result['error'])
     try:
-        ext = Path(file.filepath).suffix.lower()
-        
-        if ext == '.zip':
-            CompressionService.extract_zip(file.filepath, str(extract_dir), password)
-        elif ext in ['.tar', '.gz', '.bz2', '.xz']:
-            CompressionService.extract_tar(file.filepath, str(extract_dir))
-        elif ext == '.7z':
-            CompressionService.extract_7z(file.filepath, str(extract_dir), password)
-        else:
-            return jsonify({'error': 'Unsupported archive format'}), 400
-        
-        # Add extracted folder to database
-        folder = File(
-            filename=Path(file.filepath).stem,
-            filepath=str(extract_dir),
-            user_id=current_user.id,
-            is_folder=True,
-            parent_folder_id=file.parent_folder_id
-        )
-        db.session.add(folder)
-        db.session.commit()
-        
-        return jsonify({'success': True, 'folder_id': folder.id})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        new_ids = TreeService.register_tree(result['entries'], params['parent_folder_id'], job.user_id, store,
+                                            params['folder_name'])
+    except Exception:
+        # The job fails; drop extracted content nothing else references
+        db.session.rollback()
+        store.unlink(entry['filepath'] for entry in result['entries'] if not entry['is_folder'])
+        raise
+    db.session.flush()
+    return {'folder_id': new_ids[''], 'entries': len(new_ids) - 1}
 
 @compression_bp.route('/api/compress/list/<int:file_id>', methods=['GET'])
 @login_required
 def list_archive_contents(file_id):
-    """List contents of an archive"""
+    """List contents of an archive from its cached table of contents"""
+    file = File.query.get_or_404(file_id)
+    
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    format_type = CompressionService.archive_format(file.filename)
+    if format_type is None:
+        return jsonify({'error': 'Unsupported archive format'}), 400
+    
+    try:
+        _, members = ArchiveIndexService.get(file.filepath, format_type, file.file_hash)
+        entries = [{
+            'name': member.name,
+            'size': member.size,
+            'mtime': member.mtime.isoformat() if member.mtime else None,
+            'is_folder': member.is_folder
+        } for member in members]
+        return jsonify({'success': True, 'contents': [entry['name'] for entry in entries], 'entries': entries})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@compression_bp.route('/api/compress/member/<int:file_id>', methods=['GET'])
+@login_required
+def download_archive_member(file_id):
+    """Stream a single member of an archive without extracting the rest"""
     file = File.query.get_or_404(file_id)
     
     if file.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    name = request.args.get('name')
+    if not name:
+        return jsonify({'error': 'Member name is required'}), 400
+    format_type = CompressionService.archive_format(file.filename)
+    if format_type is None:
+        return jsonify({'error': 'Unsupported archive format'}), 400
+    
     try:
-        contents = CompressionService.list_archive_contents(file.filepath)
-        return jsonify({'success': True, 'contents': contents})
+        index, member = ArchiveIndexService.find(file.filepath, format_type, file.file_hash, name)
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
+    if member is None:
+        return jsonify({'error': 'Member not found'}), 404
+    
+    try:
+        chunks = ArchiveIndexService.open_member(file.filepath, index, member)
+        # Pull the first chunk now so a corrupt or encrypted member fails with an error status
+        first = next(chunks, b'')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        yield first
+        yield from chunks
+    
+    filename = Path(member.name).name
+    response = Response(stream_with_context(generate()),
+                        mimetype=guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['Content-Length'] = str(member.size)
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(filename) or "download"}"'
+    return response
@@ -1,144 +1,197 @@
-from flask import Blueprint, send_file, abort, jsonify, request, make_response
+from flask import Blueprint, abort, jsonify, request, make_response, Response
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 try:
     from backend.models.database import db, File
     from backend.utils.validators import Validators
+    from backend.services.blob_service import get_blob_store
+    from backend.services.compression_service import CompressionService
+    from backend.services.tree_service import TreeService
+    from backend.utils.pagination import FILE_FIELDS, keyset_page, parse_limit
+    from backend.services.serving_service import ServingService
+    from backend.services.metadata_cache_service import MetadataCacheService
+    from backend.services.usage_service import UsageService, QuotaExceeded
 except ImportError:
     from models.database import db, File
     from utils.validators import Validators
+    from services.blob_service import get_blob_store
+    from services.compression_service import CompressionService
+    from services.tree_service import TreeService
+    from utils.pagination import FILE_FIELDS, keyset_page, parse_limit
+    from services.serving_service import ServingService
+    from services.metadata_cache_service import MetadataCacheService
+    from services.usage_service import UsageService, QuotaExceeded
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
 from pathlib import Path
 import logging
+import posixpath
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
 files_bp = Blueprint('files_bp', __name__)
 
+# Default fields and sort key of the folder listing
+LISTING_FIELDS = ('id', 'name', 'filename', 'is_folder', 'size', 'created_at', 'parent_folder_id')
+LISTING_ORDER = ((File.is_folder, True), (File.filename, False), (File.id, False))
+
 @files_bp.route('/api/files')
 @login_required
 def get_files():
-    """JSON API endpoint to get files for the current user"""
+    """JSON API endpoint to get files for the current user
+
+    ``fields=id,name`` limits the returned fields. ``limit=N`` returns pages
+    of ``{"items": [...], "next_cursor": ...}``; pass ``cursor`` to continue.
+    """
     folder_id = request.args.get('folder_id', type=int)
-    user_files = File.query.filter_by(user_id=current_user.id, parent_folder_id=folder_id).order_by(
-        File.is_folder.desc(),
-        File.filename
-    ).all()
-    
-    files_list = []
-    for f in user_files:
-        files_list.append({
-            'id': f.id,
-            'name': f.filename,
-            'filename': f.filename,
-            'is_folder': f.is_folder,
-            'size': f.filesize if hasattr(f, 'filesize') else 0,
-            'created_at': f.created_at.isoformat() if hasattr(f, 'created_at') and f.created_at else None,
-            'parent_folder_id': f.parent_folder_id
-        })
-    
-    return jsonify(files_list)
+    statement = select(File).where(File.user_id == current_user.id, File.parent_folder_id == folder_id)
+    try:
+        names = FILE_FIELDS.parse(request.args.get('fields'), LISTING_FIELDS)
+        limit = parse_limit(request.args.get('limit'))
+        return keyset_page(statement, names, LISTING_ORDER, limit, request.args.get('cursor'))
+    except ValueError as e:
+        abort(400, description=str(e))
 
 @files_bp.route('/api/breadcrumbs/<int:folder_id>')
 @login_required
 def get_breadcrumbs(folder_id):
     """Get breadcrumb trail for a folder"""
-    breadcrumbs = []
     folder = File.query.get(folder_id)
-    
-    while folder:
-        if folder.user_id != current_user.id:
-            break
-        breadcrumbs.append({'id': folder.id, 'name': folder.filename})
-        folder = File.query.get(folder.parent_folder_id) if folder.parent_folder_id else None
-    
-    breadcrumbs.reverse()
-    return jsonify(breadcrumbs)
+    if not folder or folder.user_id != current_user.id:
+        return jsonify([])
+    return jsonify(TreeService.breadcrumbs(folder, current_user.id))
 
 @files_bp.route('/download_file/<int:file_id>')
 @login_required
 def download_file(file_id):
     try:
-        file = File.query.get_or_404(file_id)
+        # Cached row, stat and ETag: repeat and conditional requests skip the DB and disk
+        file = MetadataCacheService.get(file_id)
+        if file is None:
+            abort(404)
         
         if file.user_id != current_user.id:
             abort(403, description="You don't have permission to access this file")
+        
+        if file.is_folder:
+            # Folders are bundled into a ZIP on the fly
+            return _zip_response([db.session.get(File, file_id)], f"{file.filename}.zip")
             
-        filepath = Path(file.filepath)
-        if not filepath.exists():
+        if not file.exists:
             logger.warning(f"File not found on disk: {file.filepath}")
             abort(404, description="File not found in storage")
-            
-        if file.is_folder:
-            abort(400, description="Cannot download a folder")
-        
-        mimetype = file.mimetype or 'application/octet-stream'
-        
-        # Use send_file with optimizations
-        # X-Sendfile support for nginx/apache (much faster for large files)
-        response = send_file(
-            str(filepath),
-            as_attachment=True,
-            download_name=secure_filename(file.filename),
-            mimetype=mimetype,
-            conditional=True  # Enable HTTP 304 Not Modified responses
-        )
-        
-        # Add cache headers for better performance
-        response.cache_control.max_age = 86400  # 24 hours
-        response.cache_control.public = True
         
-        # Add ETag for client-side caching
-        file_stat = filepath.stat()
-        etag = f'{file_stat.st_mtime}-{file_stat.st_size}'
-        response.set_etag(etag)
+        # Range requests and X-Accel/X-Sendfile offload are handled by the serving layer
+        response = ServingService.send(Path(file.filepath), file.mimetype,
+                                       download_name=secure_filename(file.filename),
+                                       as_attachment=True,
+                                       max_age=86400,  # 24 hours
+                                       etag=file.etag, size=file.size, mtime=file.mtime)
         
-        logger.info(f"File download started: {file.filename} (ID: {file_id}, Size: {file_stat.st_size})")
+        logger.info(f"File download started: {file.filename} (ID: {file_id}, Status: {response.status_code})")
         return response
         
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        # Removed from disk since it was cached
+        MetadataCacheService.invalidate([file_id])
+        abort(404, description="File not found in storage")
     except Exception as e:
         logger.error(f"Error downloading file {file_id}: {str(e)}", exc_info=True)
         abort(500, description="Error occurred while downloading file")
 
+@files_bp.route('/download_zip')
+@login_required
+def download_zip():
+    """Stream a ZIP of the selected files and folders (?ids=1&ids=2 or ?ids=1,2)"""
+    file_ids = []
+    for value in request.args.getlist('ids'):
+        for part in value.split(','):
+            if part.strip().isdigit():
+                file_ids.append(int(part))
+    if not file_ids:
+        abort(400, description="No files selected")
+    
+    selected = File.query.filter(File.id.in_(file_ids), File.user_id == current_user.id).all()
+    if len(selected) != len(set(file_ids)):
+        abort(404, description="One or more files were not found")
+    
+    archive_name = request.args.get('name') or (
+        f"{selected[0].filename}.zip" if len(selected) == 1 else 'download.zip')
+    return _zip_response(selected, archive_name)
+
+def _collect_zip_entries(roots):
+    """Resolve the selected items' subtrees in one query and name every entry"""
+    entries = []
+    used_names = set()
+    
+    def unique(arcname):
+        # Names only need to be unique within the archive, not the folder
+        candidate, counter = arcname, 1
+        base, ext = posixpath.splitext(arcname)
+        while candidate in used_names:
+            candidate = f"{base} ({counter}){ext}"
+            counter += 1
+        used_names.add(candidate)
+        return candidate
+    
+    rows = TreeService.subtree_rows([item.id for item in roots], current_user.id,
+                                    File.id, File.filename, File.filepath, File.is_folder,
+                                    File.mimetype, File.parent_folder_id)
+    folder_paths = {}
+    for row in rows:
+        # Rows arrive shallowest first, so a parent's name is always known
+        parent = folder_paths.get(row.parent_folder_id)
+        arcname = unique(f"{parent}/{row.filename}" if parent else row.filename)
+        if row.is_folder:
+            entries.append((None, arcname, None))
+            folder_paths[row.id] = arcname
+        elif Path(row.filepath).is_file():
+            entries.append((row.filepath, arcname, row.mimetype))
+        else:
+            logger.warning(f"Skipping file missing from storage: {row.filepath}")
+    return entries
+
+def _zip_response(roots, archive_name):
+    entries = _collect_zip_entries(roots)
+    response = Response(CompressionService.stream_zip(entries), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(archive_name) or "download.zip"}"'
+    response.headers['Cache-Control'] = 'no-store'
+    logger.info(f"Streaming ZIP download: {archive_name} ({len(entries)} entries)")
+    return response
+
 @files_bp.route('/view_file/<int:file_id>')
 @login_required
 def view_file(file_id):
     try:
-        file = File.query.get_or_404(file_id)
+        file = MetadataCacheService.get(file_id)
+        if file is None:
+            abort(404)
         
         if file.user_id != current_user.id:
             abort(403, description="You don't have permission to access this file")
             
-        filepath = Path(file.filepath)
-        if not filepath.exists():
-            logger.warning(f"File not found on disk: {file.filepath}")
-            abort(404, description="File not found in storage")
-            
         if file.is_folder:
             abort(400, description="Cannot view a folder")
+            
+        if not file.exists:
+            logger.warning(f"File not found on disk: {file.filepath}")
+            abort(404, description="File not found in storage")
         
-        mimetype = file.mimetype or 'application/octet-stream'
-        
-        # Use send_file with optimizations
-        response = send_file(
-            str(filepath),
-            as_attachment=False,
-            mimetype=mimetype,
-            conditional=True  # Enable HTTP 304 Not Modified responses
-        )
-        
-        # Add cache headers for better performance
-        response.cache_control.max_age = 3600  # 1 hour
-        response.cache_control.public = True
-        
-        # Add ETag for client-side caching
-        file_stat = filepath.stat()
-        etag = f'{file_stat.st_mtime}-{file_stat.st_size}'
-        response.set_etag(etag)
+        # Range support lets browsers seek in audio and video
+        response = ServingService.send(Path(file.filepath), file.mimetype, max_age=3600,  # 1 hour
+                                       etag=file.etag, size=file.size, mtime=file.mtime)
         
-        logger.info(f"File view started: {file.filename} (ID: {file_id}, Size: {file_stat.st_size})")
+        logger.info(f"File view started: {file.filename} (ID: {file_id}, Status: {response.status_code})")
         return response
         
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        MetadataCacheService.invalidate([file_id])
+        abort(404, description="File not found in storage")
     except Exception as e:
         logger.error(f"Error viewing file {file_id}: {str(e)}", exc_info=True)
         abort(500, description="Error occurred while viewing file")
@@ -152,34 +205,13 @@ def delete_file(file_id):
         if file.user_id != current_user.id:
             abort(403, description="You don't have permission to delete this file")
         
-        if file.is_folder:
-            def delete_folder_contents(folder_id):
-                contents = File.query.filter_by(parent_folder_id=folder_id).all()
-                for item in contents:
-                    if item.is_folder:
-                        delete_folder_contents(item.id)
-                    else:
-                        try:
-                            filepath = Path(item.filepath)
-                            if filepath.exists():
-                                filepath.unlink()
-                        except OSError as e:
-                            logger.warning(f"Error deleting file {item.filepath}: {str(e)}")
-                            pass
-                    db.session.delete(item)
-                
-            delete_folder_contents(file.id)
-        else:
-            try:
-                filepath = Path(file.filepath)
-                if filepath.exists():
-                    filepath.unlink()
-            except OSError as e:
-                logger.warning(f"Error deleting file {file.filepath}: {str(e)}")
-                pass
-        
-        db.session.delete(file)
+        # Remove the whole subtree in bulk; blobs are released with it
+        store = get_blob_store()
+        unreferenced = TreeService.delete_subtrees([file.id], current_user.id, store)
         db.session.commit()
+        
+        # Only unlink blobs whose last reference is gone, after the commit
+        store.unlink(unreferenced)
         return jsonify({'message': 'File deleted successfully'}), 200
         
     except Exception as e:
@@ -225,9 +257,59 @@ def move_file(file_id):
         destination_folder = File.query.get_or_404(destination_folder_id)
         if not destination_folder.is_folder or destination_folder.user_id != current_user.id:
             abort(400)
-        file_to_move.parent_folder_id = destination_folder_id
+        if TreeService.would_create_cycle([file_to_move.id], destination_folder.id):
+            abort(400, description="Cannot move a folder into itself or one of its subfolders")
     else:  # Move to root
-        file_to_move.parent_folder_id = None
+        destination_folder_id = None
 
+    # The user's total is unchanged; only the folders on either side are
+    UsageService.transfer(current_user.id, UsageService.size_of(file_to_move),
+                          file_to_move.parent_folder_id, destination_folder_id)
+    file_to_move.parent_folder_id = destination_folder_id
     db.session.commit()
     return jsonify({'success': True})
+
+@files_bp.route('/copy_file/<int:file_id>', methods=['POST'])
+@login_required
+def copy_file(file_id):
+    """Copy a file or a whole folder tree into a destination folder"""
+    file_to_copy = File.query.get_or_404(file_id)
+    if file_to_copy.user_id != current_user.id:
+        abort(403)
+
+    data = request.get_json() or {}
+    destination_folder_id = data.get('destination_folder_id')
+
+    if destination_folder_id:
+        destination_folder = File.query.get_or_404(destination_folder_id)
+        if not destination_folder.is_folder or destination_folder.user_id != current_user.id:
+            abort(400)
+        if TreeService.would_create_cycle([file_to_copy.id], destination_folder.id):
+            abort(400, description="Cannot copy a folder into itself or one of its subfolders")
+    else:  # Copy to root
+        destination_folder_id = None
+
+    try:
+        # Refuse before any legacy file is imported into the blob store
+        UsageService.check(current_user.id, UsageService.size_of(file_to_copy))
+        new_ids = TreeService.copy_subtrees([file_to_copy.id], destination_folder_id,
+                                            current_user.id, get_blob_store())
+        db.session.commit()
+    except QuotaExceeded as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in copy_file: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Failed to copy file'}), 500
+    return jsonify({'success': True, 'file_id': new_ids[file_to_copy.id], 'copied': len(new_ids)})
+
+@files_bp.route('/api/files/<int:file_id>/size')
+@login_required
+def get_file_size(file_id):
+    """Total size and file count of a file or folder subtree"""
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        abort(403)
+    total, count = TreeService.subtree_size([file.id], current_user.id)
+    return jsonify({'id': file.id, 'size': total, 'file_count': count})
@@ -2,8 +2,12 @@ from flask import Blueprint, request, flash, redirect, url_for, render_template,
 from flask_login import login_required, current_user
 try:
     from backend.models.database import db, File
+    from backend.services.tree_service import TreeService
+    from backend.services.usage_service import UsageService
 except ImportError:
     from models.database import db, File
+    from services.tree_service import TreeService
+    from services.usage_service import UsageService
 
 folders_bp = Blueprint('folders_bp', __name__)
 
@@ -16,13 +20,10 @@ def dashboard(folder_id=None):
     breadcrumbs = []
     if folder_id:
         current_folder = File.query.get_or_404(folder_id)
-        folder = current_folder
-        while folder:
-            breadcrumbs.append({'id': folder.id, 'name': folder.filename})
-            folder = File.query.get(folder.parent_folder_id) if folder.parent_folder_id else None
-        breadcrumbs.reverse()
+        breadcrumbs = TreeService.breadcrumbs(current_folder, current_user.id)
 
-    return render_template('dashboard.html', files=user_files, breadcrumbs=breadcrumbs, current_folder_id=folder_id)
+    return render_template('dashboard.html', files=user_files, breadcrumbs=breadcrumbs, current_folder_id=folder_id,
+                           usage=UsageService.usage(current_user.id))
 
 @folders_bp.route('/create_folder', methods=['POST'])
 @login_required
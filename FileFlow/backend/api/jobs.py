@@ -0,0 +1,26 @@
+from flask import Blueprint, jsonify, abort
+from flask_login import login_required, current_user
+try:
+    from backend.models.database import Job
+    from backend.services.job_service import JobService
+except ImportError:
+    from models.database import Job
+    from services.job_service import JobService
+
+jobs_bp = Blueprint('jobs_bp', __name__)
+
+@jobs_bp.route('/api/jobs')
+@login_required
+def list_jobs():
+    """List the current user's most recent background jobs"""
+    jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.created_at.desc()).limit(50).all()
+    return jsonify([JobService.check_orphaned(job).to_dict() for job in jobs])
+
+@jobs_bp.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    """Report status and progress (bytes and members processed) of a job"""
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403, description="You don't have permission to access this job")
+    return jsonify(JobService.check_orphaned(job).to_dict())
@@ -2,17 +2,44 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 try:
     from backend.models.database import db, File, SearchProfile
+    from backend.services.search_service import SearchService
+    from backend.services.tag_service import TagService
+    from backend.utils.pagination import FILE_FIELDS, keyset_page, parse_limit
 except ImportError:
     from models.database import db, File, SearchProfile
-from sqlalchemy import or_, and_
+    from services.search_service import SearchService
+    from services.tag_service import TagService
+    from utils.pagination import FILE_FIELDS, keyset_page, parse_limit
+from sqlalchemy import select, or_, and_
 from datetime import datetime
 
 search_bp = Blueprint('search_bp', __name__)
 
+# Fields returned when the request does not ask for specific ones (File.to_dict)
+SEARCH_FIELDS = ('id', 'filename', 'filepath', 'is_folder', 'parent_folder_id', 'created_at',
+                 'modified_at', 'filesize', 'mimetype', 'is_favorite', 'tags')
+
+def _prefix_condition(column, prefix):
+    """Prefix match written as a range so the (user_id, column) index is used
+
+    LIKE/ILIKE 'prefix%' cannot use a plain index on SQLite or on Postgres
+    without a special operator class; a half-open range can.
+    """
+    prefix = prefix.lower()
+    if not prefix:
+        return column.isnot(None)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
 @search_bp.route('/api/search', methods=['POST'])
 @login_required
 def search_files():
-    """Advanced file search"""
+    """Advanced file search
+
+    Accepts ``fields``, ``limit`` and ``cursor`` like /api/files; ranked
+    text matches page on (rank, id), everything else on id. ``tags`` keeps
+    files carrying all of the names (``tags_match: "any"`` for any of them).
+    """
     data = request.get_json()
     query = data.get('query', '')
     file_types = data.get('file_types', [])
@@ -20,38 +47,51 @@ def search_files():
     size_max = data.get('size_max')
     date_from = data.get('date_from')
     date_to = data.get('date_to')
+    tags = data.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
     
     # Base query
-    search_query = File.query.filter_by(user_id=current_user.id)
+    search_query = select(File).where(File.user_id == current_user.id)
+    order = [(File.id, False)]
     
-    # Text search
+    # Text search, ranked by the full-text index
     if query:
-        search_query = search_query.filter(
-            or_(
-                File.filename.ilike(f'%{query}%'),
-                File.tags.ilike(f'%{query}%')
-            )
-        )
+        hits = SearchService.hits(current_user.id, query)
+        search_query = search_query.join(hits, File.id == hits.c.file_id)
+        order = [(hits.c.rank, False), (File.id, False)]
     
     # File type filter
     if file_types:
-        type_conditions = [File.mimetype.ilike(f'{ft}%') for ft in file_types]
-        search_query = search_query.filter(or_(*type_conditions))
+        type_conditions = [_prefix_condition(File.mimetype, ft) for ft in file_types]
+        search_query = search_query.where(or_(*type_conditions))
     
     # Size filter
     if size_min is not None:
-        search_query = search_query.filter(File.filesize >= size_min)
+        search_query = search_query.where(File.filesize >= size_min)
     if size_max is not None:
-        search_query = search_query.filter(File.filesize <= size_max)
+        search_query = search_query.where(File.filesize <= size_max)
+    
+    # Tag filter, an indexed join on the tag tables
+    if tags:
+        try:
+            matching = TagService.matching(current_user.id, tags, data.get('tags_match', 'all') != 'any')
+        except (ValueError, AttributeError, TypeError):
+            return jsonify({'error': 'tags must be a list of names'}), 400
+        search_query = search_query.where(File.id.in_(matching))
     
     # Date filter
     if date_from:
-        search_query = search_query.filter(File.created_at >= datetime.fromisoformat(date_from))
+        search_query = search_query.where(File.created_at >= datetime.fromisoformat(date_from))
     if date_to:
-        search_query = search_query.filter(File.created_at <= datetime.fromisoformat(date_to))
+        search_query = search_query.where(File.created_at <= datetime.fromisoformat(date_to))
     
-    results = search_query.all()
-    return jsonify([file.to_dict() for file in results])
+    try:
+        names = FILE_FIELDS.parse(data.get('fields'), SEARCH_FIELDS)
+        limit = parse_limit(data.get('limit'))
+        return keyset_page(search_query, names, order, limit, data.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @search_bp.route('/api/search/profiles', methods=['GET'])
 @login_required
@@ -0,0 +1,131 @@
+from flask import Blueprint, abort, jsonify, request
+from flask_login import login_required, current_user
+try:
+    from backend.models.database import db, File, Tag
+    from backend.services.tag_service import TagService, TagExists
+    from backend.utils.pagination import FILE_FIELDS, keyset_page, parse_limit
+except ImportError:
+    from models.database import db, File, Tag
+    from services.tag_service import TagService, TagExists
+    from utils.pagination import FILE_FIELDS, keyset_page, parse_limit
+from sqlalchemy import select
+import logging
+
+logger = logging.getLogger(__name__)
+
+tags_bp = Blueprint('tags_bp', __name__)
+
+# Default fields of the tagged-files listing
+TAGGED_FIELDS = ('id', 'name', 'is_folder', 'size', 'mimetype', 'modified_at', 'parent_folder_id', 'tags')
+
+
+def _own_tag(tag_id):
+    tag = db.session.get(Tag, tag_id)
+    if tag is None:
+        abort(404, description="Tag not found")
+    if tag.user_id != current_user.id:
+        abort(403, description="You don't have permission to change this tag")
+    return tag
+
+
+def _tag_names(value):
+    """Tag names from a JSON list or a comma-separated query string"""
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        abort(400, description="Tags must be a list of names")
+    try:
+        return TagService.clean(value)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+
+@tags_bp.route('/api/tags', methods=['GET'])
+@login_required
+def list_tags():
+    """The user's tags with the number of files carrying each (the tag facet)"""
+    return jsonify(TagService.facet(current_user.id))
+
+
+@tags_bp.route('/api/tags', methods=['POST'])
+@login_required
+def create_tag():
+    data = request.get_json(silent=True) or {}
+    names = _tag_names([data.get('name') or ''])
+    if not names:
+        abort(400, description="Tag name is required")
+    existing = TagService.lookup(current_user.id, names).get(TagService.key(names[0]))
+    if existing is not None:
+        return jsonify({'id': existing.id, 'name': existing.name}), 200
+    tag_id = TagService.ensure(current_user.id, names)[TagService.key(names[0])]
+    db.session.commit()
+    return jsonify({'id': tag_id, 'name': names[0]}), 201
+
+
+@tags_bp.route('/api/tags/<int:tag_id>', methods=['PUT'])
+@login_required
+def rename_tag(tag_id):
+    tag = _own_tag(tag_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        TagService.rename(tag, data.get('name') or '')
+    except TagExists as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({'id': tag.id, 'name': tag.name})
+
+
+@tags_bp.route('/api/tags/<int:tag_id>', methods=['DELETE'])
+@login_required
+def delete_tag(tag_id):
+    TagService.delete(_own_tag(tag_id))
+    db.session.commit()
+    return jsonify({'success': True})
+
+
+@tags_bp.route('/api/tags/files', methods=['GET'])
+@login_required
+def tagged_files():
+    """Files carrying all (``match=all``, the default) or any of ``tags=a,b``
+
+    Accepts ``fields``, ``limit`` and ``cursor`` like /api/files.
+    """
+    names = _tag_names(request.args.get('tags', ''))
+    if not names:
+        abort(400, description="At least one tag is required")
+    match_all = request.args.get('match', 'all') != 'any'
+    query = select(File).where(File.user_id == current_user.id,
+                               File.id.in_(TagService.matching(current_user.id, names, match_all)))
+    try:
+        fields = FILE_FIELDS.parse(request.args.get('fields'), TAGGED_FIELDS)
+        limit = parse_limit(request.args.get('limit'))
+        return keyset_page(query, fields, [(File.id, False)], limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@tags_bp.route('/api/files/<int:file_id>/tags', methods=['GET'])
+@login_required
+def get_file_tags(file_id):
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        abort(403)
+    return jsonify({'id': file.id, 'tags': TagService.names_for([file.id]).get(file.id, [])})
+
+
+@tags_bp.route('/api/files/<int:file_id>/tags', methods=['PUT'])
+@login_required
+def set_file_tags(file_id):
+    """Replace a file's tags; tags that do not exist yet are created"""
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        abort(403)
+    data = request.get_json(silent=True) or {}
+    names = _tag_names(data.get('tags', []))
+    TagService.set_tags(current_user.id, {file.id: names})
+    db.session.commit()
+    return jsonify({'id': file.id, 'tags': sorted(names, key=str.lower)})
@@ -0,0 +1,49 @@
+from flask import Blueprint, abort, current_app, request, Response
+from flask_login import login_required, current_user
+try:
+    from backend.services.metadata_cache_service import MetadataCacheService
+    from backend.services.rendition_service import RenditionService, RenditionError
+    from backend.services.serving_service import ServingService
+except ImportError:
+    from services.metadata_cache_service import MetadataCacheService
+    from services.rendition_service import RenditionService, RenditionError
+    from services.serving_service import ServingService
+import logging
+
+logger = logging.getLogger(__name__)
+
+thumbnails_bp = Blueprint('thumbnails_bp', __name__)
+
+@thumbnails_bp.route('/thumb/<int:file_id>/<int:size>')
+@login_required
+def thumbnail(file_id, size):
+    """Serve a rendition of an image no larger than `size` pixels on either side"""
+    if size not in current_app.config['THUMBNAIL_SIZES']:
+        abort(404, description="Unknown thumbnail size")
+
+    file = MetadataCacheService.get(file_id)
+    if file is None:
+        abort(404)
+    if file.user_id != current_user.id:
+        abort(403, description="You don't have permission to access this file")
+    if file.is_folder or not file.exists or not RenditionService.supports(file.mimetype):
+        abort(404, description="No preview available for this file")
+
+    format_name = RenditionService.choose_format()
+    etag = f'{file.etag}-{size}-{format_name}'
+    max_age = current_app.config['THUMBNAIL_MAX_AGE']
+    headers = {'ETag': f'"{etag}"', 'Vary': 'Accept',
+               'Cache-Control': f'private, max-age={max_age}'}
+    # Renditions only change with the content, so a matching ETag needs no disk access
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    try:
+        path = RenditionService.get(file.filepath, file.etag, size, format_name)
+    except RenditionError as e:
+        logger.warning(f"Could not render preview of file {file_id}: {str(e)}")
+        abort(404, description="No preview available for this file")
+
+    response = ServingService.send(path, RenditionService.mimetype(format_name), max_age=max_age, etag=etag)
+    response.headers.update(headers)
+    return response
@@ -1,26 +1,65 @@
-from flask import Blueprint, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, request, flash, redirect, url_for, jsonify, current_app, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from mimetypes import guess_type
 try:
-    from backend.models.database import db, File
+    from backend.models.database import db, File, UploadSession
     from backend.utils.validators import Validators
+    from backend.services.upload_service import UploadService, UploadOffsetMismatch
+    from backend.services.blob_service import get_blob_store
+    from backend.services.search_service import SearchService
+    from backend.services.rendition_service import RenditionService
+    from backend.services.mimetype_service import MimetypeService, HeadCapture
+    from backend.services.usage_service import UsageService, QuotaExceeded
+    from backend.services.compression_service import ExtractionBudget, ExtractionBudgetExceeded
+    from backend.services.tree_service import TreeService
 except ImportError:
-    from models.database import db, File
+    from models.database import db, File, UploadSession
     from utils.validators import Validators
-from pathlib import Path
+    from services.upload_service import UploadService, UploadOffsetMismatch
+    from services.blob_service import get_blob_store
+    from services.search_service import SearchService
+    from services.rendition_service import RenditionService
+    from services.mimetype_service import MimetypeService, HeadCapture
+    from services.usage_service import UsageService, QuotaExceeded
+    from services.compression_service import ExtractionBudget, ExtractionBudgetExceeded
+    from services.tree_service import TreeService
 import logging
+import tarfile
 
 logger = logging.getLogger(__name__)
 
 upload_bp = Blueprint('upload_bp', __name__)
 
+# Define allowed extensions for every upload path
+ALLOWED_EXTENSIONS = ['txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'zip', 'mp4', 'mov', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'mp3', 'wav', 'avi', 'mkv', 'html', 'css', 'js', 'py', 'json', 'xml', 'csv']
+
+# Upper bound on the multipart framing around a single uploaded file
+MULTIPART_OVERHEAD = 1024
+
+# Bodies /api/upload/bulk reads as a tar stream; compression is detected from the bytes
+TAR_CONTENT_TYPES = ('application/x-tar', 'application/tar', 'application/x-gtar', 'application/gzip',
+                     'application/x-gzip', 'application/x-bzip2', 'application/x-xz')
+
+
+def get_upload_service():
+    return UploadService(current_app.config['UPLOAD_FOLDER'])
+
 @upload_bp.route('/upload', methods=['POST'])
 @login_required
 def upload_file():
     # Check if this is an AJAX/API request
     is_api_request = request.headers.get('Accept') == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     
+    # Refuse an upload that cannot fit before the form parser spools it; the
+    # exact size is charged once it is stored
+    try:
+        UsageService.check(current_user.id, (request.content_length or 0) - MULTIPART_OVERHEAD)
+    except QuotaExceeded as e:
+        if is_api_request:
+            return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+        flash('Not enough storage space left for this file')
+        return redirect(url_for('folders_bp.dashboard'))
+    
     if 'file' not in request.files:
         if is_api_request:
             return jsonify({'error': 'No file part'}), 400
@@ -36,9 +75,8 @@ def upload_file():
         flash('No selected file')
         return redirect(url_for('folders_bp.dashboard'))
 
-    # Define allowed extensions and validate the file
-    allowed_extensions = ['txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'zip', 'mp4', 'mov', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'mp3', 'wav', 'avi', 'mkv', 'html', 'css', 'js', 'py', 'json', 'xml', 'csv']
-    if not Validators.allowed_file(file.filename, allowed_extensions):
+    # Validate the file extension
+    if not Validators.allowed_file(file.filename, ALLOWED_EXTENSIONS):
         if is_api_request:
             return jsonify({'error': 'File type not allowed'}), 400
         flash('File type not allowed')
@@ -50,43 +88,51 @@ def upload_file():
         else:
             return redirect(url_for('folders_bp.dashboard'))
     
+    # Bytes are charged up the destination's folder chain, so it must be one
+    # of the user's own folders; checked before anything is written
+    parent_folder_id = None
+    if folder_id:
+        try:
+            parent = db.session.get(File, int(folder_id))
+        except (ValueError, TypeError):
+            parent = None
+        if parent is None or not parent.is_folder or parent.user_id != current_user.id:
+            status = 403 if parent is not None and parent.is_folder else 404
+            if is_api_request:
+                return jsonify({'error': 'Invalid destination folder'}), status
+            flash('Invalid destination folder')
+            return redirect(url_for('folders_bp.dashboard'))
+        parent_folder_id = parent.id
+    
     if file:
+        filepath = None
         try:
             filename = secure_filename(file.filename)
-            # This needs to be adjusted based on the app factory pattern
-            upload_folder = Path.cwd() / 'FileFlow' / 'user_files'
-            filepath = upload_folder / str(current_user.id) / filename
+            store = get_blob_store()
             
-            filepath.parent.mkdir(parents=True, exist_ok=True)
-            
-            file.save(filepath)
+            # Stream into the content-addressed store, hashing as we write and
+            # keeping the first few KB for content sniffing
+            stream = HeadCapture(file.stream)
+            file_hash, file_size, filepath = store.write_stream(stream)
             logger.info(f"File saved: {filepath}")
             
-            # Get file size
-            file_size = filepath.stat().st_size if filepath.exists() else 0
-            
-            # Get MIME type
-            mimetype, _ = guess_type(filepath)
-            if not mimetype:
-                mimetype = 'application/octet-stream'
-            
-            # Convert folder_id to int if it exists
-            parent_folder_id = None
-            if folder_id:
-                try:
-                    parent_folder_id = int(folder_id)
-                except (ValueError, TypeError):
-                    parent_folder_id = None
+            # Known content reuses its stored verdict; new content is sniffed
+            store.add_reference(file_hash, file_size)
+            mimetype = MimetypeService.for_blob(file_hash, filename, head=stream.head)
             
+            UsageService.charge(current_user.id, parent_folder_id, file_size, enforce=True)
             new_file = File(filename=filename, filepath=str(filepath), 
                             user_id=current_user.id, 
                             parent_folder_id=parent_folder_id,
                             filesize=file_size,
-                            mimetype=mimetype)
+                            mimetype=mimetype,
+                            file_hash=file_hash)
             
             db.session.add(new_file)
             db.session.commit()
             logger.info(f"File record created: {new_file.id} - {filename}")
+            SearchService.schedule_contents([(new_file.id, new_file.filepath, new_file.mimetype)])
+            RenditionService.schedule(new_file.filepath, new_file.mimetype, new_file.file_hash)
             
             if is_api_request:
                 return jsonify({
@@ -104,10 +150,259 @@ def upload_file():
                 return redirect(url_for('folders_bp.dashboard', folder_id=parent_folder_id))
             else:
                 return redirect(url_for('folders_bp.dashboard'))
+        except QuotaExceeded as e:
+            db.session.rollback()
+            if filepath is not None:
+                # Content nobody else references was written for nothing
+                get_blob_store().unlink([filepath])
+            if is_api_request:
+                return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+            flash('Not enough storage space left for this file')
+            return redirect(url_for('folders_bp.dashboard'))
         except Exception as e:
             db.session.rollback()
+            if filepath is not None:
+                get_blob_store().unlink([filepath])
             logger.error(f"Error uploading file: {str(e)}", exc_info=True)
             if is_api_request:
                 return jsonify({'error': f'Upload failed: {str(e)}'}), 500
             flash(f'Error uploading file: {str(e)}')
             return redirect(url_for('folders_bp.dashboard'))
+
+
+def _get_own_upload_session(upload_id):
+    session = UploadSession.query.get_or_404(upload_id)
+    if session.user_id != current_user.id:
+        abort(403, description="You don't have permission to access this upload")
+    return session
+
+
+@upload_bp.route('/api/upload/init', methods=['POST'])
+@login_required
+def init_chunked_upload():
+    """Start a resumable upload; chunks are then PUT by offset"""
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    total_size = data.get('size')
+    folder_id = data.get('folder_id')
+
+    if not filename:
+        return jsonify({'error': 'Filename is required'}), 400
+    if not Validators.allowed_file(filename, ALLOWED_EXTENSIONS):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if not isinstance(total_size, int) or total_size < 0:
+        return jsonify({'error': 'A non-negative integer size is required'}), 400
+
+    parent_folder_id = None
+    if folder_id:
+        parent = File.query.get(folder_id)
+        if not parent or not parent.is_folder or parent.user_id != current_user.id:
+            return jsonify({'error': 'Invalid destination folder'}), 400
+        parent_folder_id = parent.id
+
+    try:
+        UsageService.check(current_user.id, total_size)
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+
+    service = get_upload_service()
+    service.expire_stale(current_app.config['UPLOAD_SESSION_TTL'])
+    session = service.create_session(current_user.id, filename, total_size, parent_folder_id)
+    logger.info(f"Chunked upload started: {session.id} - {filename} ({total_size} bytes)")
+
+    response = session.to_dict()
+    response['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(response), 201
+
+
+@upload_bp.route('/api/upload/<upload_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id):
+    """Write one chunk of the request body at ?offset=N"""
+    session = _get_own_upload_session(upload_id)
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+
+    if offset is None:
+        return jsonify({'error': 'offset query parameter is required'}), 400
+    if length is None:
+        return jsonify({'error': 'Content-Length is required'}), 411
+
+    try:
+        received = get_upload_service().write_chunk(session, offset, request.stream, length)
+    except UploadOffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.expected}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e), 'offset': session.received}), 400
+    except IOError as e:
+        db.session.rollback()
+        logger.warning(f"Chunk for upload {upload_id} interrupted: {str(e)}")
+        return jsonify({'error': str(e), 'offset': session.received}), 400
+
+    return jsonify({'upload_id': session.id, 'offset': received,
+                    'complete': received >= session.total_size})
+
+
+@upload_bp.route('/api/upload/<upload_id>', methods=['GET'])
+@login_required
+def get_upload_status(upload_id):
+    """Report the last acknowledged offset so a client can resume"""
+    session = _get_own_upload_session(upload_id)
+    return jsonify(session.to_dict())
+
+
+@upload_bp.route('/api/upload/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    """Abandon an upload and discard its staged bytes"""
+    session = _get_own_upload_session(upload_id)
+    get_upload_service().abort(session)
+    return jsonify({'success': True})
+
+
+@upload_bp.route('/api/upload/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    """Move the assembled upload into storage and create its File row"""
+    session = _get_own_upload_session(upload_id)
+    if session.received != session.total_size:
+        return jsonify({'error': 'Upload incomplete', 'offset': session.received}), 409
+
+    filepath = None
+    try:
+        # Space may have been used up since init; the staged bytes stay resumable
+        UsageService.check(current_user.id, session.total_size)
+        filename = session.filename
+        parent_folder_id = session.parent_folder_id
+        store = get_blob_store()
+        file_hash, file_size, filepath = get_upload_service().finalize(session, store)
+
+        # The assembled bytes are on disk already; only the head is read back
+        store.add_reference(file_hash, file_size)
+        mimetype = MimetypeService.for_blob(file_hash, filename, path=str(filepath))
+        UsageService.charge(current_user.id, parent_folder_id, file_size, enforce=True)
+
+        new_file = File(filename=filename, filepath=str(filepath),
+                        user_id=current_user.id,
+                        parent_folder_id=parent_folder_id,
+                        filesize=file_size,
+                        mimetype=mimetype,
+                        file_hash=file_hash)
+        db.session.add(new_file)
+        db.session.commit()
+        logger.info(f"Chunked upload finalized: {new_file.id} - {filename}")
+        SearchService.schedule_contents([(new_file.id, new_file.filepath, new_file.mimetype)])
+        RenditionService.schedule(new_file.filepath, new_file.mimetype, new_file.file_hash)
+
+        return jsonify({
+            'success': True,
+            'file': {
+                'id': new_file.id,
+                'name': new_file.filename,
+                'is_folder': False,
+                'size': file_size
+            }
+        })
+    except QuotaExceeded as e:
+        db.session.rollback()
+        if filepath is not None:
+            # Lost a race for the last free bytes after the staged file was consumed
+            UploadSession.query.filter_by(id=upload_id).delete()
+            db.session.commit()
+            get_blob_store().unlink([filepath])
+        return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+    except Exception as e:
+        db.session.rollback()
+        if filepath is not None:
+            # The staged file is gone, so the session cannot be finalized again
+            UploadSession.query.filter_by(id=upload_id).delete()
+            db.session.commit()
+            get_blob_store().unlink([filepath])
+        logger.error(f"Error finalizing upload {upload_id}: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+
+@upload_bp.route('/api/upload/bulk', methods=['POST'])
+@login_required
+def bulk_upload():
+    """Upload many files, or a whole folder hierarchy, in one request
+
+    The body is either multipart/form-data with one file part per file,
+    whose filename is its path below the destination, or a tar stream
+    (plain, gzip, bzip2 or xz). Parts and members stream straight into the
+    blob store, missing folders are created, and every row is inserted in
+    bulk in a single transaction. ?folder_id= picks the destination. The
+    response lists each entry in request order with its new id, or why it
+    was rejected.
+    """
+    parent_folder_id = None
+    folder_id = request.args.get('folder_id', type=int)
+    if folder_id:
+        parent = db.session.get(File, folder_id)
+        if not parent or not parent.is_folder or parent.user_id != current_user.id:
+            return jsonify({'error': 'Invalid destination folder'}), 400
+        parent_folder_id = parent.id
+
+    usage = UsageService.usage(current_user.id)
+    try:
+        UsageService.check(current_user.id, (request.content_length or 0) - MULTIPART_OVERHEAD)
+        if usage['available'] == 0:
+            raise QuotaExceeded(usage['used'], usage['quota'], request.content_length or 0)
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+
+    # A compressed tar may expand far beyond its body; cap what it may write
+    config = current_app.config
+    max_bytes = config['BULK_UPLOAD_MAX_BYTES']
+    if usage['available'] is not None:
+        max_bytes = min(max_bytes, usage['available']) if max_bytes else usage['available']
+    budget = ExtractionBudget(config['BULK_UPLOAD_MAX_FILES'], max_bytes)
+    request.max_content_length = config['BULK_UPLOAD_MAX_BYTES']
+
+    store = get_blob_store()
+    try:
+        if request.mimetype == 'multipart/form-data':
+            boundary = request.mimetype_params.get('boundary')
+            if not boundary:
+                return jsonify({'error': 'Missing multipart boundary'}), 400
+            entries, manifest = UploadService.ingest_multipart(request.stream, boundary.encode('latin-1'), store,
+                                                               budget, ALLOWED_EXTENSIONS)
+        elif request.mimetype in TAR_CONTENT_TYPES:
+            entries, manifest = UploadService.ingest_tar(request.stream, store, budget, ALLOWED_EXTENSIONS)
+        else:
+            return jsonify({'error': 'Send multipart/form-data or a tar stream'}), 415
+    except ExtractionBudgetExceeded as e:
+        return jsonify({'error': str(e), 'used': usage['used'], 'quota': usage['quota']}), 413
+    except (ValueError, EOFError, tarfile.TarError) as e:
+        logger.warning(f"Rejected malformed bulk upload: {str(e)}")
+        return jsonify({'error': f'Malformed upload: {str(e)}'}), 400
+
+    files = [entry for entry in entries if not entry['is_folder']]
+    try:
+        new_ids = TreeService.register_tree(entries, parent_folder_id, current_user.id, store, None)
+        db.session.commit()
+    except QuotaExceeded as e:
+        db.session.rollback()
+        store.unlink(entry['filepath'] for entry in files)
+        return jsonify({'error': str(e), 'used': e.used, 'quota': e.quota}), 413
+    except Exception as e:
+        db.session.rollback()
+        store.unlink(entry['filepath'] for entry in files)
+        logger.error(f"Error registering bulk upload: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+    SearchService.schedule_contents((new_ids[entry['path']], entry['filepath'], entry['mimetype'])
+                                    for entry in files)
+    for entry in files:
+        RenditionService.schedule(entry['filepath'], entry['mimetype'], entry['file_hash'])
+
+    by_path = {entry['path']: entry for entry in entries}
+    for record in manifest:
+        if record['status'] == 'stored':
+            entry = by_path[record['path']]
+            record.update(id=new_ids[record['path']], is_folder=entry['is_folder'],
+                          size=entry.get('filesize', 0), mimetype=entry.get('mimetype'))
+    logger.info(f"Bulk upload: {len(files)} files, {len(new_ids) - 1 - len(files)} folders "
+                f"into folder {parent_folder_id}")
+    return jsonify({'success': True, 'folder_id': parent_folder_id, 'created': len(new_ids) - 1,
+                    'entries': manifest})
@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify, abort, request
+from flask_login import login_required, current_user
+try:
+    from backend.models.database import db, File
+    from backend.services.usage_service import UsageService
+except ImportError:
+    from models.database import db, File
+    from services.usage_service import UsageService
+
+usage_bp = Blueprint('usage_bp', __name__)
+
+@usage_bp.route('/api/usage')
+@login_required
+def get_usage():
+    """Bytes used, quota and space left; ``?folder_id=N`` adds that folder's size
+
+    Both numbers are maintained counters, so this never scans the user's files.
+    """
+    usage = UsageService.usage(current_user.id)
+    folder_id = request.args.get('folder_id', type=int)
+    if folder_id is not None:
+        folder = db.session.get(File, folder_id)
+        if folder is None or not folder.is_folder:
+            abort(404, description="Folder not found")
+        if folder.user_id != current_user.id:
+            abort(403, description="You don't have permission to access this folder")
+        usage['folder'] = {'id': folder.id, 'size': folder.tree_size or 0}
+    return jsonify(usage)
@@ -1,13 +1,19 @@
 from flask import Flask, jsonify
 from flask_login import LoginManager
-from flask_compress import Compress
 try:
-    from backend.models.database import db, User, bcrypt
+    from backend.models.database import db, bcrypt
     from backend.config import Config
+    from backend.services.search_service import SearchService
+    from backend.services.response_compression_service import ResponseCompressionService
+    from backend.services.principal_cache_service import PrincipalCacheService
 except ImportError:
-    from models.database import db, User, bcrypt
+    from models.database import db, bcrypt
     from config import Config
+    from services.search_service import SearchService
+    from services.response_compression_service import ResponseCompressionService
+    from services.principal_cache_service import PrincipalCacheService
 from pathlib import Path
+import click
 import logging
 
 # Initialize Flask app
@@ -21,8 +27,8 @@ app.config['UPLOAD_FOLDER'] = Path(__file__).parent / app.config['UPLOAD_FOLDER'
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# Initialize compression for faster downloads
-Compress(app)
+# Compress textual responses only; media, archives and partial responses pass through
+ResponseCompressionService.init_app(app)
 
 # Initialize extensions
 db.init_app(app)
@@ -34,7 +40,8 @@ login_manager.login_view = 'auth_bp.login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # A cached principal, not the User row: no query on a warm cache
+    return PrincipalCacheService.get(int(user_id))
 
 # Template filters
 @app.template_filter('format_filesize')
@@ -72,6 +79,7 @@ def internal_error(error):
 
 def init_db():
     db.create_all()
+    SearchService.create_index()
 
 @app.cli.command('init-db')
 def init_db_command():
@@ -79,6 +87,40 @@ def init_db_command():
     init_db()
     print('Initialized the database.')
 
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """Adds missing columns and indexes and backfills derived data."""
+    try:
+        from backend.utils.migrate_schema import migrate_schema
+    except ImportError:
+        from utils.migrate_schema import migrate_schema
+    result = migrate_schema()
+    print(result)
+    if not result['success']:
+        # Fail the deploy step rather than start on a half-migrated schema
+        raise click.ClickException(result['error'])
+
+@app.cli.command('backfill')
+@click.argument('task', type=click.Choice(['mimetype', 'hash', 'size']))
+@click.option('--workers', type=int, default=None, help='Processes for per-file work (default: one per core).')
+@click.option('--batch-size', type=int, default=1000, help='Rows per page and per commit.')
+@click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start from the first row.')
+@click.option('--all', 'all_rows', is_flag=True, help='mimetype: re-sniff files that already have a type.')
+def backfill_command(task, workers, batch_size, restart, all_rows):
+    """Fills in mimetype, content hash or size of existing files."""
+    try:
+        from backend.utils.backfill import run_backfill
+    except ImportError:
+        from utils.backfill import run_backfill
+    print(run_backfill(task, workers=workers, batch_size=batch_size, restart=restart, all_rows=all_rows))
+
+@app.cli.command('reindex-search')
+@click.option('--content', is_flag=True, help='Also re-extract text from uploaded documents.')
+def reindex_search_command(content):
+    """Rebuilds the full-text search index."""
+    SearchService.create_index()
+    print(f'Indexed {SearchService.rebuild(with_content=content)} files.')
+
 try:
     from backend.api.auth import auth_bp
     from backend.api.files import files_bp
@@ -86,6 +128,11 @@ try:
     from backend.api.search import search_bp
     from backend.api.upload import upload_bp
     from backend.api.compression import compression_bp
+    from backend.api.jobs import jobs_bp
+    from backend.api.thumbnails import thumbnails_bp
+    from backend.api.usage import usage_bp
+    from backend.api.batch import batch_bp
+    from backend.api.tags import tags_bp
 except ImportError:
     from api.auth import auth_bp
     from api.files import files_bp
@@ -93,6 +140,11 @@ except ImportError:
     from api.search import search_bp
     from api.upload import upload_bp
     from api.compression import compression_bp
+    from api.jobs import jobs_bp
+    from api.thumbnails import thumbnails_bp
+    from api.usage import usage_bp
+    from api.batch import batch_bp
+    from api.tags import tags_bp
 
 app.register_blueprint(files_bp)
 app.register_blueprint(folders_bp)
@@ -100,15 +152,43 @@ app.register_blueprint(search_bp)
 app.register_blueprint(upload_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(compression_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(thumbnails_bp)
+app.register_blueprint(usage_bp)
+app.register_blueprint(batch_bp)
+app.register_blueprint(tags_bp)
 
-import threading
 try:
-    from backend.services.watcher_service import start_watching
+    from backend.services.watcher_service import WatcherService, start_watching
+    from backend.services.reconcile_service import ReconcileService
+    from backend.services.usage_service import UsageService
 except ImportError:
-    from services.watcher_service import start_watching
+    from services.watcher_service import WatcherService, start_watching
+    from services.reconcile_service import ReconcileService
+    from services.usage_service import UsageService
+
+@app.cli.command('watch')
+def watch_command():
+    """Keeps the database in sync with changes under UPLOAD_FOLDER."""
+    start_watching(app)
+
+@app.cli.command('reconcile')
+@click.option('--fix-orphans', is_flag=True, help='Delete unreferenced blobs and recompute blob refcounts.')
+@click.option('--verify-hashes', is_flag=True, help='Re-hash every blob instead of only size mismatches.')
+def reconcile_command(fix_orphans, verify_hashes):
+    """Compares UPLOAD_FOLDER with the database and repairs drift."""
+    print(ReconcileService.full_rescan(fix_orphans=fix_orphans, verify_hashes=verify_hashes).to_dict())
+
+@app.cli.command('reconcile-usage')
+@click.option('--user', 'user_ids', type=int, multiple=True, help='Only recompute these users (repeatable).')
+def reconcile_usage_command(user_ids):
+    """Recomputes storage usage counters and fixes any drift."""
+    print(UsageService.reconcile(user_ids or None))
+
+# One process per host wins the watcher lock; the others skip
+if app.config['WATCHER_ENABLED']:
+    WatcherService.start(app)
 
 if __name__ == '__main__':
-    watch_thread = threading.Thread(target=start_watching, args=(app.config['UPLOAD_FOLDER'],))
-    watch_thread.daemon = True
-    watch_thread.start()
+    WatcherService.start(app)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,334 @@
+"""
+ASGI entry point: the Flask app behind an asyncio front end.
+
+Under gunicorn's sync workers a client holds a whole worker for as long as
+its request body trickles in or its download drains, so a few hundred slow
+mobile connections exhaust any reasonable worker count. Here the event loop
+owns every socket instead:
+
+- request bodies are received asynchronously and spooled (in memory, then
+  to UPLOAD_FOLDER/.staging with aiofiles) before Flask sees the request;
+- the Flask app runs unchanged on a small thread pool, so routing, the
+  session cookie, flask-login and every view behave exactly as under WSGI,
+  but a thread is only busy while the view computes, not while bytes move;
+- file bodies (``wsgi.file_wrapper``, which ServingService and the
+  precompressed variants use) are read with aiofiles and sent from the
+  loop; other streamed bodies are advanced one chunk per pool task, all
+  inside the one context the view ran in, so ``stream_with_context``
+  generators still find their request and app contexts.
+
+Usage:
+    WEB_CONCURRENCY=4 uvicorn backend.asgi:app
+    WEB_CONCURRENCY=4 gunicorn -k uvicorn.workers.UvicornWorker backend.asgi:app
+
+    Compare against the sync setup with benchmarks/serving_benchmark.py.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+import contextvars
+import io
+import logging
+import os
+import sys
+import tempfile
+
+import aiofiles
+import aiofiles.os
+
+try:
+    from backend.app import app as flask_app
+except ImportError:
+    from app import app as flask_app
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _FileBody:
+    """``wsgi.file_wrapper`` whose bytes the event loop reads with aiofiles
+
+    Iterating it directly still works, for middleware that consumes the
+    body itself.
+    """
+
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            data = self.filelike.read(self.block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        close = getattr(self.filelike, 'close', None)
+        if close is not None:
+            close()
+
+
+class _RequestTooLarge(Exception):
+    pass
+
+
+class _ClientGone(Exception):
+    pass
+
+
+class AsyncFlaskApp:
+    """ASGI application that serves a WSGI app without tying threads to slow clients"""
+
+    def __init__(self, wsgi_app, threads, spool_memory, max_body, spool_dir):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='flask')
+        self.spool_memory = spool_memory
+        self.max_body = max_body
+        self.spool_dir = Path(spool_dir)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            # No websocket endpoints
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1000})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        try:
+            body, length = await self._receive_body(scope, receive)
+        except _RequestTooLarge:
+            await self._send_plain(send, 413, b'Request Entity Too Large')
+            return
+        except _ClientGone:
+            return
+
+        loop = asyncio.get_running_loop()
+        # Flask keeps its request and app contexts in context variables; the
+        # view, every later chunk and close() run in this one copy, in turn
+        ctx = contextvars.copy_context()
+        try:
+            environ = self._environ(scope, body, length)
+            try:
+                status, headers, iterable, first = await loop.run_in_executor(
+                    self.executor, ctx.run, self._run, environ)
+            except Exception as e:
+                logger.error(f"Unhandled error in {scope['method']} {scope['path']}: {str(e)}", exc_info=True)
+                await self._send_plain(send, 500, b'Internal Server Error')
+                return
+        finally:
+            body.close()
+
+        # The body is consumed, so the next message can only be the disconnect
+        gone = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, gone))
+        try:
+            await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in headers]})
+            for chunk in first:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if isinstance(iterable, _FileBody):
+                await self._send_file(iterable, send, gone)
+            else:
+                await self._send_iterable(iterable, send, gone, ctx)
+            if not gone.is_set():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            # The client went away mid-response
+            pass
+        finally:
+            watcher.cancel()
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, ctx.run, close)
+
+    async def _receive_body(self, scope, receive):
+        """Read the whole request body without blocking a thread; returns (file, length)"""
+        declared = None
+        for name, value in scope['headers']:
+            if name == b'content-length':
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = None
+        if self.max_body and declared is not None and declared > self.max_body:
+            raise _RequestTooLarge()
+
+        buffer = io.BytesIO()
+        spool = spool_path = None
+        length = 0
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise _ClientGone()
+                data = message.get('body', b'')
+                if data:
+                    length += len(data)
+                    if self.max_body and length > self.max_body:
+                        raise _RequestTooLarge()
+                    if spool is None and length > self.spool_memory:
+                        # Large bodies go to disk next to the upload staging files
+                        self.spool_dir.mkdir(parents=True, exist_ok=True)
+                        fd, spool_path = tempfile.mkstemp(dir=self.spool_dir, prefix='asgi-')
+                        os.close(fd)
+                        spool = await aiofiles.open(spool_path, 'wb')
+                        await spool.write(buffer.getvalue())
+                        buffer = None
+                    if spool is not None:
+                        await spool.write(data)
+                    else:
+                        buffer.write(data)
+                if not message.get('more_body', False):
+                    break
+        except BaseException:
+            if spool is not None:
+                await spool.close()
+                await aiofiles.os.remove(spool_path)
+            raise
+
+        if spool is None:
+            buffer.seek(0)
+            return buffer, length
+        await spool.close()
+        body = open(spool_path, 'rb')
+        # The open handle keeps the data; nothing is left behind if the worker dies
+        await aiofiles.os.remove(spool_path)
+        return body, length
+
+    @staticmethod
+    def _environ(scope, body, length):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': _FileBody,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+        if length or scope['method'] not in ('GET', 'HEAD'):
+            # Chunked bodies were de-chunked while spooling
+            environ['CONTENT_LENGTH'] = str(length)
+        return environ
+
+    def _run(self, environ):
+        """Call the WSGI app (in a pool thread) up to the point where the status is known"""
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+            def write(data):
+                raise NotImplementedError("The WSGI write() callable is not supported")
+            return write
+
+        iterable = self.wsgi_app(environ, start_response)
+        first = []
+        if not response:
+            # Lazy apps call start_response on the first iteration
+            try:
+                iterator = iter(iterable)
+                while not response:
+                    first.append(next(iterator))
+            except StopIteration:
+                pass
+            iterable = _Resumed(iterator, iterable)
+        return response[0], response[1], iterable, first
+
+    @staticmethod
+    async def _watch_disconnect(receive, gone):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        gone.set()
+
+    async def _send_file(self, body, send, gone):
+        read = aiofiles.os.wrap(body.filelike.read)
+        while not gone.is_set():
+            data = await read(body.block_size)
+            if not data:
+                return
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    async def _send_iterable(self, iterable, send, gone, ctx):
+        loop = asyncio.get_running_loop()
+        iterator = iter(iterable)
+        while not gone.is_set():
+            chunk = await loop.run_in_executor(self.executor, ctx.run, next, iterator, _END)
+            if chunk is _END:
+                return
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    @staticmethod
+    async def _send_plain(send, status, body):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class _Resumed:
+    """The rest of a WSGI iterable whose first chunks were already consumed"""
+
+    def __init__(self, iterator, original):
+        self._iterator = iterator
+        self._original = original
+
+    def __iter__(self):
+        return self._iterator
+
+    def close(self):
+        close = getattr(self._original, 'close', None)
+        if close is not None:
+            close()
+
+
+app = AsyncFlaskApp(
+    flask_app,
+    threads=flask_app.config['ASGI_THREADS'],
+    spool_memory=flask_app.config['ASGI_SPOOL_MEMORY'],
+    # The largest body any endpoint accepts; Flask applies each endpoint's own limit
+    max_body=flask_app.config.get('MAX_CONTENT_LENGTH') and max(flask_app.config['MAX_CONTENT_LENGTH'],
+                                                                flask_app.config['BULK_UPLOAD_MAX_BYTES']),
+    spool_dir=Path(flask_app.config['UPLOAD_FOLDER']) / '.staging'
+)
@@ -0,0 +1,110 @@
+"""
+Benchmark serial vs parallel archive creation in CompressionService.
+
+Builds synthetic workloads across file counts and sizes, archives each one
+serially and in parallel mode, verifies the parallel archive lists the same
+members, and prints wall time, throughput and speedup.
+
+Usage:
+    python -m backend.benchmarks.compression_benchmark
+    python -m backend.benchmarks.compression_benchmark --workers 16 --formats zip tar.gz --scale 4
+"""
+
+from pathlib import Path
+import argparse
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+
+try:
+    from backend.services.compression_service import CompressionService
+except ImportError:
+    from services.compression_service import CompressionService
+
+# (file count, bytes per file) at scale 1
+WORKLOADS = [
+    (1, 64 * 1024 * 1024),
+    (16, 8 * 1024 * 1024),
+    (256, 512 * 1024),
+    (2000, 16 * 1024),
+]
+
+WORDS = [b'alpha', b'beta', b'gamma', b'delta', b'file', b'flow', b'folder', b'upload',
+         b'archive', b'report', b'2024', b'user', b'total', b'value', b'\n', b',', b' ']
+
+
+def make_workload(directory, count, size, seed=0):
+    """Write `count` text-like files that compress roughly like real documents"""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        path = Path(directory) / f"file_{i:05d}.txt"
+        with open(path, 'wb') as f:
+            written = 0
+            while written < size:
+                chunk = b' '.join(rng.choice(WORDS) for _ in range(4096))[:size - written]
+                f.write(chunk)
+                written += len(chunk)
+        entries.append((str(path), path.name))
+    return entries
+
+
+def member_names(archive_path, format_type):
+    if format_type == 'zip':
+        with zipfile.ZipFile(archive_path) as zf:
+            return zf.namelist()
+    with tarfile.open(archive_path, 'r:*') as tf:
+        return tf.getnames()
+
+
+def time_create(entries, archive_path, format_type, workers):
+    start = time.perf_counter()
+    CompressionService.create_archive(entries, archive_path, format_type, workers=workers)
+    return time.perf_counter() - start
+
+
+def run(formats, workers, scale):
+    work_dir = Path(tempfile.mkdtemp(prefix='fileflow-bench-'))
+    print(f"workers={workers} cpus={os.cpu_count()} scale={scale}")
+    print(f"{'format':<8} {'files':>6} {'size':>10} {'serial s':>9} {'parallel s':>10} "
+          f"{'MB/s ser':>9} {'MB/s par':>9} {'speedup':>8} {'ratio':>6}")
+    try:
+        for count, size in WORKLOADS:
+            size = int(size * scale)
+            source_dir = work_dir / f"src_{count}_{size}"
+            source_dir.mkdir()
+            entries = make_workload(source_dir, count, size)
+            total_mb = count * size / (1024 * 1024)
+
+            for format_type in formats:
+                serial_path = work_dir / f"serial.{format_type}"
+                parallel_path = work_dir / f"parallel.{format_type}"
+                serial = time_create(entries, str(serial_path), format_type, None)
+                parallel = time_create(entries, str(parallel_path), format_type, workers)
+
+                if member_names(parallel_path, format_type) != member_names(serial_path, format_type):
+                    raise RuntimeError(f"Parallel {format_type} archive members differ from serial")
+
+                ratio = parallel_path.stat().st_size / max(serial_path.stat().st_size, 1)
+                print(f"{format_type:<8} {count:>6} {size:>10} {serial:>9.2f} {parallel:>10.2f} "
+                      f"{total_mb / serial:>9.1f} {total_mb / parallel:>9.1f} "
+                      f"{serial / parallel:>7.2f}x {ratio:>6.3f}")
+                serial_path.unlink()
+                parallel_path.unlink()
+
+            shutil.rmtree(source_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--formats', nargs='+', default=['zip', 'tar.gz', 'tar.xz'])
+    parser.add_argument('--workers', type=int, default=max(os.cpu_count() or 1, 2))
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every file size by this factor')
+    args = parser.parse_args()
+    run(args.formats, args.workers, args.scale)
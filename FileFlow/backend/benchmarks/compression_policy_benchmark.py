@@ -0,0 +1,168 @@
+"""
+Benchmark blanket flask-compress against the mimetype-aware compression policy.
+
+Serves a mixed workload (text and CSV downloads, JSON listings, JPEG, MP4
+and ZIP downloads) through a Flask test app twice: once with
+flask-compress and send_file as the app used to, once with
+ResponseCompressionService and ServingService, first compressing text
+on the fly and then serving the stored brotli/gzip variants. Prints CPU
+seconds per GB of payload served and bytes sent on the wire.
+
+Usage:
+    python -m backend.benchmarks.compression_policy_benchmark
+    python -m backend.benchmarks.compression_policy_benchmark --scale 4 --rounds 5 --encoding gzip
+"""
+
+from flask import Flask, jsonify, send_file
+from pathlib import Path
+import argparse
+import os
+import random
+import tempfile
+import time
+
+try:
+    from backend.services.response_compression_service import ResponseCompressionService
+    from backend.services.serving_service import ServingService
+except ImportError:
+    from services.response_compression_service import ResponseCompressionService
+    from services.serving_service import ServingService
+
+# (name, mimetype, bytes at scale 1, text-like content)
+WORKLOAD = [
+    ('server.log', 'text/plain', 8 * 1024 * 1024, True),
+    ('report.csv', 'text/csv', 4 * 1024 * 1024, True),
+    ('photo.jpg', 'image/jpeg', 6 * 1024 * 1024, False),
+    ('clip.mp4', 'video/mp4', 32 * 1024 * 1024, False),
+    ('backup.zip', 'application/zip', 16 * 1024 * 1024, False),
+]
+
+LISTING_ROWS = 2000
+
+WORDS = [b'alpha', b'beta', b'gamma', b'delta', b'file', b'flow', b'folder', b'upload',
+         b'archive', b'report', b'2024', b'user', b'total', b'value', b'\n', b',', b' ']
+
+
+def make_workload(directory, scale, seed=0):
+    rng = random.Random(seed)
+    files = {}
+    for name, mimetype, size, text in WORKLOAD:
+        size = int(size * scale)
+        path = Path(directory) / name
+        with open(path, 'wb') as f:
+            written = 0
+            while written < size:
+                if text:
+                    chunk = b' '.join(rng.choice(WORDS) for _ in range(4096))[:size - written]
+                else:
+                    # Media and archives are already compressed: incompressible bytes
+                    chunk = os.urandom(min(1024 * 1024, size - written))
+                f.write(chunk)
+                written += len(chunk)
+        files[name] = (path, mimetype)
+    return files
+
+
+def listing_rows():
+    return [{'id': i, 'name': f'file_{i:05d}.txt', 'is_folder': False, 'parent_folder_id': None,
+             'size': i * 37, 'mimetype': 'text/plain', 'created_at': '2024-01-01T00:00:00',
+             'tags': ['report', 'draft']} for i in range(LISTING_ROWS)]
+
+
+def build_app(files, upload_folder, policy, precompress_after=0):
+    app = Flask(__name__)
+    app.config.update(UPLOAD_FOLDER=str(upload_folder), COMPRESS_MIN_SIZE=1024,
+                      COMPRESS_MAX_FILE_SIZE=256 * 1024 * 1024, PRECOMPRESS_AFTER_HITS=precompress_after,
+                      PRECOMPRESS_CACHE_BYTES=1024 * 1024 * 1024,
+                      COMPRESS_JSON_CACHE_BYTES=32 * 1024 * 1024)
+    rows = listing_rows()
+
+    if policy:
+        ResponseCompressionService.init_app(app)
+    else:
+        from flask_compress import Compress
+        Compress(app)
+
+    @app.route('/files/<name>')
+    def download(name):
+        path, mimetype = files[name]
+        if policy:
+            return ServingService.send(path, mimetype)
+        return send_file(path, mimetype=mimetype)
+
+    @app.route('/api/files')
+    def listing():
+        return jsonify(rows)
+
+    return app
+
+
+def run(app, files, rounds, encoding):
+    """Serve the whole workload `rounds` times; returns (cpu seconds, payload bytes, wire bytes)"""
+    client = app.test_client()
+    urls = [f'/files/{name}' for name in files] + ['/api/files'] * 20
+    payload = wire = 0
+    cpu = 0.0
+    for _ in range(rounds):
+        for url in urls:
+            start = time.process_time()
+            response = client.get(url, headers={'Accept-Encoding': encoding})
+            body = b''.join(response.iter_encoded())
+            response.close()
+            cpu += time.process_time() - start
+            wire += len(body)
+        payload += sum(path.stat().st_size for path, _ in files.values())
+        payload += 20 * len(client.get('/api/files', headers={'Accept-Encoding': 'identity'}).data)
+    return cpu, payload, wire
+
+
+def wait_for_variants(upload_folder, expected, timeout=120):
+    deadline = time.time() + timeout
+    variant_dir = Path(upload_folder) / '.variants'
+    while time.time() < deadline:
+        stored = [p for p in variant_dir.glob('*/*') if p.suffix != '.tmp'] if variant_dir.exists() else []
+        if len(stored) >= expected:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def report(label, cpu, payload, wire):
+    gb = payload / (1024 ** 3)
+    print(f"{label:<28} {cpu / gb:>10.2f} {wire / (1024 * 1024):>12.1f} {wire / payload:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply workload file sizes')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--encoding', default='br, gzip', help='Accept-Encoding sent by the client')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / 'files').mkdir()
+        files = make_workload(Path(tmp) / 'files', args.scale)
+        upload_folder = Path(tmp) / 'uploads'
+        upload_folder.mkdir()
+
+        print(f"{'configuration':<28} {'cpu s/GB':>10} {'wire MB':>12} {'ratio':>8}")
+        try:
+            report('flask-compress (before)', *run(build_app(files, upload_folder, False), files,
+                                                   args.rounds, args.encoding))
+        except ImportError:
+            print(f"{'flask-compress (before)':<28} {'skipped: flask-compress not installed':>32}")
+
+        report('policy, on the fly', *run(build_app(files, upload_folder, True), files,
+                                          args.rounds, args.encoding))
+
+        # Variants are built by a background thread; build them outside the measured runs
+        app = build_app(files, upload_folder, True, precompress_after=1)
+        run(app, files, 1, args.encoding)
+        text_files = sum(1 for _, mimetype in files.values() if ResponseCompressionService.is_text(mimetype))
+        if not wait_for_variants(upload_folder, 2 * text_files):
+            print("Stored variants were not built in time; numbers include on-the-fly compression")
+        report('policy, stored variants', *run(app, files, args.rounds, args.encoding))
+
+
+if __name__ == '__main__':
+    main()
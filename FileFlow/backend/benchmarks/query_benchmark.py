@@ -0,0 +1,206 @@
+"""
+Benchmark the File table's hot queries with and without the composite indexes.
+
+Seeds a synthetic SQLite database (millions of rows spread over many users
+and folders), then times /api/files, /api/search and the dashboard through
+the Flask test client: first without the composite indexes, then with them.
+The query plan of the SQL each endpoint issues is printed for both runs.
+
+Usage:
+    python -m backend.benchmarks.query_benchmark
+    python -m backend.benchmarks.query_benchmark --rows 5000000 --users 2000 --requests 100
+    python -m backend.benchmarks.query_benchmark --db /tmp/fileflow-bench.db --reuse
+"""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import event
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# (user_id, parent_folder_id, is_folder desc, filename), (user_id, mimetype), ...
+BENCH_INDEXES = ('ix_file_user_parent_listing', 'ix_file_user_mimetype',
+                 'ix_file_user_filesize', 'ix_file_user_created_at')
+
+MIMETYPES = ['image/jpeg', 'image/png', 'application/pdf', 'text/plain', 'text/csv',
+             'video/mp4', 'audio/mpeg', 'application/zip', 'application/json']
+
+FOLDERS_PER_USER = 20
+BATCH_SIZE = 20000
+TARGET_USER = 1
+
+
+def load_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    try:
+        from backend.app import app
+        from backend.models.database import db, User, File
+    except ImportError:
+        from app import app
+        from models.database import db, User, File
+    logging.getLogger().setLevel(logging.WARNING)
+    return app, db, User, File
+
+
+def seed(db, User, File, rows, users, seed_value=0):
+    """Insert `rows` File rows for `users` users with Core executemany"""
+    rng = random.Random(seed_value)
+    file_table = File.__table__
+    start = datetime(2022, 1, 1)
+
+    user = User(id=TARGET_USER, username='bench', email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.execute(User.__table__.insert(), [
+        {'id': uid, 'username': f'user{uid}', 'email': f'user{uid}@example.com', 'password': 'x'}
+        for uid in range(2, users + 1)
+    ])
+
+    per_user = max(rows // users, FOLDERS_PER_USER + 1)
+    next_id = 1
+    batch = []
+    written = 0
+    began = time.perf_counter()
+    for uid in range(1, users + 1):
+        folder_ids = []
+        for i in range(FOLDERS_PER_USER):
+            # Two levels: the first quarter are top-level, the rest nest under them
+            parent = folder_ids[i % (FOLDERS_PER_USER // 4)] if i >= FOLDERS_PER_USER // 4 else None
+            parent_path = parent[1] if parent else '/'
+            path = f"{parent_path}{next_id}/"
+            batch.append({'id': next_id, 'filename': f'folder {i:02d}', 'filepath': '', 'user_id': uid,
+                          'is_folder': True, 'parent_folder_id': parent[0] if parent else None,
+                          'path': path, 'created_at': start, 'modified_at': start, 'filesize': 0})
+            folder_ids.append((next_id, path))
+            next_id += 1
+        for i in range(per_user - FOLDERS_PER_USER):
+            parent = rng.choice(folder_ids + [None])
+            mimetype = rng.choice(MIMETYPES)
+            created = start + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+            batch.append({'id': next_id, 'filename': f'file {i:06d}.{mimetype.split("/")[1]}', 'filepath': '',
+                          'user_id': uid, 'is_folder': False,
+                          'parent_folder_id': parent[0] if parent else None,
+                          'path': f"{parent[1] if parent else '/'}{next_id}/",
+                          'created_at': created, 'modified_at': created,
+                          'filesize': int(rng.lognormvariate(11, 2)), 'mimetype': mimetype})
+            next_id += 1
+            if len(batch) >= BATCH_SIZE:
+                db.session.execute(file_table.insert(), batch)
+                written += len(batch)
+                batch = []
+        if uid % max(users // 10, 1) == 0:
+            rate = written / max(time.perf_counter() - began, 1e-9)
+            print(f"  seeded {written:,} rows ({rate:,.0f} rows/s)")
+    if batch:
+        db.session.execute(file_table.insert(), batch)
+        written += len(batch)
+    db.session.commit()
+    return written
+
+
+def set_indexes(db, File, enabled):
+    existing = {row[0] for row in db.session.execute(
+        db.text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    for index in File.__table__.indexes:
+        if index.name not in BENCH_INDEXES:
+            continue
+        if enabled and index.name not in existing:
+            index.create(db.engine)
+        elif not enabled and index.name in existing:
+            index.drop(db.engine)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+
+
+def capture_statements(engine):
+    """Record the SELECTs against the file table issued while a request runs"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM file' in statement:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return captured, lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def time_requests(issue, count):
+    samples = []
+    for _ in range(count):
+        began = time.perf_counter()
+        response = issue()
+        # Listings stream their body; the queries run while it is consumed
+        response.get_data()
+        samples.append((time.perf_counter() - began) * 1000)
+        assert response.status_code == 200, response.status_code
+    samples.sort()
+    return statistics.median(samples), samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+
+def run(rows, users, requests, db_path, reuse):
+    app, db, User, File = load_app(db_path)
+    with app.app_context():
+        if not reuse or not User.query.get(TARGET_USER):
+            db.drop_all()
+            db.create_all()
+            set_indexes(db, File, False)
+            print(f"Seeding {rows:,} rows for {users:,} users into {db_path}")
+            seed(db, User, File, rows, users)
+        total = File.query.count()
+        folder = File.query.filter_by(user_id=TARGET_USER, is_folder=True, parent_folder_id=None).first()
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        search_body = {'file_types': ['image'], 'size_min': 1024, 'size_max': 10 * 1024 * 1024,
+                       'date_from': '2023-01-01T00:00:00', 'date_to': '2023-06-30T00:00:00'}
+        endpoints = [
+            ('/api/files', lambda: client.get(f'/api/files?folder_id={folder.id}')),
+            ('/api/search', lambda: client.post('/api/search', json=search_body)),
+            ('/dashboard', lambda: client.get(f'/dashboard/{folder.id}')),
+        ]
+
+        print(f"rows={total:,} users={users:,} requests={requests}")
+        results = {}
+        for phase, enabled in (('before', False), ('after', True)):
+            set_indexes(db, File, enabled)
+            print(f"\n== {phase} ({'with' if enabled else 'without'} composite indexes)")
+            for name, issue in endpoints:
+                captured, stop = capture_statements(db.engine)
+                issue().get_data()
+                stop()
+                p50, p95 = time_requests(issue, requests)
+                results[(name, phase)] = p50
+                print(f"{name:<12} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+                for statement, parameters in captured:
+                    with db.engine.connect() as conn:
+                        plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                    for row in plan:
+                        print(f"    plan: {row[-1]}")
+
+        print("\nendpoint       before ms   after ms   speedup")
+        for name, _ in endpoints:
+            before, after = results[(name, 'before')], results[(name, 'after')]
+            print(f"{name:<12} {before:10.2f} {after:10.2f} {before / max(after, 1e-9):8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000, help='total File rows to seed')
+    parser.add_argument('--users', type=int, default=1000, help='users to spread the rows over')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per endpoint and phase')
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--reuse', action='store_true', help='reuse an already seeded --db')
+    args = parser.parse_args()
+
+    db_path = Path(args.db) if args.db else Path(tempfile.mkdtemp(prefix='fileflow-bench-')) / 'bench.db'
+    run(args.rows, args.users, args.requests, db_path.resolve(), args.reuse)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark slow-client capacity: gunicorn sync workers vs the ASGI front end.
+
+Seeds a database with one user and one large file, then starts the app
+twice: with gunicorn's sync workers (backend.app:app) and with an ASGI
+worker (backend.asgi:app), each with the same number of processes. For
+every client count, that many slow clients hold connections open for a
+while (downloads read a few KB/s; uploads trickle their body) and a probe
+issues quick requests alongside them. Reported per run:
+
+- served: slow downloads that got their response headers during the hold
+  (uploads are never complete, so this stays 0 for them);
+- probe p50/max and timeouts: how a fast client fares next to the slow ones.
+
+Usage:
+    python -m backend.benchmarks.serving_benchmark
+    python -m backend.benchmarks.serving_benchmark --workers 4 --clients 50 200 1000 --hold 15
+    python -m backend.benchmarks.serving_benchmark --asgi-worker asgi  # gunicorn's own ASGI worker
+"""
+
+from io import BytesIO
+from pathlib import Path
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Bytes per second a slow client reads or sends
+SLOW_RATE = 4 * 1024
+PROBE_PATH = '/api/usage'
+
+
+def seed(work_dir, file_size):
+    """Create the benchmark user and upload one file; returns its id"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{work_dir / "bench.db"}'
+    os.environ['UPLOAD_FOLDER'] = str(work_dir / 'files')
+    try:
+        from backend.app import app
+        from backend.models.database import db, User
+    except ImportError:
+        from app import app
+        from models.database import db, User
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        response = client.post('/upload', data={'file': (BytesIO(os.urandom(file_size)), 'large.mp4')},
+                               headers={'Accept': 'application/json'})
+        return response.json['file']['id']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, worker_class, workers, port, env):
+    target = 'backend.app:app' if kind == 'sync' else 'backend.asgi:app'
+    command = [sys.executable, '-m', 'gunicorn', '-k', worker_class,
+               '-b', f'127.0.0.1:{port}', '--timeout', '300', '--log-level', 'warning', target]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env={**env, 'WEB_CONCURRENCY': str(workers)})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def request(port, raw, timeout):
+    """Send one raw request and read the whole response; returns the status code"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(raw)
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+        length = 0
+        for line in head.split(b'\r\n'):
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':', 1)[1])
+        if length:
+            await asyncio.wait_for(reader.readexactly(length), timeout)
+        return int(head.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def login(port):
+    body = b'username=bench&password=bench'
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'POST /login HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n'
+                 b'Content-Type: application/x-www-form-urlencoded\r\n'
+                 b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+    head = await reader.readuntil(b'\r\n\r\n')
+    writer.close()
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'set-cookie:') and b'session=' in line:
+            return line.split(b':', 1)[1].split(b';', 1)[0].strip()
+    raise RuntimeError("Login failed")
+
+
+async def slow_download(port, cookie, file_id, hold, served):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    try:
+        writer.write(b'GET /download_file/%d HTTP/1.1\r\nHost: bench\r\nCookie: %s\r\n\r\n' % (file_id, cookie))
+        deadline = time.monotonic() + hold
+        await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), hold)
+        served.append(1)
+        while time.monotonic() < deadline:
+            if not await reader.read(SLOW_RATE):
+                return
+            await asyncio.sleep(1)
+    except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def slow_upload(port, cookie, hold):
+    boundary = uuid.uuid4().hex.encode()
+    body_size = 1024 * 1024
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    try:
+        preamble = (b'--%s\r\nContent-Disposition: form-data; name="file"; filename="slow.mp4"\r\n'
+                    b'Content-Type: application/octet-stream\r\n\r\n' % boundary)
+        writer.write(b'POST /upload HTTP/1.1\r\nHost: bench\r\nCookie: %s\r\nAccept: application/json\r\n'
+                     b'Content-Type: multipart/form-data; boundary=%s\r\nContent-Length: %d\r\n\r\n%s'
+                     % (cookie, boundary, len(preamble) + body_size, preamble))
+        deadline = time.monotonic() + hold
+        while time.monotonic() < deadline:
+            writer.write(b'\0' * SLOW_RATE)
+            await writer.drain()
+            await asyncio.sleep(1)
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def probe(port, cookie, hold):
+    """Quick requests one after another while the slow clients are connected"""
+    latencies, timeouts = [], 0
+    raw = b'GET %s HTTP/1.1\r\nHost: bench\r\nCookie: %s\r\nConnection: close\r\n\r\n' % (
+        PROBE_PATH.encode(), cookie)
+    deadline = time.monotonic() + hold
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            await request(port, raw, max(deadline - time.monotonic(), 0.5))
+            latencies.append((time.perf_counter() - started) * 1000)
+        except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError):
+            timeouts += 1
+        await asyncio.sleep(0.2)
+    return latencies, timeouts
+
+
+async def run_load(port, cookie, scenario, clients, file_id, hold):
+    served = []
+    if scenario == 'download':
+        slow = [slow_download(port, cookie, file_id, hold, served) for _ in range(clients)]
+    else:
+        slow = [slow_upload(port, cookie, hold) for _ in range(clients)]
+    tasks = [asyncio.ensure_future(c) for c in slow]
+    # Let the slow clients take their connections before probing
+    await asyncio.sleep(1)
+    latencies, timeouts = await probe(port, cookie, hold - 1)
+    await asyncio.gather(*tasks)
+    return len(served), latencies, timeouts
+
+
+def run(workers, asgi_worker, client_counts, scenarios, hold, file_size):
+    work_dir = Path(tempfile.mkdtemp(prefix='fileflow-bench-'))
+    file_id = seed(work_dir, file_size)
+    env = dict(os.environ, WATCHER_ENABLED='false')
+    print(f"workers={workers} file={file_size // 1024 // 1024}MB hold={hold}s slow rate={SLOW_RATE // 1024}KB/s")
+    print(f"{'server':<6} {'scenario':<9} {'clients':>7} {'served':>7} {'probe p50 ms':>13} "
+          f"{'probe max ms':>13} {'probe ok':>9} {'timeouts':>9}")
+    for kind, worker_class in (('sync', 'sync'), ('asgi', asgi_worker)):
+        port = free_port()
+        process = start_server(kind, worker_class, workers, port, env)
+        try:
+            cookie = asyncio.run(login(port))
+            for scenario in scenarios:
+                for clients in client_counts:
+                    served, latencies, timeouts = asyncio.run(
+                        run_load(port, cookie, scenario, clients, file_id, hold))
+                    p50 = f"{statistics.median(latencies):.1f}" if latencies else '-'
+                    worst = f"{max(latencies):.1f}" if latencies else '-'
+                    print(f"{kind:<6} {scenario:<9} {clients:>7} {served:>7} {p50:>13} {worst:>13} "
+                          f"{len(latencies):>9} {timeouts:>9}")
+        finally:
+            stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn processes for both servers')
+    parser.add_argument('--asgi-worker', default='uvicorn.workers.UvicornWorker',
+                        help='gunicorn worker class for the ASGI run')
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 500], help='slow clients per run')
+    parser.add_argument('--scenario', nargs='+', choices=['download', 'upload'], default=['download', 'upload'])
+    parser.add_argument('--hold', type=int, default=10, help='seconds the slow clients stay connected')
+    parser.add_argument('--file-size', type=int, default=8, help='download size in MB')
+    args = parser.parse_args()
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    run(args.workers, args.asgi_worker, args.clients, args.scenario, args.hold, args.file_size * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    main()
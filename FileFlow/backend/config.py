@@ -17,9 +17,90 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///fileflow.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UPLOAD_FOLDER = 'user_files'
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'user_files')  # Relative to backend/
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
     
+    # Resumable chunked uploads (each chunk is its own request, so it must
+    # stay below MAX_CONTENT_LENGTH)
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB advertised chunk size
+    UPLOAD_SESSION_TTL = 24 * 60 * 60  # Abandoned uploads expire after a day
+    
+    # Bulk uploads (/api/upload/bulk): one request carries many files or a tar
+    BULK_UPLOAD_MAX_BYTES = int(os.environ.get('BULK_UPLOAD_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB per request
+    BULK_UPLOAD_MAX_FILES = int(os.environ.get('BULK_UPLOAD_MAX_FILES', 20000))
+    
+    # Batch operations (/api/batch): items across all operations of one request
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 10000))
+    
+    # Web worker processes per host. gunicorn and uvicorn read the same
+    # variable when started without -w/--workers; every worker runs its own
+    # job and thumbnail pools, so those are sized from its share of the cores
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 0)) or 1
+    WORKER_CORES = max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1)
+    
+    # Background jobs (archive create/extract) run side by side; by default a
+    # quarter of this worker's cores, so each job can compress on several
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0)) or max(WORKER_CORES // 4, 1)
+    # Processes each archive job may use to compress in parallel; 1 disables it.
+    # Defaults to, and is capped at, an equal share of the cores per job worker
+    # (JOB_WORKERS * COMPRESSION_WORKERS never exceeds WORKER_CORES)
+    COMPRESSION_WORKERS = min(int(os.environ.get('COMPRESSION_WORKERS', 0)) or WORKER_CORES,
+                              max(WORKER_CORES // JOB_WORKERS, 1))
+    
+    # Limits for one archive extraction (zip-bomb protection); 0 disables a limit
+    EXTRACT_MAX_MEMBERS = int(os.environ.get('EXTRACT_MAX_MEMBERS', 10000))
+    EXTRACT_MAX_BYTES = int(os.environ.get('EXTRACT_MAX_BYTES', 10 * 1024 * 1024 * 1024))  # 10GB uncompressed
+    
+    # Full-text search: also index text extracted from txt/csv/json/html/pdf uploads
+    SEARCH_INDEX_CONTENT = os.environ.get('SEARCH_INDEX_CONTENT', 'true').lower() == 'true'
+    SEARCH_MAX_EXTRACT_BYTES = 1024 * 1024  # Only the first 1MB of each document is indexed
+    
+    # How file bytes are served once a download is authorised:
+    #   'python'     - the app streams them (zero-copy sendfile under gunicorn)
+    #   'x-accel'    - nginx serves them via X-Accel-Redirect
+    #   'x-sendfile' - Apache/lighttpd serve them via X-Sendfile
+    FILE_SERVING_MODE = os.environ.get('FILE_SERVING_MODE', 'python')
+    # Internal nginx location that aliases UPLOAD_FOLDER (x-accel mode)
+    X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/_protected_files')
+    
+    # Storage quota per user in bytes (0 = unlimited); User.storage_quota overrides it
+    STORAGE_QUOTA = int(os.environ.get('STORAGE_QUOTA', 0))
+    
+    # ASGI mode (backend/asgi.py): threads running Flask views, and how much
+    # of a request body is buffered in memory before it spills to disk
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+    ASGI_SPOOL_MEMORY = 1024 * 1024
+    
+    # Per-process cache of file rows, stat and ETag used by downloads; other
+    # workers see renames and deletes after at most FILE_CACHE_TTL seconds
+    FILE_CACHE_SIZE = int(os.environ.get('FILE_CACHE_SIZE', 10000))
+    FILE_CACHE_TTL = int(os.environ.get('FILE_CACHE_TTL', 60))
+    
+    # Per-process cache of the logged-in user's principal, so authenticated
+    # requests cost no query; other workers see password and account changes
+    # after at most PRINCIPAL_CACHE_TTL seconds. PRINCIPAL_CACHE_URL adds a
+    # shared tier behind it: 'redis://host:6379/0', or 'local://' for an
+    # in-process stand-in
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000))
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 30))
+    PRINCIPAL_CACHE_URL = os.environ.get('PRINCIPAL_CACHE_URL', '')
+    PRINCIPAL_CACHE_SHARED_TTL = int(os.environ.get('PRINCIPAL_CACHE_SHARED_TTL', 3600))
+    
+    # Watch UPLOAD_FOLDER from inside the web app (one gunicorn worker takes
+    # the lock); alternatively run `flask watch` as its own process
+    WATCHER_ENABLED = os.environ.get('WATCHER_ENABLED', 'false').lower() == 'true'
+    WATCHER_DEBOUNCE = 2.0  # Seconds without events before a batch is applied
+    WATCHER_MAX_BATCH = 5000  # Apply immediately once this many paths changed
+    
+    # Image previews served by /thumb/<file_id>/<size>
+    THUMBNAIL_SIZES = (128, 256, 1024)  # Longest side in pixels
+    THUMBNAIL_PREGENERATE_SIZES = (128,)  # Rendered right after upload (dashboard grid)
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 0)) or min(WORKER_CORES, 4)
+    THUMBNAIL_CACHE_BYTES = 512 * 1024 * 1024  # Disk budget; least recently used are evicted
+    THUMBNAIL_MAX_AGE = 30 * 24 * 60 * 60  # Browser cache lifetime
+    THUMBNAIL_TIMEOUT = 30  # Seconds a request waits for a lazy rendition
+    
     # Performance optimization settings
     SEND_FILE_MAX_AGE_DEFAULT = 31536000  # 1 year cache for static files
     JSON_SORT_KEYS = False  # Disable JSON key sorting for performance
@@ -27,4 +108,11 @@ class Config:
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     
     # Compression settings (for nginx to use gzip)
-    COMPRESSION_ENABLED = True
\ No newline at end of file
+    COMPRESSION_ENABLED = True
+    
+    # Response compression policy (textual types only)
+    COMPRESS_MIN_SIZE = 1024  # Smaller bodies are sent as-is
+    COMPRESS_MAX_FILE_SIZE = 256 * 1024 * 1024  # Larger text downloads are not compressed on the fly
+    PRECOMPRESS_AFTER_HITS = 3  # Store br/gzip variants of text files served this often; 0 disables
+    PRECOMPRESS_CACHE_BYTES = 1024 * 1024 * 1024  # Disk budget for stored variants
+    COMPRESS_JSON_CACHE_BYTES = 32 * 1024 * 1024  # Memory budget for compressed JSON bodies
\ No newline at end of file
@@ -1,8 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from flask_bcrypt import Bcrypt
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, select, update, func, cast, literal, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import relationship, aliased
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
+import json
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
@@ -12,6 +16,10 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
+    # Sum of the user's file sizes, maintained by UsageService
+    storage_used = db.Column(db.BigInteger, default=0, nullable=False)
+    # Bytes this user may store; NULL falls back to the STORAGE_QUOTA setting
+    storage_quota = db.Column(db.BigInteger, nullable=True)
     files = relationship('File', backref='user', lazy=True)
 
     def set_password(self, password):
@@ -27,13 +35,22 @@ class File(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     is_folder = db.Column(db.Boolean, default=False)
     parent_folder_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=True)
+    # Materialized path of ancestor ids including this row, e.g. '/1/5/9/'.
+    # Byte-order collation keeps subtree range scans correct on Postgres too.
+    path = db.Column(db.String(1000).with_variant(postgresql.VARCHAR(1000, collation='C'), 'postgresql'),
+                     index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    filesize = db.Column(db.Integer, default=0)
+    filesize = db.Column(db.BigInteger, default=0)
     mimetype = db.Column(db.String(100))
     file_hash = db.Column(db.String(64))
     is_favorite = db.Column(db.Boolean, default=False)
-    tags = db.Column(db.String(500))
+    # Written only through TagService (file_tag rows), so read-only here
+    tags = relationship('Tag', secondary='file_tag', viewonly=True, order_by='Tag.name')
+    # Set by the reconciler when the stored bytes are gone or corrupt
+    is_missing = db.Column(db.Boolean, default=False)
+    # Folders: total size of every file below, maintained by UsageService
+    tree_size = db.Column(db.BigInteger, default=0)
     
     def to_dict(self):
         return {
@@ -47,9 +64,193 @@ class File(db.Model):
             'filesize': self.filesize,
             'mimetype': self.mimetype,
             'is_favorite': self.is_favorite,
-            'tags': self.tags.split(',') if self.tags else []
+            'tags': [tag.name for tag in self.tags]
         }
 
+    @property
+    def ancestor_ids(self):
+        """Ids from the root down to (and including) this row"""
+        return [int(part) for part in (self.path or '').split('/') if part]
+
+    def is_inside(self, folder):
+        """Check whether this row is `folder` or lies anywhere below it"""
+        return bool(self.path and folder.path) and self.path.startswith(folder.path)
+
+    @staticmethod
+    def subtree_filter(path):
+        """Index-friendly range condition matching `path` and everything below it
+
+        '0' sorts right after '/', so [path, path[:-1] + '0') covers exactly
+        the paths that start with `path`.
+        """
+        return (File.path >= path) & (File.path < path[:-1] + '0')
+
+    @staticmethod
+    def path_update(file_ids):
+        """Bulk UPDATE deriving each row's path from its parent's (for Core inserts)"""
+        parent = aliased(File)
+        parent_path = select(parent.path).where(parent.id == File.parent_folder_id).scalar_subquery()
+        return update(File).where(File.id.in_(list(file_ids))).values(
+            path=func.coalesce(parent_path, '/') + cast(File.id, String) + '/'
+        ).execution_options(synchronize_session=False)
+
+# Every hot File query is scoped to one user, so user_id leads each index.
+# Folder listings: WHERE user_id, parent_folder_id ORDER BY is_folder DESC, filename
+db.Index('ix_file_user_parent_listing', File.user_id, File.parent_folder_id, File.is_folder.desc(), File.filename)
+# Search filters: mimetype prefix, size range, date range
+db.Index('ix_file_user_mimetype', File.user_id, File.mimetype)
+db.Index('ix_file_user_filesize', File.user_id, File.filesize)
+db.Index('ix_file_user_created_at', File.user_id, File.created_at)
+
+@event.listens_for(File, 'after_insert')
+def _assign_path(mapper, connection, target):
+    file_table = File.__table__
+    parent_path = '/'
+    if target.parent_folder_id:
+        parent_path = connection.execute(
+            select(file_table.c.path).where(file_table.c.id == target.parent_folder_id)
+        ).scalar() or '/'
+    path = f"{parent_path}{target.id}/"
+    connection.execute(update(file_table).where(file_table.c.id == target.id).values(path=path))
+    set_committed_value(target, 'path', path)
+
+@event.listens_for(File, 'after_update')
+def _move_path(mapper, connection, target):
+    if not db.inspect(target).attrs.parent_folder_id.history.has_changes() or not target.path:
+        return
+    file_table = File.__table__
+    parent_path = '/'
+    if target.parent_folder_id:
+        parent_path = connection.execute(
+            select(file_table.c.path).where(file_table.c.id == target.parent_folder_id)
+        ).scalar() or '/'
+    old_path = target.path
+    new_path = f"{parent_path}{target.id}/"
+    # Re-root the whole subtree in one statement
+    connection.execute(
+        update(file_table)
+        .where(file_table.c.path >= old_path, file_table.c.path < old_path[:-1] + '0')
+        .values(path=literal(new_path, String) + func.substr(file_table.c.path, len(old_path) + 1, type_=String))
+    )
+    set_committed_value(target, 'path', new_path)
+
+class Tag(db.Model):
+    """A user's tag; `key` is the lowercased name, so "Work" and "work" are one tag"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FileTag(db.Model):
+    """A file carrying a tag; the primary key serves the tags of one file"""
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+
+# Tag lookups by name, and the files carrying a tag
+db.Index('ix_tag_user_key', Tag.user_id, Tag.key, unique=True)
+db.Index('ix_file_tag_tag', FileTag.tag_id, FileTag.file_id)
+
+class Blob(db.Model):
+    """Content-addressed object shared by every File row with the same hash"""
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, default=0, nullable=False)
+    # libmagic's verdict on the content, shared by every name it is uploaded under
+    mimetype = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ArchiveIndex(db.Model):
+    """Table of contents of an archive blob, built once per content hash"""
+    hash = db.Column(db.String(64), primary_key=True)
+    format = db.Column(db.String(10), nullable=False)
+    member_count = db.Column(db.Integer, default=0, nullable=False)
+    # Compressed tars: JSON [[compressed_offset, uncompressed_offset], ...] where decoding can restart
+    checkpoints = db.Column(db.Text)
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ArchiveMember(db.Model):
+    """One entry of an ArchiveIndex, in archive order"""
+    id = db.Column(db.Integer, primary_key=True)
+    archive_hash = db.Column(db.String(64), nullable=False)
+    name = db.Column(db.String(1000), nullable=False)
+    is_folder = db.Column(db.Boolean, default=False)
+    size = db.Column(db.BigInteger, default=0)
+    mtime = db.Column(db.DateTime)
+    # zip: local header offset; tar: data offset in the uncompressed stream; 7z: NULL
+    offset = db.Column(db.BigInteger)
+    compressed_size = db.Column(db.BigInteger)
+    method = db.Column(db.Integer)  # zip compression method
+    flags = db.Column(db.Integer)  # zip general purpose flags (bit 0: encrypted)
+
+db.Index('ix_archive_member_hash_name', ArchiveMember.archive_hash, ArchiveMember.name)
+
+class UploadSession(db.Model):
+    """In-progress resumable upload; bytes live in a staging file until finalize"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    parent_folder_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, default=0, nullable=False)
+    staging_path = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.total_size,
+            'offset': self.received,
+            'complete': self.received >= self.total_size
+        }
+
+class Job(db.Model):
+    """Background job run on the process pool, polled for progress"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    owner = db.Column(db.String(100))  # host:pid of the process that will register the result
+    params = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    bytes_done = db.Column(db.BigInteger, default=0)
+    bytes_total = db.Column(db.BigInteger, default=0)
+    members_done = db.Column(db.Integer, default=0)
+    members_total = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'bytes_done': self.bytes_done or 0,
+            'bytes_total': self.bytes_total or 0,
+            'members_done': self.members_done or 0,
+            'members_total': self.members_total or 0,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class BackfillCheckpoint(db.Model):
+    """Resume point and running totals of one backfill task (see utils/backfill.py)"""
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)  # Highest File.id already handled
+    processed = db.Column(db.BigInteger, default=0)
+    updated = db.Column(db.BigInteger, default=0)
+    errors = db.Column(db.BigInteger, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
 class SearchProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -0,0 +1,347 @@
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from typing import Iterator, List, Optional, Tuple
+import bz2
+import json
+import lzma
+import logging
+import shutil
+import struct
+import tarfile
+import zipfile
+import zlib
+import py7zr
+try:
+    from backend.models.database import db, ArchiveIndex, ArchiveMember
+    from backend.services.blob_service import get_blob_store
+except ImportError:
+    from models.database import db, ArchiveIndex, ArchiveMember
+    from services.blob_service import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+
+# Minimum uncompressed distance between two stored restart points
+CHECKPOINT_SPACING = 1024 * 1024
+
+# Members inserted per statement when an index is stored
+INSERT_BATCH_SIZE = 1000
+
+TAR_CODECS = {'tar': None, 'tar.gz': 'gz', 'tar.bz2': 'bz2', 'tar.xz': 'xz'}
+
+_ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_ZIP_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+
+def _decompressor(codec):
+    if codec == 'gz':
+        return zlib.decompressobj(wbits=31)
+    if codec == 'bz2':
+        return bz2.BZ2Decompressor()
+    return lzma.LZMADecompressor()
+
+
+class _MultiStreamReader:
+    """Decompress concatenated gz/bz2/xz streams, noting where each one starts
+
+    Every stream decodes on its own, so its first byte is a point where
+    reading can restart without decoding anything before it. Archives
+    written by CompressionService's parallel writer start a stream every
+    PARALLEL_BLOCK_SIZE; a single-stream file has only the one at 0.
+    Output per step is capped at READ_SIZE, so a bomb cannot balloon memory.
+    """
+
+    def __init__(self, raw, codec, compressed_offset=0, uncompressed_offset=0):
+        self.raw = raw
+        self.codec = codec
+        self.checkpoints = []
+        self.position = uncompressed_offset  # Uncompressed bytes handed out so far
+        self._stream_start = compressed_offset
+        self._fed = 0  # Compressed bytes given to the current stream's decompressor
+        self._decompressor = _decompressor(codec)
+        self._pending = None  # Input the decompressor still has to take; None means read more
+        self._buffer = bytearray()
+        self._eof = False
+        raw.seek(compressed_offset)
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and not self._eof:
+            self._fill()
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.position += len(data)
+        return data
+
+    def skip(self, count: int) -> None:
+        while count > 0:
+            data = self.read(min(count, READ_SIZE))
+            if not data:
+                raise EOFError("Archive ended before the member's data")
+            count -= len(data)
+
+    def _start_stream(self, data: bytes) -> bytes:
+        # Zero padding between or after streams is skipped, as gzip and xz readers do
+        stripped = data.lstrip(b'\0')
+        self._stream_start += len(data) - len(stripped)
+        if stripped:
+            produced = self.position + len(self._buffer)
+            if not self.checkpoints or produced - self.checkpoints[-1][1] >= CHECKPOINT_SPACING:
+                self.checkpoints.append((self._stream_start, produced))
+        return stripped
+
+    def _fill(self) -> None:
+        while True:
+            if self._pending is None:
+                chunk = self.raw.read(READ_SIZE)
+                if not chunk:
+                    self._eof = True
+                    return
+                if self._fed == 0:
+                    chunk = self._start_stream(chunk)
+                    if not chunk:
+                        continue
+                self._fed += len(chunk)
+                self._pending = chunk
+
+            decompressor = self._decompressor
+            out = decompressor.decompress(self._pending, READ_SIZE)
+            self._buffer += out
+            if decompressor.eof:
+                # Everything after the stream's end; zlib may also leave the same
+                # bytes in unconsumed_tail, so that must not be added on top
+                leftover = decompressor.unused_data
+                self._stream_start += self._fed - len(leftover)
+                self._decompressor = _decompressor(self.codec)
+                leftover = self._start_stream(leftover)
+                self._fed = len(leftover)
+                self._pending = leftover or None
+            elif self.codec == 'gz':
+                # A full output block may leave output pending inside zlib
+                tail = decompressor.unconsumed_tail
+                self._pending = tail if tail or len(out) == READ_SIZE else None
+            else:
+                self._pending = None if decompressor.needs_input else b''
+            if out:
+                return
+
+
+class ArchiveIndexService:
+    """Persistent tables of contents for archives, and single-member reads
+
+    An index is built in one pass the first time an archive is browsed and
+    stored under the archive's content hash, so every copy of the same
+    archive shares it and listing never reparses the file again. Besides
+    name, size and mtime it records where each member's data starts:
+
+    - zip: the local header offset, read directly with a seek;
+    - plain tar: the data offset, read directly with a seek;
+    - compressed tar: the offset in the uncompressed stream, plus restart
+      checkpoints, so a read decodes from the nearest checkpoint only;
+    - 7z: nothing usable (solid blocks), the member is extracted on its own.
+    """
+
+    @staticmethod
+    def get(archive_path: str, format_type: str, file_hash: Optional[str]) -> Tuple[ArchiveIndex, List[ArchiveMember]]:
+        """The index of an archive, building and storing it on first use
+
+        Archives without a content hash (legacy uploads) are indexed on the
+        fly and not stored.
+        """
+        if file_hash:
+            index = db.session.get(ArchiveIndex, file_hash)
+            if index is not None:
+                members = db.session.scalars(
+                    select(ArchiveMember).where(ArchiveMember.archive_hash == file_hash).order_by(ArchiveMember.id)
+                ).all()
+                return index, members
+
+        index, members = ArchiveIndexService.build(archive_path, format_type)
+        if file_hash:
+            index.hash = file_hash
+            ArchiveIndexService._store(index, members)
+        return index, members
+
+    @staticmethod
+    def find(archive_path: str, format_type: str, file_hash: Optional[str],
+             name: str) -> Tuple[ArchiveIndex, Optional[ArchiveMember]]:
+        """The index of an archive and its first file member called `name`, or None
+
+        A stored index is searched through the (archive_hash, name) index
+        without loading the other members.
+        """
+        if file_hash:
+            index = db.session.get(ArchiveIndex, file_hash)
+            if index is not None:
+                member = db.session.scalars(
+                    select(ArchiveMember).where(ArchiveMember.archive_hash == file_hash, ArchiveMember.name == name,
+                                                ArchiveMember.is_folder.is_(False)).order_by(ArchiveMember.id).limit(1)
+                ).first()
+                return index, member
+
+        index, members = ArchiveIndexService.get(archive_path, format_type, file_hash)
+        return index, next((m for m in members if m.name == name and not m.is_folder), None)
+
+    @staticmethod
+    def _store(index: ArchiveIndex, members: List[ArchiveMember]) -> None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(index)
+                db.session.flush()
+                rows = [{column: getattr(member, column) for column in
+                         ('name', 'is_folder', 'size', 'mtime', 'offset', 'compressed_size', 'method', 'flags')}
+                        for member in members]
+                for row in rows:
+                    row['archive_hash'] = index.hash
+                for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                    db.session.execute(insert(ArchiveMember), rows[i:i + INSERT_BATCH_SIZE])
+            db.session.commit()
+            logger.info(f"Indexed archive {index.hash}: {len(members)} members")
+        except IntegrityError:
+            # Another request indexed the same content first
+            db.session.rollback()
+
+    @staticmethod
+    def build(archive_path: str, format_type: str) -> Tuple[ArchiveIndex, List[ArchiveMember]]:
+        """Read an archive's table of contents in a single pass (not stored)"""
+        index = ArchiveIndex(format=format_type)
+        if format_type == 'zip':
+            members = ArchiveIndexService._build_zip(archive_path)
+        elif format_type in TAR_CODECS:
+            members, checkpoints = ArchiveIndexService._build_tar(archive_path, TAR_CODECS[format_type])
+            if checkpoints is not None:
+                index.checkpoints = json.dumps(checkpoints)
+        elif format_type == '7z':
+            members = ArchiveIndexService._build_7z(archive_path)
+        else:
+            raise ValueError("Unsupported archive format")
+        index.member_count = len(members)
+        return index, members
+
+    @staticmethod
+    def _build_zip(archive_path: str) -> List[ArchiveMember]:
+        with zipfile.ZipFile(archive_path, 'r') as zipf:
+            return [ArchiveMember(name=info.filename, is_folder=info.is_dir(), size=info.file_size,
+                                  mtime=datetime(*info.date_time), offset=info.header_offset,
+                                  compressed_size=info.compress_size, method=info.compress_type,
+                                  flags=info.flag_bits)
+                    for info in zipf.infolist()]
+
+    @staticmethod
+    def _build_tar(archive_path: str, codec: Optional[str]):
+        members = []
+        with open(archive_path, 'rb') as raw:
+            source = raw if codec is None else _MultiStreamReader(raw, codec)
+            with tarfile.open(fileobj=source, mode='r|') as tarf:
+                for info in tarf:
+                    if not (info.isdir() or info.isfile()):
+                        continue
+                    members.append(ArchiveMember(name=info.name, is_folder=info.isdir(), size=info.size,
+                                                 mtime=datetime.utcfromtimestamp(info.mtime),
+                                                 offset=info.offset_data))
+        return members, (None if codec is None else source.checkpoints)
+
+    @staticmethod
+    def _build_7z(archive_path: str) -> List[ArchiveMember]:
+        with py7zr.SevenZipFile(archive_path, 'r') as szf:
+            return [ArchiveMember(name=info.filename, is_folder=info.is_directory, size=info.uncompressed or 0,
+                                  mtime=info.creationtime)
+                    for info in szf.list()]
+
+    @staticmethod
+    def open_member(archive_path: str, index: ArchiveIndex, member: ArchiveMember) -> Iterator[bytes]:
+        """Stream one member's bytes without extracting anything else"""
+        if member.is_folder:
+            raise ValueError("Folders have no content")
+        if index.format == 'zip':
+            return ArchiveIndexService._read_zip(archive_path, member)
+        if index.format in TAR_CODECS:
+            checkpoints = json.loads(index.checkpoints) if index.checkpoints else None
+            return ArchiveIndexService._read_tar(archive_path, TAR_CODECS[index.format], checkpoints, member)
+        return ArchiveIndexService._read_7z(archive_path, member)
+
+    @staticmethod
+    def _read_zip(archive_path: str, member: ArchiveMember) -> Iterator[bytes]:
+        if member.flags & 0x1:
+            raise ValueError("Encrypted members must be extracted with the archive password")
+        with open(archive_path, 'rb') as raw:
+            raw.seek(member.offset)
+            header = _ZIP_LOCAL_HEADER.unpack(raw.read(_ZIP_LOCAL_HEADER.size))
+            if header[0] != _ZIP_LOCAL_SIGNATURE:
+                raise ValueError("Corrupt archive: bad local header")
+            # The local name and extra field may differ from the central directory's
+            raw.seek(member.offset + _ZIP_LOCAL_HEADER.size + header[-2] + header[-1])
+            remaining = member.compressed_size
+            if member.method == zipfile.ZIP_STORED:
+                while remaining > 0:
+                    data = raw.read(min(READ_SIZE, remaining))
+                    if not data:
+                        raise EOFError("Archive ended before the member's data")
+                    remaining -= len(data)
+                    yield data
+                return
+            if member.method != zipfile.ZIP_DEFLATED:
+                # bzip2/lzma members are rare; let zipfile decode them
+                with zipfile.ZipFile(archive_path, 'r') as zipf, zipf.open(member.name) as source:
+                    while True:
+                        data = source.read(READ_SIZE)
+                        if not data:
+                            return
+                        yield data
+            inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            pending = b''
+            while not inflater.eof:
+                if not pending and remaining > 0:
+                    pending = raw.read(min(READ_SIZE, remaining))
+                    remaining -= len(pending)
+                    if not pending:
+                        raise EOFError("Archive ended before the member's data")
+                data = inflater.decompress(pending, READ_SIZE)
+                pending = inflater.unconsumed_tail
+                if data:
+                    yield data
+                elif not pending and remaining <= 0:
+                    break
+
+    @staticmethod
+    def _read_tar(archive_path: str, codec: Optional[str], checkpoints, member: ArchiveMember) -> Iterator[bytes]:
+        with open(archive_path, 'rb') as raw:
+            if codec is None:
+                raw.seek(member.offset)
+                source = raw
+            else:
+                # Decode from the last restart point at or before the member's data
+                start = (0, 0)
+                for checkpoint in checkpoints or ():
+                    if checkpoint[1] > member.offset:
+                        break
+                    start = checkpoint
+                source = _MultiStreamReader(raw, codec, start[0], start[1])
+                source.skip(member.offset - start[1])
+            remaining = member.size
+            while remaining > 0:
+                data = source.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise EOFError("Archive ended before the member's data")
+                remaining -= len(data)
+                yield data
+
+    @staticmethod
+    def _read_7z(archive_path: str, member: ArchiveMember) -> Iterator[bytes]:
+        """Solid 7z blocks cannot be entered midway; extract just this member to scratch space"""
+        scratch = get_blob_store().new_temp_path()
+        try:
+            with py7zr.SevenZipFile(archive_path, 'r') as szf:
+                szf.extract(path=scratch, targets=[member.name])
+            with open(Path(scratch) / member.name, 'rb') as source:
+                while True:
+                    data = source.read(READ_SIZE)
+                    if not data:
+                        return
+                    yield data
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
@@ -0,0 +1,275 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update, bindparam, func, literal, String
+from pathlib import Path
+try:
+    from backend.models.database import db, File
+    from backend.services.tree_service import TreeService
+    from backend.services.usage_service import UsageService
+    from backend.services.search_service import SearchService
+    from backend.services.tag_service import TagService
+    from backend.services.metadata_cache_service import MetadataCacheService
+    from backend.utils.validators import Validators
+except ImportError:
+    from models.database import db, File
+    from services.tree_service import TreeService
+    from services.usage_service import UsageService
+    from services.search_service import SearchService
+    from services.tag_service import TagService
+    from services.metadata_cache_service import MetadataCacheService
+    from utils.validators import Validators
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+# Subtree ranges per statement; each adds two comparisons to one OR chain
+PATH_BATCH_SIZE = 100
+
+OPERATIONS = ('move', 'rename', 'tag', 'delete')
+
+
+def _batches(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _path_ids(path: Optional[str]) -> List[int]:
+    return [int(part) for part in (path or '').split('/') if part]
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _parse_ids(operation: dict, index: int) -> List[int]:
+    ids = operation.get('ids')
+    if not isinstance(ids, list) or not ids or not all(_is_id(i) for i in ids):
+        raise ValueError(f"Operation {index}: 'ids' must be a non-empty list of file ids")
+    return ids
+
+
+def _parse_tags(value, index: int, key: str) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+        raise ValueError(f"Operation {index}: '{key}' must be a list of strings")
+    return TagService.clean(value)
+
+
+class BatchService:
+    """Apply many move, rename, tag and delete operations in one transaction
+
+    Every id the operations mention (destinations included) is loaded with
+    a single ownership-filtered query. Each operation is then validated per
+    item against that snapshot and applied with set-based statements:
+
+    - move: one UPDATE of ``parent_folder_id`` and one path rewrite per
+      source folder, plus one usage transfer per source folder;
+    - rename: one executemany UPDATE keyed by id;
+    - tag: ``TagService.set_tags`` for all items at once;
+    - delete: ``TreeService.delete_subtrees`` for all ids at once.
+
+    The snapshot is kept current as operations run, so a later operation
+    sees the renames, moves and deletes of the earlier ones. Items that
+    fail validation are reported and skipped; the others still apply.
+    """
+
+    @staticmethod
+    def parse(operations, max_items: int) -> List[dict]:
+        """Validate the shape of a request's operations; raises ValueError"""
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("'operations' must be a non-empty list")
+        parsed, total = [], 0
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+                raise ValueError(f"Operation {index}: 'op' must be one of {', '.join(OPERATIONS)}")
+            op = operation['op']
+            if op == 'rename':
+                items = operation.get('items')
+                if not isinstance(items, list) or not items or not all(
+                        isinstance(item, dict) and _is_id(item.get('id')) for item in items):
+                    raise ValueError(f"Operation {index}: 'items' must be a non-empty list of {{id, new_name}}")
+                parsed.append({'op': op, 'items': [(item['id'], item.get('new_name')) for item in items]})
+                total += len(items)
+                continue
+
+            entry = {'op': op, 'ids': _parse_ids(operation, index)}
+            if op == 'move':
+                destination_id = operation.get('destination_folder_id')
+                if destination_id and not _is_id(destination_id):
+                    raise ValueError(f"Operation {index}: 'destination_folder_id' must be a folder id")
+                entry['destination_folder_id'] = destination_id or None
+            elif op == 'tag':
+                entry['tags'] = _parse_tags(operation.get('tags'), index, 'tags')
+                entry['add'] = _parse_tags(operation.get('add'), index, 'add') or []
+                entry['remove'] = _parse_tags(operation.get('remove'), index, 'remove') or []
+                if entry['tags'] is None and not entry['add'] and not entry['remove']:
+                    raise ValueError(f"Operation {index}: give 'tags', 'add' or 'remove'")
+            parsed.append(entry)
+            total += len(entry['ids'])
+        if total > max_items:
+            raise ValueError(f"At most {max_items} items per batch")
+        return parsed
+
+    @staticmethod
+    def _load(operations: List[dict], user_id: int) -> Dict[int, dict]:
+        """The user's rows for every id the operations mention, in one query"""
+        ids = set()
+        for operation in operations:
+            if operation['op'] == 'rename':
+                ids.update(file_id for file_id, _ in operation['items'])
+            else:
+                ids.update(operation['ids'])
+            if operation.get('destination_folder_id'):
+                ids.add(operation['destination_folder_id'])
+        ids = sorted(ids)
+        rows = {}
+        for batch in _batches(ids):
+            for row in db.session.execute(
+                select(File.id, File.parent_folder_id, File.path, File.is_folder, File.filesize,
+                       File.tree_size, File.filename)
+                .where(File.id.in_(batch), File.user_id == user_id)
+            ):
+                rows[row.id] = row._asdict()
+        return rows
+
+    @staticmethod
+    def apply(operations: List[dict], user_id: int, store) -> Tuple[List[dict], List[Path]]:
+        """Run parsed operations in order (caller commits)
+
+        Returns the per-item results and the blob paths to pass to
+        ``store.unlink`` once the transaction has committed.
+        """
+        rows = BatchService._load(operations, user_id)
+        results, unreferenced = [], []
+        for operation in operations:
+            op = operation['op']
+            if op == 'move':
+                BatchService._move(operation, rows, user_id, results)
+            elif op == 'rename':
+                BatchService._rename(operation, rows, user_id, results)
+            elif op == 'tag':
+                BatchService._tag(operation, rows, user_id, results)
+            else:
+                unreferenced.extend(BatchService._delete(operation, rows, user_id, store, results))
+        # Core statements bypassed the identity map
+        db.session.expire_all()
+        return results, unreferenced
+
+    @staticmethod
+    def _move(operation: dict, rows: Dict[int, dict], user_id: int, results: List[dict]) -> None:
+        destination_id = operation['destination_folder_id']
+        destination = rows.get(destination_id) if destination_id is not None else None
+        if destination_id is not None and (destination is None or not destination['is_folder']):
+            results.extend({'op': 'move', 'id': file_id, 'success': False, 'error': 'Destination folder not found'}
+                           for file_id in operation['ids'])
+            return
+        destination_path = destination['path'] if destination else '/'
+        destination_chain = set(_path_ids(destination_path))
+
+        selected = {}
+        for file_id in operation['ids']:
+            row = rows.get(file_id)
+            if row is None:
+                results.append({'op': 'move', 'id': file_id, 'success': False, 'error': 'File not found'})
+            elif file_id in destination_chain:
+                results.append({'op': 'move', 'id': file_id, 'success': False,
+                                'error': 'Cannot move a folder into itself or one of its subfolders'})
+            else:
+                selected[file_id] = row
+                results.append({'op': 'move', 'id': file_id, 'success': True})
+
+        # Items inside another selected folder travel with it; items already there stay put
+        by_parent = {}
+        for row in selected.values():
+            if row['parent_folder_id'] == destination_id or selected.keys() & set(_path_ids(row['path'])[:-1]):
+                continue
+            by_parent.setdefault(row['parent_folder_id'], []).append(row)
+
+        moved = {}
+        for parent_id, group in by_parent.items():
+            ids = [row['id'] for row in group]
+            old_prefix = group[0]['path'][:-len(f"{group[0]['id']}/")]
+            for batch in _batches(ids):
+                db.session.execute(
+                    update(File).where(File.id.in_(batch)).values(parent_folder_id=destination_id)
+                    .execution_options(synchronize_session=False)
+                )
+            # Re-root every subtree leaving this folder with one statement per batch
+            for batch in _batches([row['path'] for row in group], PATH_BATCH_SIZE):
+                db.session.execute(
+                    update(File).where(TreeService.subtree_condition(batch)).values(
+                        path=literal(destination_path, String)
+                        + func.substr(File.path, len(old_prefix) + 1, type_=String)
+                    ).execution_options(synchronize_session=False)
+                )
+            size = sum(((row['tree_size'] if row['is_folder'] else row['filesize']) or 0) for row in group)
+            UsageService.transfer(user_id, size, parent_id, destination_id)
+            for row in group:
+                moved[row['id']] = old_prefix
+
+        if moved:
+            MetadataCacheService.invalidate(moved)
+            for row in rows.values():
+                root = next((i for i in _path_ids(row['path']) if i in moved), None)
+                if root is not None:
+                    if row['id'] == root:
+                        row['parent_folder_id'] = destination_id
+                    row['path'] = destination_path + row['path'][len(moved[root]):]
+
+    @staticmethod
+    def _rename(operation: dict, rows: Dict[int, dict], user_id: int, results: List[dict]) -> None:
+        renamed = {}
+        for file_id, new_name in operation['items']:
+            if file_id not in rows:
+                results.append({'op': 'rename', 'id': file_id, 'success': False, 'error': 'File not found'})
+            elif not isinstance(new_name, str) or not new_name or not Validators.is_valid_filename(new_name):
+                results.append({'op': 'rename', 'id': file_id, 'success': False, 'error': 'Invalid filename'})
+            else:
+                renamed[file_id] = Validators.sanitize_filename(new_name)
+                results.append({'op': 'rename', 'id': file_id, 'success': True, 'new_name': renamed[file_id]})
+        if not renamed:
+            return
+
+        file_table = File.__table__
+        statement = update(file_table).where(file_table.c.id == bindparam('row_id')).values(
+            filename=bindparam('new_name'))
+        for batch in _batches(list(renamed.items())):
+            db.session.execute(statement, [{'row_id': i, 'new_name': name} for i, name in batch])
+        for file_id, name in renamed.items():
+            rows[file_id]['filename'] = name
+        MetadataCacheService.invalidate(renamed)
+        SearchService.reindex(renamed)
+
+    @staticmethod
+    def _tag(operation: dict, rows: Dict[int, dict], user_id: int, results: List[dict]) -> None:
+        remove = {TagService.key(name) for name in operation['remove']}
+        found = [file_id for file_id in operation['ids'] if file_id in rows]
+        current = TagService.names_for(found) if operation['tags'] is None else {}
+        file_tags = {}
+        for file_id in operation['ids']:
+            if file_id not in rows:
+                results.append({'op': 'tag', 'id': file_id, 'success': False, 'error': 'File not found'})
+                continue
+            base = operation['tags'] if operation['tags'] is not None else current.get(file_id, [])
+            tags = [name for name in TagService.clean(base + operation['add']) if TagService.key(name) not in remove]
+            file_tags[file_id] = tags
+            results.append({'op': 'tag', 'id': file_id, 'success': True, 'tags': tags})
+        TagService.set_tags(user_id, file_tags)
+
+    @staticmethod
+    def _delete(operation: dict, rows: Dict[int, dict], user_id: int, store, results: List[dict]) -> List[Path]:
+        deleted = set()
+        for file_id in operation['ids']:
+            if file_id in rows:
+                deleted.add(file_id)
+                results.append({'op': 'delete', 'id': file_id, 'success': True})
+            else:
+                results.append({'op': 'delete', 'id': file_id, 'success': False, 'error': 'File not found'})
+        if not deleted:
+            return []
+
+        unreferenced = TreeService.delete_subtrees(sorted(deleted), user_id, store)
+        # Later operations must not find anything inside the deleted subtrees
+        for file_id in [i for i, row in rows.items() if deleted.intersection(_path_ids(row['path']))]:
+            del rows[file_id]
+        return unreferenced
@@ -0,0 +1,317 @@
+from flask import current_app
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import insert, update, delete
+from sqlalchemy.exc import IntegrityError
+import hashlib
+import logging
+import os
+import time
+import uuid
+try:
+    from backend.models.database import db, Blob, ArchiveIndex, ArchiveMember
+except ImportError:
+    from models.database import db, Blob, ArchiveIndex, ArchiveMember
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+# How long an object re-used by a write is protected from unlink(): the
+# reference the write is about to add may not have committed yet
+PIN_SECONDS = 15 * 60
+
+
+def _batches(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BlobStore:
+    """Content-addressed, deduplicating storage for file contents
+
+    Blobs are stored once per SHA-256 digest under a sharded
+    ``objects/ab/cdef...`` layout. Every File row that points at a blob holds
+    one reference in the ``Blob`` table; the object is only unlinked when the
+    last reference is released.
+
+    A write whose content is already stored re-uses the object and touches
+    a pin for its hash (``objects/tmp/pins``). unlink() leaves pinned
+    objects alone, so releasing the last reference cannot remove content
+    that a concurrent upload has just re-used but not committed yet.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, base_upload_path: str):
+        self.objects_dir = Path(base_upload_path) / 'objects'
+        self.tmp_dir = self.objects_dir / 'tmp'
+        self.pins_dir = self.tmp_dir / 'pins'
+        self.pins_dir.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, file_hash: str) -> Path:
+        """Get the sharded on-disk location of a blob"""
+        return self.objects_dir / file_hash[:2] / file_hash[2:]
+
+    def new_temp_path(self) -> Path:
+        """Get a unique scratch path on the same filesystem as the objects"""
+        return self.tmp_dir / uuid.uuid4().hex
+
+    def write_stream(self, stream) -> Tuple[str, int, Path]:
+        """Copy a stream into the store, hashing it on the way through
+
+        Returns ``(file_hash, size, object_path)``. Content that is already
+        stored is not written a second time.
+        """
+        temp_path = self.new_temp_path()
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, 'wb') as out:
+                while True:
+                    data = stream.read(self.CHUNK_SIZE)
+                    if not data:
+                        break
+                    hasher.update(data)
+                    out.write(data)
+                    size += len(data)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        file_hash = hasher.hexdigest()
+        return file_hash, size, self._place(temp_path, file_hash)
+
+    def ingest_file(self, path: Path) -> Tuple[str, int, Path]:
+        """Move an already-written file (e.g. a finished upload) into the store"""
+        hasher = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+                size += len(data)
+
+        file_hash = hasher.hexdigest()
+        return file_hash, size, self._place(Path(path), file_hash)
+
+    def import_file(self, path: Path) -> Tuple[str, int, Path]:
+        """Copy a file that lives outside the store (e.g. a legacy upload) into it"""
+        with open(path, 'rb') as f:
+            return self.write_stream(f)
+
+    def adopt_file(self, path: Path) -> Tuple[str, int, Path]:
+        """Bring a legacy file into the store without touching the original
+
+        The object is hard-linked to the original when both are on one
+        filesystem and copied otherwise; the caller removes the original
+        once the row pointing at the object has committed.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+                size += len(data)
+
+        file_hash = hasher.hexdigest()
+        target = self.object_path(file_hash)
+        if not self._reuse(file_hash):
+            temp_path = self.new_temp_path()
+            try:
+                os.link(path, temp_path)
+            except OSError:
+                with open(path, 'rb') as f:
+                    return self.write_stream(f)
+            self._place(temp_path, file_hash)
+        return file_hash, size, target
+
+    def _place(self, temp_path: Path, file_hash: str) -> Path:
+        target = self.object_path(file_hash)
+        if self._reuse(file_hash):
+            # Identical content is already stored; drop the duplicate write
+            temp_path.unlink(missing_ok=True)
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, target)
+        return target
+
+    def _reuse(self, file_hash: str) -> bool:
+        """Whether the object is already stored; if so it is pinned against unlink()"""
+        target = self.object_path(file_hash)
+        if not target.exists():
+            return False
+        (self.pins_dir / file_hash).touch()
+        # unlink() moves an object away before it checks the pin, so an object
+        # still here after pinning is safe; a missing one is written again
+        return target.exists()
+
+    def add_reference(self, file_hash: str, size: int, count: int = 1) -> None:
+        """Record `count` more File rows pointing at a blob (caller commits)"""
+        result = db.session.execute(
+            update(Blob).where(Blob.hash == file_hash).values(refcount=Blob.refcount + count)
+        )
+        if result.rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(Blob(hash=file_hash, size=size, refcount=count))
+        except IntegrityError:
+            # Another request registered the same content concurrently
+            db.session.execute(
+                update(Blob).where(Blob.hash == file_hash).values(refcount=Blob.refcount + count)
+            )
+
+    def add_references(self, references: Dict[str, Tuple[int, int]]) -> None:
+        """Bulk form of add_reference for ``{file_hash: (count, size)}`` (caller commits)"""
+        hashes = list(references)
+        tracked = set()
+        for batch in _batches(hashes):
+            tracked.update(h for (h,) in db.session.query(Blob.hash).filter(Blob.hash.in_(batch)))
+
+        # One set-based increment per distinct reference count
+        by_count = {}
+        for file_hash in tracked:
+            by_count.setdefault(references[file_hash][0], []).append(file_hash)
+        for count, group in by_count.items():
+            for batch in _batches(group):
+                db.session.execute(
+                    update(Blob).where(Blob.hash.in_(batch)).values(refcount=Blob.refcount + count)
+                )
+
+        new = [{'hash': h, 'size': references[h][1], 'refcount': references[h][0]}
+               for h in hashes if h not in tracked]
+        if not new:
+            return
+        try:
+            with db.session.begin_nested():
+                for batch in _batches(new):
+                    db.session.execute(insert(Blob), batch)
+        except IntegrityError:
+            # Another request registered some of this content concurrently
+            for row in new:
+                self.add_reference(row['hash'], row['size'], row['refcount'])
+
+    def release(self, files: Iterable[Tuple[Optional[str], str]]) -> List[Path]:
+        """Drop one reference per ``(file_hash, filepath)`` pair (caller commits)
+
+        Returns the paths that became unreferenced and should be passed to
+        :meth:`unlink` after the transaction commits. Files that are not
+        tracked by the store (uploaded before it existed) are returned as-is.
+        """
+        counts = {}
+        paths_by_hash = {}
+        orphaned = []
+        for file_hash, filepath in files:
+            if file_hash:
+                counts[file_hash] = counts.get(file_hash, 0) + 1
+                paths_by_hash.setdefault(file_hash, set()).add(filepath)
+            elif filepath:
+                orphaned.append(Path(filepath))
+
+        if not counts:
+            return orphaned
+
+        hashes = list(counts)
+        tracked = set()
+        for batch in _batches(hashes):
+            tracked.update(h for (h,) in db.session.query(Blob.hash).filter(Blob.hash.in_(batch)))
+        for file_hash in hashes:
+            if file_hash not in tracked:
+                orphaned.extend(Path(p) for p in paths_by_hash[file_hash] if p)
+
+        # One set-based decrement per distinct reference count
+        by_count = {}
+        for file_hash in tracked:
+            by_count.setdefault(counts[file_hash], []).append(file_hash)
+        for count, group in by_count.items():
+            for batch in _batches(group):
+                db.session.execute(
+                    update(Blob).where(Blob.hash.in_(batch)).values(refcount=Blob.refcount - count)
+                )
+
+        for batch in _batches(list(tracked)):
+            dead = [h for (h,) in db.session.query(Blob.hash).filter(Blob.hash.in_(batch), Blob.refcount <= 0)]
+            if dead:
+                db.session.execute(delete(Blob).where(Blob.hash.in_(dead)))
+                # Tables of contents are keyed by content and die with it
+                db.session.execute(delete(ArchiveMember).where(ArchiveMember.archive_hash.in_(dead)))
+                db.session.execute(delete(ArchiveIndex).where(ArchiveIndex.hash.in_(dead)))
+                orphaned.extend(self.object_path(h) for h in dead)
+        return orphaned
+
+    def unlink(self, paths: Iterable[Path]) -> None:
+        """Remove released blobs from disk once their release has committed
+
+        Objects pinned within PIN_SECONDS are kept; if the write that
+        re-used them never commits, ``flask reconcile --fix-orphans``
+        removes them later.
+        """
+        paths = [Path(p) for p in paths]
+        hashes = [h for h in (self._hash_for(p) for p in paths) if h]
+        # A concurrent upload may have re-referenced the same content
+        revived = set()
+        for batch in _batches(hashes):
+            revived.update(h for (h,) in db.session.query(Blob.hash).filter(Blob.hash.in_(batch)))
+        for path in paths:
+            file_hash = self._hash_for(path)
+            if file_hash in revived:
+                continue
+            try:
+                if file_hash is None:
+                    if path.exists():
+                        path.unlink()
+                else:
+                    self._unlink_object(path, file_hash)
+            except OSError as e:
+                logger.warning(f"Error deleting file {path}: {str(e)}")
+
+    def _unlink_object(self, path: Path, file_hash: str) -> None:
+        # Moved away first: a write that pinned the object before the move is
+        # seen below, and one that pins it afterwards finds it gone
+        doomed = self.new_temp_path()
+        try:
+            os.rename(path, doomed)
+        except FileNotFoundError:
+            return
+        pin = self.pins_dir / file_hash
+        try:
+            pinned = time.time() - pin.stat().st_mtime < PIN_SECONDS
+        except FileNotFoundError:
+            pinned = False
+        if pinned:
+            os.replace(doomed, path)
+            return
+        pin.unlink(missing_ok=True)
+        doomed.unlink()
+
+    def prune_pins(self) -> int:
+        """Remove pins older than PIN_SECONDS; returns how many"""
+        cutoff = time.time() - PIN_SECONDS
+        pruned = 0
+        with os.scandir(self.pins_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        pruned += 1
+                except FileNotFoundError:
+                    pass
+        return pruned
+
+    def _hash_for(self, path: Path) -> Optional[str]:
+        path = Path(path)
+        if path.parent.parent != self.objects_dir:
+            return None
+        return path.parent.name + path.name
+
+
+def get_blob_store() -> BlobStore:
+    """Get the blob store rooted at the app's UPLOAD_FOLDER"""
+    return BlobStore(current_app.config['UPLOAD_FOLDER'])
@@ -1,9 +1,390 @@
 import zipfile
 import tarfile
 import py7zr
+from py7zr.io import Py7zIO, WriterFactory
+import bz2
+import gzip
+import lzma
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from mimetypes import guess_type
 from pathlib import Path
+try:
+    from backend.services.blob_service import BlobStore
+    from backend.services.mimetype_service import MimetypeService, HeadCapture
+except ImportError:
+    from services.blob_service import BlobStore
+    from services.mimetype_service import MimetypeService, HeadCapture
+
+
+class _ProgressReader:
+    """File wrapper that reports every read to a progress callback"""
+    
+    def __init__(self, fileobj, progress=None):
+        self.fileobj = fileobj
+        self.progress = progress
+    
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if self.progress:
+            self.progress(len(data))
+        return data
+
+
+class ExtractionBudgetExceeded(ValueError):
+    """An archive holds more members or bytes than one extraction may produce"""
+
+
+class ExtractionFailed(Exception):
+    """An extraction job stopped part-way; the message is the worker's error"""
+
+
+class ExtractionBudget:
+    """Member-count and size limits for one extraction (zip-bomb protection)
+    
+    Declared sizes are checked before a member is written, and the bytes
+    actually decompressed are counted as they stream, so an archive whose
+    headers understate its contents is stopped as well. 0 disables a limit.
+    """
+    
+    def __init__(self, max_members=0, max_bytes=0):
+        self.max_members = max_members
+        self.max_bytes = max_bytes
+        self.members = 0
+        self.declared = 0
+        self.written = 0
+    
+    def admit(self, declared_size=0):
+        self.members += 1
+        self.declared += declared_size
+        if self.max_members and self.members > self.max_members:
+            raise ExtractionBudgetExceeded(f"Archive has more than {self.max_members} members")
+        self._check(self.declared)
+    
+    def spend(self, nbytes):
+        self.written += nbytes
+        self._check(self.written)
+    
+    def _check(self, total):
+        if self.max_bytes and total > self.max_bytes:
+            raise ExtractionBudgetExceeded(f"Archive expands to more than {self.max_bytes} bytes")
+
+
+class _BudgetReader:
+    """File wrapper that charges every decompressed byte to an extraction budget"""
+    
+    def __init__(self, fileobj, budget, progress=None):
+        self.fileobj = fileobj
+        self.budget = budget
+        self.progress = progress
+    
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.budget.spend(len(data))
+        if self.progress:
+            self.progress(len(data))
+        return data
+
+
+class _SevenZipMemberWriter(Py7zIO):
+    """Receives one 7z member from py7zr and moves it into the blob store when it completes
+    
+    Every decompressed byte is charged to the extraction budget before it
+    reaches the disk, so a member larger than its header claims is stopped
+    as it is written.
+    """
+    
+    def __init__(self, factory, filename):
+        self.factory = factory
+        self.path = '/'.join(part for part in filename.replace('\\', '/').split('/') if part not in ('', '.'))
+        self.temp_path = factory.store.new_temp_path()
+        self._file = open(self.temp_path, 'wb')
+        self._head = bytearray()
+        self._size = 0
+    
+    def write(self, data):
+        self.factory.budget.spend(len(data))
+        self._file.write(data)
+        self._size += len(data)
+        if len(self._head) < MimetypeService.SNIFF_BYTES:
+            self._head += data[:MimetypeService.SNIFF_BYTES - len(self._head)]
+        if self.factory.progress:
+            self.factory.progress(len(data))
+        return len(data)
+    
+    def read(self, size=None):
+        return b''
+    
+    def seek(self, offset, whence=0):
+        return 0
+    
+    def flush(self):
+        pass
+    
+    def size(self):
+        return self._size
+    
+    def close(self):
+        """Called by py7zr once the member is complete"""
+        if self._file.closed:
+            return
+        self._file.close()
+        if self.path not in self.factory.paths:
+            # Symlinks and other non-regular members carry no file content
+            self.temp_path.unlink(missing_ok=True)
+            return
+        file_hash, size, object_path = self.factory.store.ingest_file(self.temp_path)
+        sniffed = MimetypeService.sniff(bytes(self._head))
+        self.factory.entries.append({'path': self.path, 'is_folder': False, 'file_hash': file_hash,
+                                     'filesize': size, 'filepath': str(object_path), 'sniffed': sniffed,
+                                     'mimetype': MimetypeService.resolve(sniffed, self.path)})
+        if self.factory.progress:
+            self.factory.progress(0, 1)
+    
+    def discard(self):
+        self._file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+class _SevenZipStoreFactory(WriterFactory):
+    """py7zr writer factory that streams members into the blob store instead of a directory"""
+    
+    def __init__(self, store, budget, paths, entries, progress=None):
+        self.store = store
+        self.budget = budget
+        self.paths = paths
+        self.entries = entries
+        self.progress = progress
+        self.writers = []
+    
+    def create(self, filename):
+        writer = _SevenZipMemberWriter(self, filename)
+        self.writers.append(writer)
+        return writer
+
+
+class _StreamBuffer:
+    """Write-only, unseekable sink that hands back whatever was written so far
+    
+    ZipFile detects the missing seek() and switches to data descriptors, so an
+    archive can be produced front to back without ever rewinding.
+    """
+    
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compress_block(codec, data, level, final=True):
+    """Compress one independent block; runs in a pool worker
+    
+    'deflate' blocks are raw deflate ending on a byte boundary (sync flush),
+    so consecutive blocks concatenate into one valid deflate stream the way
+    pigz does. The other codecs emit a complete stream per block; gzip, xz
+    and bzip2 readers all accept concatenated streams.
+    """
+    if codec == 'deflate':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    if codec == 'gz':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == 'xz':
+        return lzma.compress(data, preset=level)
+    if codec == 'bz2':
+        return bz2.compress(data, compresslevel=level)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class _ParallelCompressedWriter:
+    """Write-only file object that compresses fixed-size blocks across a pool
+    
+    Blocks are submitted as soon as they fill and written back in order;
+    at most `window` blocks are in flight, which bounds memory.
+    """
+    
+    def __init__(self, fileobj, codec, level, executor, block_size, window):
+        self.fileobj = fileobj
+        self.codec = codec
+        self.level = level
+        self.executor = executor
+        self.block_size = block_size
+        self.window = window
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._position = 0
+    
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def _submit(self, block):
+        self._pending.append(self.executor.submit(_compress_block, self.codec, block, self.level))
+        while len(self._pending) > self.window:
+            self.fileobj.write(self._pending.popleft().result())
+    
+    def close(self):
+        if self._buffer or not self._position:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+
+
+class _ZipWriter:
+    """Front-to-back ZIP writer for member data compressed elsewhere
+    
+    zipfile only writes data it compresses itself, so parallel mode lays out
+    the records of the ZIP specification (APPNOTE 4.3) directly: per member a
+    local header, the data and a data descriptor carrying the CRC and sizes,
+    then the central directory. Members, offsets and entry counts beyond the
+    classic limits get ZIP64 records.
+    """
+    
+    LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+    CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+    END_RECORD = struct.Struct('<4s4H2LH')
+    END_RECORD64 = struct.Struct('<4sQ2H2L4Q')
+    END_LOCATOR64 = struct.Struct('<4sLQL')
+    
+    # Flag bits: sizes follow the data (3), UTF-8 name (11)
+    FLAG_DESCRIPTOR = 0x08
+    FLAG_UTF8 = 0x800
+    LIMIT = 0xFFFFFFFF
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.members = []
+    
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+    
+    def begin(self, zinfo, deflated):
+        """Write the local header of `zinfo` (from ZipInfo.from_file); returns the member record"""
+        name = zinfo.filename.encode('utf-8')
+        year, month, day, hour, minute, second = zinfo.date_time
+        member = {
+            'name': name,
+            'flags': self.FLAG_DESCRIPTOR | (0 if name.isascii() else self.FLAG_UTF8),
+            'method': zipfile.ZIP_DEFLATED if deflated else zipfile.ZIP_STORED,
+            'time': hour << 11 | minute << 5 | second // 2,
+            'date': (year - 1980) << 9 | month << 5 | day,
+            'external_attr': zinfo.external_attr or 0o600 << 16,
+            'offset': self.offset,
+            # Deflate can outgrow its input slightly; decide up front like zipfile
+            'zip64': zinfo.file_size * 1.05 > self.LIMIT,
+            'crc': 0, 'file_size': 0, 'compress_size': 0,
+        }
+        extra = struct.pack('<2H2Q', 1, 16, 0, 0) if member['zip64'] else b''
+        size = self.LIMIT if member['zip64'] else 0
+        self._write(self.LOCAL_HEADER.pack(
+            b'PK\x03\x04', 45 if member['zip64'] else 20, 0, member['flags'], member['method'],
+            member['time'], member['date'], 0, size, size, len(name), len(extra)) + name + extra)
+        return member
+    
+    def write(self, member, data):
+        self._write(data)
+        member['compress_size'] += len(data)
+    
+    def end(self, member, crc, file_size):
+        member['crc'], member['file_size'] = crc, file_size
+        if member['zip64']:
+            descriptor = struct.pack('<4sL2Q', b'PK\x07\x08', crc, member['compress_size'], file_size)
+        elif member['compress_size'] > self.LIMIT or file_size > self.LIMIT:
+            raise zipfile.LargeZipFile(f"{member['name'].decode()} grew past 4 GiB")
+        else:
+            descriptor = struct.pack('<4s3L', b'PK\x07\x08', crc, member['compress_size'], file_size)
+        self._write(descriptor)
+        self.members.append(member)
+    
+    def close(self):
+        """Write the central directory and end records"""
+        start = self.offset
+        for member in self.members:
+            extra_fields = [value for value in (member['file_size'], member['compress_size'], member['offset'])
+                            if value >= self.LIMIT]
+            extra = struct.pack(f'<2H{len(extra_fields)}Q', 1, 8 * len(extra_fields), *extra_fields) \
+                if extra_fields else b''
+            version = 45 if extra else 20
+            self._write(self.CENTRAL_HEADER.pack(
+                b'PK\x01\x02', version, 3, version, 0, member['flags'], member['method'],
+                member['time'], member['date'], member['crc'],
+                min(member['compress_size'], self.LIMIT), min(member['file_size'], self.LIMIT),
+                len(member['name']), len(extra), 0, 0, 0, member['external_attr'],
+                min(member['offset'], self.LIMIT)) + member['name'] + extra)
+        size, count = self.offset - start, len(self.members)
+        if count >= 0xFFFF or start >= self.LIMIT or size >= self.LIMIT:
+            record_offset = self.offset
+            self._write(self.END_RECORD64.pack(b'PK\x06\x06', self.END_RECORD64.size - 12, 45, 45, 0, 0,
+                                               count, count, size, start))
+            self._write(self.END_LOCATOR64.pack(b'PK\x06\x07', 0, record_offset, 1))
+        self._write(self.END_RECORD.pack(b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                         min(size, self.LIMIT), min(start, self.LIMIT), 0))
+
 
 class CompressionService:
+    # Payloads that are already compressed; deflating them again only burns CPU
+    INCOMPRESSIBLE_MIMETYPE_PREFIXES = ('image/', 'video/', 'audio/')
+    COMPRESSIBLE_MIMETYPE_EXCEPTIONS = ('image/svg+xml', 'image/bmp', 'audio/wav', 'audio/x-wav')
+    INCOMPRESSIBLE_MIMETYPES = {
+        'application/zip', 'application/x-zip-compressed', 'application/gzip',
+        'application/x-gzip', 'application/x-bzip2', 'application/x-xz',
+        'application/x-7z-compressed', 'application/x-rar-compressed',
+        'application/vnd.rar', 'application/zstd', 'application/pdf',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    }
+    
+    STREAM_CHUNK_SIZE = 1024 * 1024
+    
+    # Parallel mode: unit of work handed to each pool worker, and how many
+    # blocks per worker may be in flight at once
+    PARALLEL_BLOCK_SIZE = 1024 * 1024
+    PARALLEL_WINDOW_PER_WORKER = 4
+    
+    # Default levels match the serial zipfile/tarfile paths
+    CODEC_LEVELS = {'deflate': 6, 'gz': 9, 'bz2': 9, 'xz': 6}
+    
+    @staticmethod
+    def is_compressible(mimetype):
+        """Check whether deflating content of this mimetype is worth the CPU"""
+        if not mimetype:
+            return True
+        mimetype = mimetype.split(';')[0].strip().lower()
+        if mimetype in CompressionService.COMPRESSIBLE_MIMETYPE_EXCEPTIONS:
+            return True
+        if mimetype in CompressionService.INCOMPRESSIBLE_MIMETYPES:
+            return False
+        return not mimetype.startswith(CompressionService.INCOMPRESSIBLE_MIMETYPE_PREFIXES)
+    
     @staticmethod
     def _is_safe_path(base_path, target_path):
         """Check if target path is within base path (prevents directory traversal)
@@ -43,62 +424,338 @@ class CompressionService:
         return True
     
     @staticmethod
-    def create_zip(file_paths, archive_path, password=None):
+    def _iter_entries(file_paths):
+        """Yield (file_path, arcname) pairs
+        
+        Entries may be plain paths or (path, arcname) tuples; content-addressed
+        blobs have no meaningful file name, so callers pass the display name.
+        """
+        for entry in file_paths:
+            if isinstance(entry, (tuple, list)):
+                yield entry[0], entry[1]
+            else:
+                yield entry, Path(entry).name
+
+    @staticmethod
+    def archive_format(filename):
+        """Map an archive file name to its format key, or None if unsupported"""
+        name = filename.lower()
+        for suffix, format_type in (('.tar.gz', 'tar.gz'), ('.tgz', 'tar.gz'),
+                                    ('.tar.bz2', 'tar.bz2'), ('.tar.xz', 'tar.xz'),
+                                    ('.tar', 'tar'), ('.gz', 'tar.gz'), ('.bz2', 'tar.bz2'),
+                                    ('.xz', 'tar.xz'), ('.zip', 'zip'), ('.7z', '7z')):
+            if name.endswith(suffix):
+                return format_type
+        return None
+
+    @staticmethod
+    def create_archive(file_paths, archive_path, format_type, password=None, progress=None, workers=None):
+        """Create an archive in any supported format
+        
+        With `workers` > 1, ZIP members and compressed tar streams are
+        compressed across a process pool (7z is always serial).
+        """
+        if format_type == 'zip':
+            CompressionService.create_zip(file_paths, archive_path, password, progress, workers)
+        elif format_type in ['tar', 'tar.gz', 'tar.bz2', 'tar.xz']:
+            compression = format_type.split('.')[-1] if '.' in format_type else None
+            CompressionService.create_tar(file_paths, archive_path, compression, progress, workers)
+        elif format_type == '7z':
+            CompressionService.create_7z(file_paths, archive_path, password, progress)
+        else:
+            raise ValueError("Unsupported format")
+
+    @staticmethod
+    def create_zip(file_paths, archive_path, password=None, progress=None, workers=None):
+        if workers and workers > 1:
+            return CompressionService._create_zip_parallel(file_paths, archive_path, workers, progress)
         with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             if password:
                 zipf.setpassword(password.encode())
-            for file_path in file_paths:
-                zipf.write(file_path, Path(file_path).name)
+            for file_path, arcname in CompressionService._iter_entries(file_paths):
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                    while True:
+                        data = src.read(CompressionService.STREAM_CHUNK_SIZE)
+                        if not data:
+                            break
+                        dest.write(data)
+                        if progress:
+                            progress(len(data))
+                if progress:
+                    progress(0, 1)
 
     @staticmethod
-    def create_tar(file_paths, archive_path, compression=None):
+    def create_tar(file_paths, archive_path, compression=None, progress=None, workers=None):
+        if compression and workers and workers > 1:
+            return CompressionService._create_tar_parallel(file_paths, archive_path, compression, workers, progress)
         mode = 'w'
         if compression:
             mode += f':{compression}'
         with tarfile.open(archive_path, mode) as tarf:
-            for file_path in file_paths:
-                tarf.add(file_path, arcname=Path(file_path).name)
+            CompressionService._add_tar_members(tarf, file_paths, progress)
+
+    @staticmethod
+    def _add_tar_members(tarf, file_paths, progress=None):
+        for file_path, arcname in CompressionService._iter_entries(file_paths):
+            tarinfo = tarf.gettarinfo(file_path, arcname=arcname)
+            with open(file_path, 'rb') as src:
+                tarf.addfile(tarinfo, _ProgressReader(src, progress))
+            if progress:
+                progress(0, 1)
+
+    @staticmethod
+    def _create_tar_parallel(file_paths, archive_path, compression, workers, progress=None):
+        """pigz-style tar: the tar stream is cut into blocks compressed in parallel"""
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(archive_path, 'wb') as out:
+            writer = _ParallelCompressedWriter(out, compression, CompressionService.CODEC_LEVELS[compression],
+                                               executor, CompressionService.PARALLEL_BLOCK_SIZE,
+                                               workers * CompressionService.PARALLEL_WINDOW_PER_WORKER)
+            with tarfile.open(fileobj=writer, mode='w') as tarf:
+                CompressionService._add_tar_members(tarf, file_paths, progress)
+            writer.close()
+
+    @staticmethod
+    def _create_zip_parallel(file_paths, archive_path, workers, progress=None):
+        """Deflate ZIP members in blocks across a process pool
+        
+        Blocks from consecutive members are pipelined, so many small files
+        and a few large ones both keep every worker busy. The parent reads
+        each block, updates the member CRC and writes the compressed results
+        back in order through _ZipWriter, producing a standard archive.
+        """
+        block_size = CompressionService.PARALLEL_BLOCK_SIZE
+        window = workers * CompressionService.PARALLEL_WINDOW_PER_WORKER
+        level = CompressionService.CODEC_LEVELS['deflate']
+        pending = deque()
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(archive_path, 'wb') as out:
+            writer = _ZipWriter(out)
+            
+            def consume():
+                member, result, raw_size, first, last = pending.popleft()
+                if first:
+                    member['record'] = writer.begin(member['zinfo'], member['deflate'])
+                writer.write(member['record'], result.result() if hasattr(result, 'result') else result)
+                if last:
+                    writer.end(member['record'], member['crc'], member['file_size'])
+                    if progress:
+                        progress(0, 1)
+                if progress and raw_size:
+                    progress(raw_size)
+            
+            for file_path, arcname in CompressionService._iter_entries(file_paths):
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname, strict_timestamps=False)
+                member = {'zinfo': zinfo, 'deflate': CompressionService.is_compressible(guess_type(arcname)[0]),
+                          'crc': 0, 'file_size': 0}
+                
+                with open(file_path, 'rb') as src:
+                    first = True
+                    block = src.read(block_size)
+                    while True:
+                        next_block = src.read(block_size) if block else b''
+                        last = not next_block
+                        member['crc'] = zlib.crc32(block, member['crc'])
+                        member['file_size'] += len(block)
+                        if member['deflate']:
+                            result = executor.submit(_compress_block, 'deflate', block, level, last)
+                        else:
+                            result = block
+                        pending.append((member, result, len(block), first, last))
+                        while len(pending) > window:
+                            consume()
+                        if last:
+                            break
+                        block, first = next_block, False
+            
+            while pending:
+                consume()
+            writer.close()
 
     @staticmethod
-    def create_7z(file_paths, archive_path, password=None):
+    def create_7z(file_paths, archive_path, password=None, progress=None):
         with py7zr.SevenZipFile(archive_path, 'w', password=password) as szf:
-            for file_path in file_paths:
-                szf.write(file_path, Path(file_path).name)
+            for file_path, arcname in CompressionService._iter_entries(file_paths):
+                szf.write(file_path, arcname)
+                if progress:
+                    progress(Path(file_path).stat().st_size, 1)
 
     @staticmethod
-    def extract_zip(archive_path, extract_to, password=None):
+    def stream_zip(entries, chunk_size=None):
+        """Yield a ZIP archive piece by piece without buffering it
+        
+        `entries` are (file_path, arcname, mimetype) tuples; a file_path of None
+        adds an empty directory. Already-compressed mimetypes are stored rather
+        than deflated. Memory stays bounded by the chunk size no matter how
+        large the archive grows.
+        """
+        chunk_size = chunk_size or CompressionService.STREAM_CHUNK_SIZE
+        sink = _StreamBuffer()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+            for file_path, arcname, mimetype in entries:
+                if file_path is None:
+                    zipf.writestr(arcname.rstrip('/') + '/', b'')
+                    continue
+                
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                if CompressionService.is_compressible(mimetype):
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                
+                with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                    while True:
+                        data = src.read(chunk_size)
+                        if not data:
+                            break
+                        dest.write(data)
+                        pending = sink.drain()
+                        if pending:
+                            yield pending
+                pending = sink.drain()
+                if pending:
+                    yield pending
+        # Closing the archive writes the central directory
+        yield sink.drain()
+
+    @staticmethod
+    def _member_path(archive_path, member_name, scratch):
+        """'/'-separated relative path of a member; raises ValueError on traversal"""
+        member_name = member_name.replace('\\', '/')
+        CompressionService._safe_extract_member(archive_path, member_name, scratch)
+        return '/'.join(part for part in member_name.split('/') if part not in ('', '.'))
+    
+    @staticmethod
+    def store_member(store, path, fileobj, budget, progress=None):
+        """Stream one member into the blob store, hashing and sniffing it on the way"""
+        stream = HeadCapture(_BudgetReader(fileobj, budget, progress))
+        file_hash, size, object_path = store.write_stream(stream)
+        sniffed = MimetypeService.sniff(stream.head)
+        return {'path': path, 'is_folder': False, 'file_hash': file_hash, 'filesize': size,
+                'filepath': str(object_path), 'sniffed': sniffed,
+                'mimetype': MimetypeService.resolve(sniffed, path)}
+    
+    @staticmethod
+    def extract_to_store(archive_path, format_type, store, budget, password=None, progress=None, stored=None):
+        """Extract an archive member by member straight into the blob store
+        
+        Nothing is written outside the store. Returns one dict per entry
+        with its relative ``path`` and ``is_folder``; files also carry
+        ``file_hash``, ``filesize``, ``filepath``, ``mimetype`` and the raw
+        ``sniffed`` type. A later member with the same path replaces an
+        earlier one. Entries are also appended to `stored` as they land, so
+        a caller can release the blobs of an extraction that fails part-way.
+        """
+        entries = stored if stored is not None else []
+        if format_type == 'zip':
+            CompressionService.extract_zip(archive_path, store, budget, entries, password, progress)
+        elif format_type in ['tar', 'tar.gz', 'tar.bz2', 'tar.xz']:
+            CompressionService.extract_tar(archive_path, store, budget, entries, progress)
+        elif format_type == '7z':
+            CompressionService.extract_7z(archive_path, store, budget, entries, password, progress)
+        else:
+            raise ValueError("Unsupported archive format")
+        return list({entry['path']: entry for entry in entries if entry['path']}.values())
+    
+    @staticmethod
+    def extract_zip(archive_path, store, budget, entries, password=None, progress=None):
         with zipfile.ZipFile(archive_path, 'r') as zipf:
             if password:
                 zipf.setpassword(password.encode())
-            # Validate all members before extraction
-            for member in zipf.namelist():
-                CompressionService._safe_extract_member(archive_path, member, extract_to)
-            zipf.extractall(extract_to)
-
-    @staticmethod
-    def extract_tar(archive_path, extract_to):
-        with tarfile.open(archive_path, 'r:*') as tarf:
-            # Validate all members before extraction to prevent path traversal
-            for member in tarf.getmembers():
-                CompressionService._safe_extract_member(archive_path, member.name, extract_to)
-            # Use data filter for Python 3.11.4+ or validate manually for earlier versions
-            try:
-                tarf.extractall(extract_to, filter='data')
-            except TypeError:
-                # Python < 3.11.4 doesn't support filter parameter, but we already validated
-                tarf.extractall(extract_to)
-
+            members = zipf.infolist()
+            # Validate all members before anything is written
+            paths = [CompressionService._member_path(archive_path, m.filename, store.tmp_dir) for m in members]
+            if progress:
+                progress.set_totals(sum(m.file_size for m in members), len(members))
+            for member, path in zip(members, paths):
+                budget.admit(0 if member.is_dir() else member.file_size)
+                if member.is_dir():
+                    entries.append({'path': path, 'is_folder': True})
+                else:
+                    with zipf.open(member) as source:
+                        entries.append(CompressionService.store_member(store, path, source, budget, progress))
+                if progress:
+                    progress(0, 1)
+    
+    @staticmethod
+    def extract_tar(archive_path, store, budget, entries, progress=None):
+        """Read the tar as a stream: one pass, no member index held in memory
+        
+        Progress is reported in archive bytes consumed, the only total known
+        up front for a compressed stream.
+        """
+        with open(archive_path, 'rb') as raw:
+            if progress:
+                progress.set_totals(os.fstat(raw.fileno()).st_size, 0)
+            with tarfile.open(fileobj=_ProgressReader(raw, progress), mode='r|*') as tarf:
+                for member in tarf:
+                    path = CompressionService._member_path(archive_path, member.name, store.tmp_dir)
+                    if member.isdir():
+                        budget.admit()
+                        entries.append({'path': path, 'is_folder': True})
+                    elif member.isfile():
+                        budget.admit(member.size)
+                        entries.append(CompressionService.store_member(store, path, tarf.extractfile(member), budget))
+                    else:
+                        # Links and device nodes have no content of their own
+                        continue
+                    if progress:
+                        progress(0, 1)
+    
     @staticmethod
-    def extract_7z(archive_path, extract_to, password=None):
+    def extract_7z(archive_path, store, budget, entries, password=None, progress=None):
+        """py7zr decodes solid blocks as a whole; each member streams into the store as it is decoded"""
         with py7zr.SevenZipFile(archive_path, 'r', password=password) as szf:
-            # Validate all members before extraction
-            for member in szf.getnames():
-                CompressionService._safe_extract_member(archive_path, member, extract_to)
-            szf.extractall(extract_to)
-
+            members = szf.list()
+            paths = [CompressionService._member_path(archive_path, m.filename, store.tmp_dir) for m in members]
+            for member in members:
+                budget.admit(0 if member.is_directory else member.uncompressed or 0)
+            if progress:
+                progress.set_totals(budget.declared, len(members))
+            entries.extend({'path': path, 'is_folder': True}
+                           for member, path in zip(members, paths) if member.is_directory)
+            files = {path for member, path in zip(members, paths) if member.is_file and not member.is_symlink}
+            factory = _SevenZipStoreFactory(store, budget, files, entries, progress)
+            try:
+                szf.extractall(factory=factory)
+            finally:
+                # Members cut short by an error never reached the store
+                for writer in factory.writers:
+                    writer.discard()
+    
+    @staticmethod
+    def run_create_job(params, progress=None):
+        """Job entry point: build an archive, then move it into the blob store"""
+        output_path = Path(params['output_path'])
+        try:
+            CompressionService.create_archive(params['entries'], str(output_path), params['format'],
+                                              params.get('password'), progress, params.get('workers'))
+            file_hash, file_size, stored_path = BlobStore(params['upload_folder']).ingest_file(output_path)
+        finally:
+            output_path.unlink(missing_ok=True)
+        return {'file_hash': file_hash, 'filesize': file_size, 'filepath': str(stored_path)}
+    
+    @staticmethod
+    def run_extract_job(params, progress=None):
+        """Job entry point: stream an archive's members into the blob store"""
+        budget = ExtractionBudget(params.get('max_members', 0), params.get('max_bytes', 0))
+        stored = []
+        try:
+            entries = CompressionService.extract_to_store(params['archive_path'], params['format'],
+                                                          BlobStore(params['upload_folder']), budget,
+                                                          params.get('password'), progress, stored)
+        except Exception as e:
+            # Only the web process can tell which of the blobs written so far
+            # nothing else references; the completion handler releases them
+            return {'error': str(e) or type(e).__name__,
+                    'written': [entry['filepath'] for entry in stored if not entry['is_folder']]}
+        return {'entries': entries}
+    
     @staticmethod
-    def list_archive_contents(archive_path):
-        ext = Path(archive_path).suffix.lower()
+    def list_archive_contents(archive_path, archive_name=None):
+        # Blob paths have no extension; detect the format from the display name
+        ext = Path(archive_name or archive_path).suffix.lower()
         if ext == '.zip':
             with zipfile.ZipFile(archive_path, 'r') as zf:
                 return zf.namelist()
@@ -0,0 +1,186 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+from typing import Callable, Optional
+from sqlalchemy import create_engine, update
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+try:
+    from backend.models.database import db, Job
+except ImportError:
+    from models.database import db, Job
+
+logger = logging.getLogger(__name__)
+
+# Engines opened inside pool worker processes, keyed by database URL
+_worker_engines = {}
+
+# Job parameters that reach the worker but are never written to the job table
+SECRET_PARAMS = ('password',)
+
+
+class JobProgress:
+    """Progress callback handed to job work functions inside the pool
+
+    Work functions call ``progress(nbytes, members)`` as they go; updates are
+    written to the job row at most every `interval` seconds so polling stays
+    cheap for the database.
+    """
+
+    def __init__(self, engine, job_id: str, interval: float = 0.5):
+        self.engine = engine
+        self.job_id = job_id
+        self.interval = interval
+        self.bytes_done = 0
+        self.members_done = 0
+        self._last_flush = 0.0
+
+    def set_totals(self, bytes_total: int, members_total: int) -> None:
+        self._write(bytes_total=bytes_total, members_total=members_total)
+
+    def __call__(self, nbytes: int = 0, members: int = 0) -> None:
+        self.bytes_done += nbytes
+        self.members_done += members
+        now = time.monotonic()
+        if now - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        self._write(bytes_done=self.bytes_done, members_done=self.members_done)
+
+    def _write(self, **values) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(update(Job.__table__).where(Job.__table__.c.id == self.job_id).values(**values))
+
+
+def _run_job(job_id: str, database_url: str, work: Callable, params: dict):
+    """Entry point executed in a pool worker process"""
+    engine = _worker_engines.get(database_url)
+    if engine is None:
+        engine = _worker_engines[database_url] = create_engine(database_url)
+
+    progress = JobProgress(engine, job_id)
+    progress._write(status='running', started_at=datetime.utcnow())
+    result = work(params, progress)
+    progress.flush()
+    return result
+
+
+class JobService:
+    """Local background job subsystem backed by a process pool
+
+    Jobs are persisted in the ``Job`` table so any worker can answer progress
+    polls. The CPU-heavy work runs in the pool; the completion handler runs
+    back in the submitting process with an app context so it can register
+    results through the ORM.
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def owner_id() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @classmethod
+    def get_executor(cls, workers: int) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                # spawn: workers must not inherit the web worker's threads or DB connections
+                cls._executor = ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            return cls._executor
+
+    @classmethod
+    def run(cls, app, fn: Callable, *args):
+        """Run `fn(*args)` on the job pool without a job row; returns its future"""
+        try:
+            future = cls.get_executor(app.config['JOB_WORKERS']).submit(fn, *args)
+        except BrokenProcessPool:
+            with cls._lock:
+                cls._executor = None
+            future = cls.get_executor(app.config['JOB_WORKERS']).submit(fn, *args)
+        future.add_done_callback(cls._check_pool)
+        return future
+
+    @classmethod
+    def _check_pool(cls, future) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # A crashed worker poisons the whole pool; start a fresh one next time
+            with cls._lock:
+                cls._executor = None
+
+    @classmethod
+    def submit(cls, app, user_id: int, kind: str, params: dict, work: Callable,
+               on_complete: Optional[Callable] = None, bytes_total: int = 0,
+               members_total: int = 0) -> Job:
+        """Queue `work(params, progress)` and return the persisted job
+
+        `on_complete(job, result)` runs in this process once the work succeeds
+        and returns the JSON-serialisable result stored on the job.
+        """
+        job = Job(id=uuid.uuid4().hex, user_id=user_id, kind=kind, status='queued',
+                  owner=cls.owner_id(),
+                  params=json.dumps({k: v for k, v in params.items() if k not in SECRET_PARAMS}),
+                  bytes_total=bytes_total, members_total=members_total)
+        db.session.add(job)
+        db.session.commit()
+
+        database_url = db.engine.url.render_as_string(hide_password=False)
+        executor = cls.get_executor(app.config['JOB_WORKERS'])
+        future = executor.submit(_run_job, job.id, database_url, work, params)
+        future.add_done_callback(partial(cls._finish, app, job.id, on_complete))
+        logger.info(f"Job queued: {job.id} ({kind})")
+        return job
+
+    @classmethod
+    def _finish(cls, app, job_id: str, on_complete: Optional[Callable], future) -> None:
+        cls._check_pool(future)
+        with app.app_context():
+            job = db.session.get(Job, job_id)
+            try:
+                result = future.result()
+                if on_complete is not None:
+                    result = on_complete(job, result)
+                job.result = json.dumps(result)
+                job.status = 'done'
+                logger.info(f"Job finished: {job_id} ({job.kind})")
+            except Exception as e:
+                db.session.rollback()
+                job = db.session.get(Job, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+                logger.error(f"Job failed: {job_id} ({job.kind}): {str(e)}", exc_info=True)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+    @classmethod
+    def check_orphaned(cls, job: Job) -> Job:
+        """Fail a job whose owning process on this host has died
+
+        Completion handlers run in the submitting process, so a job whose
+        owner is gone can never finish.
+        """
+        if job.status not in ('queued', 'running') or not job.owner:
+            return job
+        host, _, pid = job.owner.rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            return job
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            job.status = 'failed'
+            job.error = 'Interrupted: the worker that owned this job exited'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        except PermissionError:
+            pass
+        return job
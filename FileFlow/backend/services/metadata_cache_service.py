@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from flask import current_app
+from pathlib import Path
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from typing import Iterable, NamedTuple, Optional
+import threading
+import time
+try:
+    from backend.models.database import db, File
+except ImportError:
+    from models.database import db, File
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class FileEntry(NamedTuple):
+    """What serving a file needs, without the ORM row or a stat() call"""
+    id: int
+    user_id: int
+    filename: str
+    mimetype: Optional[str]
+    is_folder: bool
+    filepath: str
+    exists: bool
+    size: int
+    mtime: float
+    etag: str
+
+
+class MetadataCacheService:
+    """Per-process cache of file rows, their on-disk stat and ETag
+
+    A hit lets a download or conditional GET be answered without a query or
+    a filesystem call. Entries are dropped when the row is updated or
+    deleted in this process (immediately and again after commit); other
+    worker processes see changes once FILE_CACHE_TTL expires.
+
+    The ETag is the row's SHA-256 content hash, which never changes for
+    content-addressed blobs. Files that predate the blob store fall back to
+    mtime and size.
+    """
+
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def _store() -> TTLCache:
+        cache = MetadataCacheService._cache
+        if cache is None:
+            with MetadataCacheService._cache_lock:
+                cache = MetadataCacheService._cache
+                if cache is None:
+                    config = current_app.config
+                    cache = MetadataCacheService._cache = TTLCache(config.get('FILE_CACHE_SIZE', 10000),
+                                                                   config.get('FILE_CACHE_TTL', 60))
+        return cache
+
+    @staticmethod
+    def get(file_id: int) -> Optional[FileEntry]:
+        """Cached entry for a file, loading it on a miss; None if the row does not exist"""
+        cache = MetadataCacheService._store()
+        entry = cache.get(file_id)
+        if entry is None:
+            entry = MetadataCacheService._load(file_id)
+            if entry is not None:
+                cache.set(file_id, entry)
+        return entry
+
+    @staticmethod
+    def _load(file_id: int) -> Optional[FileEntry]:
+        row = db.session.execute(
+            select(File.id, File.user_id, File.filename, File.mimetype, File.is_folder,
+                   File.filepath, File.file_hash, File.is_missing).where(File.id == file_id)
+        ).first()
+        if row is None:
+            return None
+        exists, size, mtime = False, 0, 0.0
+        # Rows the reconciler flagged as missing are not looked up on disk
+        if not row.is_folder and not row.is_missing:
+            try:
+                stat = Path(row.filepath).stat()
+                exists, size, mtime = True, stat.st_size, stat.st_mtime
+            except OSError:
+                pass
+        etag = row.file_hash or f'{mtime}-{size}'
+        return FileEntry(row.id, row.user_id, row.filename, row.mimetype, bool(row.is_folder),
+                         row.filepath, exists, size, mtime, etag)
+
+    @staticmethod
+    def invalidate(file_ids: Iterable[int]) -> None:
+        """Drop entries now and once more when the current transaction commits"""
+        cache = MetadataCacheService._cache
+        file_ids = list(file_ids)
+        if cache is not None:
+            for file_id in file_ids:
+                cache.pop(file_id)
+        # A concurrent request may re-cache the pre-commit row in between
+        db.session.info.setdefault('metadata_cache_invalidate', set()).update(file_ids)
+
+    @staticmethod
+    def clear() -> None:
+        if MetadataCacheService._cache is not None:
+            MetadataCacheService._cache.clear()
+
+
+@event.listens_for(File, 'after_update')
+def _invalidate_updated(mapper, connection, target):
+    MetadataCacheService.invalidate([target.id])
+
+
+@event.listens_for(File, 'after_delete')
+def _invalidate_deleted(mapper, connection, target):
+    MetadataCacheService.invalidate([target.id])
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    file_ids = session.info.pop('metadata_cache_invalidate', None)
+    cache = MetadataCacheService._cache
+    if file_ids and cache is not None:
+        for file_id in file_ids:
+            cache.pop(file_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('metadata_cache_invalidate', None)
@@ -0,0 +1,135 @@
+from mimetypes import guess_type
+from sqlalchemy import select, update, bindparam
+from typing import Dict, Optional
+import logging
+
+try:
+    import magic
+except ImportError:  # python-magic or the libmagic library is missing: extension only
+    magic = None
+
+try:
+    from backend.models.database import db, Blob
+except ImportError:
+    from models.database import db, Blob
+
+logger = logging.getLogger(__name__)
+
+# What libmagic reports when it cannot tell more than "some bytes" or "some text"
+GENERIC_MIMETYPES = {'application/octet-stream', 'text/plain', 'application/zip', 'application/x-empty',
+                     'inode/x-empty', 'application/x-ole-storage', 'application/CDFV2'}
+
+# Types a browser would execute inline; sniffing alone never assigns these
+ACTIVE_MIMETYPES = {'text/html', 'application/xhtml+xml', 'image/svg+xml', 'text/javascript',
+                    'application/javascript', 'text/xml', 'application/xml'}
+
+
+class MimetypeService:
+    """Decide a file's mimetype from its first bytes and its name
+
+    libmagic wins whenever it recognises a specific format. When it only
+    sees generic text, bytes or a zip container, the extension is more
+    precise (CSV, JSON, DOCX), so it is used instead. Content sniffing can
+    never upgrade a file to a type browsers execute, such as HTML in a
+    ``.txt`` upload, unless the extension says the same.
+    """
+
+    SNIFF_BYTES = 8192
+
+    @staticmethod
+    def available() -> bool:
+        return magic is not None
+
+    @staticmethod
+    def sniff(head: bytes) -> Optional[str]:
+        """libmagic's verdict on `head` alone; None without libmagic or bytes"""
+        if magic is None or not head:
+            return None
+        try:
+            return magic.from_buffer(head[:MimetypeService.SNIFF_BYTES], mime=True)
+        except Exception as e:
+            logger.warning(f"libmagic failed: {str(e)}")
+            return None
+
+    @staticmethod
+    def detect(head: bytes, filename: Optional[str]) -> str:
+        return MimetypeService.resolve(MimetypeService.sniff(head), filename)
+
+    @staticmethod
+    def resolve(sniffed: Optional[str], filename: Optional[str]) -> str:
+        """Combine a sniffed type with the one the extension implies"""
+        guessed = guess_type(filename)[0] if filename else None
+        if not sniffed or sniffed in GENERIC_MIMETYPES:
+            # Binary bytes behind a text extension are not text
+            if sniffed == 'application/octet-stream' and guessed and guessed.startswith('text/'):
+                return sniffed
+            if guessed:
+                return guessed
+            if not sniffed or sniffed.endswith('x-empty'):
+                return 'application/octet-stream'
+            return sniffed
+        if sniffed in ACTIVE_MIMETYPES and sniffed != guessed:
+            return guessed or 'text/plain'
+        return sniffed
+
+    @staticmethod
+    def for_blob(file_hash: str, filename: Optional[str], head: Optional[bytes] = None,
+                 path: Optional[str] = None) -> str:
+        """Mimetype for content registered in the blob store (call after add_reference)
+
+        libmagic's verdict is kept on the Blob row, so content seen before,
+        under any name, is never sniffed again. Otherwise `head` is sniffed,
+        or the first SNIFF_BYTES of `path` when no head was captured.
+        """
+        sniffed = db.session.execute(select(Blob.mimetype).where(Blob.hash == file_hash)).scalar()
+        if sniffed is None and magic is not None:
+            if head is None and path is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        head = f.read(MimetypeService.SNIFF_BYTES)
+                except OSError as e:
+                    logger.warning(f"Cannot read {path} to sniff it: {str(e)}")
+            sniffed = MimetypeService.sniff(head)
+            if sniffed:
+                db.session.execute(
+                    update(Blob).where(Blob.hash == file_hash, Blob.mimetype.is_(None)).values(mimetype=sniffed)
+                )
+        return MimetypeService.resolve(sniffed, filename)
+
+    @staticmethod
+    def remember(sniffed_by_hash: Dict[str, Optional[str]]) -> None:
+        """Store verdicts sniffed elsewhere (e.g. in a job worker) on blobs that have none (caller commits)"""
+        rows = [{'blob_hash': h, 'sniffed': m} for h, m in sniffed_by_hash.items() if m]
+        if rows:
+            blob_table = Blob.__table__
+            db.session.execute(
+                update(blob_table).where(blob_table.c.hash == bindparam('blob_hash'), blob_table.c.mimetype.is_(None))
+                .values(mimetype=bindparam('sniffed')),
+                rows
+            )
+
+
+class HeadCapture:
+    """Read-through stream wrapper that keeps the first `limit` bytes read
+
+    Lets an upload be sniffed from the bytes already on their way into the
+    blob store instead of reading the stored file back.
+    """
+
+    def __init__(self, stream, limit: int = MimetypeService.SNIFF_BYTES):
+        self._stream = stream
+        self._limit = limit
+        self._chunks = []
+        self._captured = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        if self._captured < self._limit and data:
+            chunk = data[:self._limit - self._captured]
+            self._chunks.append(chunk)
+            self._captured += len(chunk)
+        return data
+
+    @property
+    def head(self) -> bytes:
+        return b''.join(self._chunks)
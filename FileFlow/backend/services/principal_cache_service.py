@@ -0,0 +1,192 @@
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from typing import Iterable, Optional
+import json
+import logging
+import threading
+try:
+    from backend.models.database import db, User
+    from backend.services.metadata_cache_service import TTLCache
+except ImportError:
+    from models.database import db, User
+    from services.metadata_cache_service import TTLCache
+
+try:
+    import redis
+except ImportError:  # Only needed for a redis:// PRINCIPAL_CACHE_URL
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class Principal(UserMixin):
+    """What an authenticated request knows about its user
+
+    Only the fields authentication and the templates use; views that need
+    more (usage counters, the quota) read the User row themselves.
+    """
+
+    def __init__(self, id: int, username: str, email: str):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    def to_json(self) -> str:
+        return json.dumps({'id': self.id, 'username': self.username, 'email': self.email})
+
+    @classmethod
+    def from_json(cls, raw) -> 'Principal':
+        data = json.loads(raw)
+        return cls(data['id'], data['username'], data['email'])
+
+
+class RedisStore:
+    """Principals shared by every worker through Redis; errors count as misses"""
+
+    def __init__(self, url: str, ttl: int):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        try:
+            return self._client.get(key) or default
+        except Exception as e:
+            logger.warning(f"Principal cache read failed: {str(e)}")
+            return default
+
+    def set(self, key, value) -> None:
+        try:
+            self._client.set(key, value, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Principal cache write failed: {str(e)}")
+
+    def pop(self, key) -> None:
+        try:
+            self._client.delete(key)
+        except Exception as e:
+            logger.warning(f"Principal cache invalidation failed: {str(e)}")
+
+
+class PrincipalCacheService:
+    """Resolve a session's user id to a Principal without a query
+
+    Principals live in a bounded per-process TTL cache. With
+    PRINCIPAL_CACHE_URL set, misses go to a shared store before the
+    database, so a freshly started worker does not query either:
+    ``redis://...`` shares them between processes and ``local://`` is an
+    in-process stand-in with the same interface, for development and
+    single-process deployments.
+
+    ORM updates and deletes of a User (password, username, email, account
+    removal) drop its entry from both tiers immediately and again after
+    commit. Other processes see the change once their PRINCIPAL_CACHE_TTL
+    expires. The usage counters are updated with Core statements and are
+    not part of a principal, so uploads never invalidate it.
+    """
+
+    _cache = None
+    _shared = None
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def _store() -> TTLCache:
+        cache = PrincipalCacheService._cache
+        if cache is None:
+            with PrincipalCacheService._cache_lock:
+                cache = PrincipalCacheService._cache
+                if cache is None:
+                    config = current_app.config
+                    PrincipalCacheService._shared = PrincipalCacheService._shared_store(config)
+                    cache = PrincipalCacheService._cache = TTLCache(config.get('PRINCIPAL_CACHE_SIZE', 10000),
+                                                                    config.get('PRINCIPAL_CACHE_TTL', 30))
+        return cache
+
+    @staticmethod
+    def _shared_store(config):
+        url = config.get('PRINCIPAL_CACHE_URL')
+        ttl = config.get('PRINCIPAL_CACHE_SHARED_TTL', 3600)
+        if not url:
+            return None
+        if url.startswith('local://'):
+            return TTLCache(config.get('PRINCIPAL_CACHE_SIZE', 10000), ttl)
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            if redis is None:
+                logger.warning("PRINCIPAL_CACHE_URL needs the redis package; caching principals per process only")
+                return None
+            return RedisStore(url, ttl)
+        logger.warning(f"Unsupported PRINCIPAL_CACHE_URL {url!r}; caching principals per process only")
+        return None
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f'principal:{user_id}'
+
+    @staticmethod
+    def get(user_id: int) -> Optional[Principal]:
+        """The principal for a session's user id; None if the account no longer exists"""
+        cache = PrincipalCacheService._store()
+        principal = cache.get(user_id)
+        if principal is not None:
+            return principal
+
+        shared = PrincipalCacheService._shared
+        raw = shared.get(PrincipalCacheService._key(user_id)) if shared is not None else None
+        if raw is not None:
+            principal = Principal.from_json(raw)
+        else:
+            row = db.session.execute(
+                select(User.id, User.username, User.email).where(User.id == user_id)
+            ).first()
+            if row is None:
+                return None
+            principal = Principal(row.id, row.username, row.email)
+            if shared is not None:
+                shared.set(PrincipalCacheService._key(user_id), principal.to_json())
+        cache.set(user_id, principal)
+        return principal
+
+    @staticmethod
+    def _drop(user_ids: Iterable[int]) -> None:
+        cache, shared = PrincipalCacheService._cache, PrincipalCacheService._shared
+        for user_id in user_ids:
+            if cache is not None:
+                cache.pop(user_id)
+            if shared is not None:
+                shared.pop(PrincipalCacheService._key(user_id))
+
+    @staticmethod
+    def invalidate(user_ids: Iterable[int]) -> None:
+        """Drop principals now and once more when the current transaction commits"""
+        user_ids = list(user_ids)
+        PrincipalCacheService._drop(user_ids)
+        # A concurrent request may re-cache the pre-commit row in between
+        db.session.info.setdefault('principal_cache_invalidate', set()).update(user_ids)
+
+    @staticmethod
+    def clear() -> None:
+        if PrincipalCacheService._cache is not None:
+            PrincipalCacheService._cache.clear()
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_updated(mapper, connection, target):
+    PrincipalCacheService.invalidate([target.id])
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_deleted(mapper, connection, target):
+    PrincipalCacheService.invalidate([target.id])
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    user_ids = session.info.pop('principal_cache_invalidate', None)
+    if user_ids:
+        PrincipalCacheService._drop(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('principal_cache_invalidate', None)
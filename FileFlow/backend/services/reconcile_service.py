@@ -0,0 +1,274 @@
+from datetime import datetime, timezone
+from flask import current_app
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, update, delete, bindparam, func
+import hashlib
+import logging
+import os
+import time
+try:
+    from backend.models.database import db, File, Blob
+    from backend.services.blob_service import get_blob_store
+    from backend.services.metadata_cache_service import MetadataCacheService
+except ImportError:
+    from models.database import db, File, Blob
+    from services.blob_service import get_blob_store
+    from services.metadata_cache_service import MetadataCacheService
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+# Scratch and derived data under UPLOAD_FOLDER that never maps to a File row
+IGNORED_PATHS = ('.staging', '.variants', '.renditions', '.watcher.lock', '.usage.lock',
+                 os.path.join('objects', 'tmp'))
+
+# Unreferenced blobs younger than this may belong to an upload that has not committed yet
+ORPHAN_GRACE_SECONDS = 60 * 60
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _batches(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _sha256(path: str) -> Optional[str]:
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(HASH_CHUNK_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+class ReconcileReport:
+    """Changes found by one reconcile pass; ``to_dict()`` is what the CLI prints"""
+
+    def __init__(self):
+        self.checked = 0
+        self.missing = []      # ids whose bytes are gone or corrupt
+        self.restored = []     # ids flagged missing whose bytes are back
+        self.resized = []      # ``{'row_id', 'new_size', 'new_modified'}`` for legacy files changed on disk
+        self.orphans = []      # paths on disk no row points at
+        self.orphans_removed = 0
+        self.refcounts_fixed = 0
+        # Blob path -> digest, so rows sharing a blob hash it once
+        self.digests = {}
+
+    def changed_ids(self) -> List[int]:
+        return self.missing + self.restored + [u['row_id'] for u in self.resized]
+
+    def to_dict(self) -> dict:
+        return {
+            'checked': self.checked,
+            'missing': len(self.missing),
+            'restored': len(self.restored),
+            'resized': len(self.resized),
+            'orphans': len(self.orphans),
+            'orphans_removed': self.orphans_removed,
+            'refcounts_fixed': self.refcounts_fixed,
+        }
+
+
+class ReconcileService:
+    """Bring File rows back in line with what is actually on disk
+
+    Two entry points share one diff:
+
+    - :meth:`apply` takes the paths a batch of filesystem events touched and
+      re-checks only the rows pointing at them (used by the watcher);
+    - :meth:`full_rescan` walks UPLOAD_FOLDER once with ``os.scandir`` and
+      compares it against every file row in a single streamed pass.
+
+    Rows whose bytes are gone are flagged ``is_missing`` rather than
+    deleted, so the owner still sees them. Legacy files edited in place get
+    their size and modification time refreshed. Blobs are content-addressed,
+    so a blob whose size no longer matches is re-hashed and flagged if it
+    is corrupt. All writes are bulk statements, followed by a metadata cache
+    invalidation.
+    """
+
+    @staticmethod
+    def root() -> str:
+        return os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+
+    @staticmethod
+    def is_ignored(path: str, root: Optional[str] = None) -> bool:
+        relative = os.path.relpath(path, root or ReconcileService.root())
+        return relative.startswith('..') or any(
+            relative == ignored or relative.startswith(ignored + os.sep) for ignored in IGNORED_PATHS
+        )
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, float]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def _diff(row, on_disk: Optional[Tuple[int, float]], objects_dir: str, report: ReconcileReport,
+              verify_hashes: bool = False) -> None:
+        """Record what has to change for one row given its stat (None if absent)"""
+        report.checked += 1
+        present = on_disk is not None
+        if present and row.file_hash and os.path.dirname(os.path.dirname(row.filepath)) == objects_dir:
+            size_changed = on_disk[0] != row.filesize
+            if size_changed or verify_hashes:
+                if row.filepath not in report.digests:
+                    report.digests[row.filepath] = _sha256(row.filepath)
+                intact = report.digests[row.filepath] == row.file_hash
+            else:
+                intact = True
+            if not intact:
+                logger.error(f"Blob {row.file_hash} is corrupt on disk")
+                present = False
+        elif present and (on_disk[0] != row.filesize or (
+                row.modified_at is not None
+                and on_disk[1] > row.modified_at.replace(tzinfo=timezone.utc).timestamp() + 1)):
+            report.resized.append({'row_id': row.id, 'new_size': on_disk[0],
+                                   'new_modified': datetime.utcfromtimestamp(on_disk[1])})
+
+        if not present and not row.is_missing:
+            report.missing.append(row.id)
+        elif present and row.is_missing:
+            report.restored.append(row.id)
+
+    @staticmethod
+    def _columns():
+        return (File.id, File.filepath, File.filesize, File.file_hash, File.modified_at, File.is_missing)
+
+    @staticmethod
+    def apply(paths: Iterable[str]) -> ReconcileReport:
+        """Re-check the rows pointing at `paths` and write the differences"""
+        root = ReconcileService.root()
+        objects_dir = os.path.join(root, 'objects')
+        paths = sorted({os.path.abspath(p) for p in paths if not ReconcileService.is_ignored(p, root)})
+        report = ReconcileReport()
+        for batch in _batches(paths):
+            rows = db.session.execute(
+                select(*ReconcileService._columns()).where(File.filepath.in_(batch), File.is_folder.is_(False))
+            ).all()
+            stats = {path: ReconcileService._stat(path) for path in {row.filepath for row in rows}}
+            for row in rows:
+                ReconcileService._diff(row, stats[row.filepath], objects_dir, report)
+        ReconcileService._write(report)
+        return report
+
+    @staticmethod
+    def scan_disk(root: str) -> Dict[str, Tuple[int, float]]:
+        """``{path: (size, mtime)}`` for every regular file below `root`, skipping IGNORED_PATHS"""
+        found = {}
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError as e:
+                logger.warning(f"Cannot scan {directory}: {str(e)}")
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not ReconcileService.is_ignored(entry.path, root):
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and not ReconcileService.is_ignored(entry.path, root):
+                        stat = entry.stat(follow_symlinks=False)
+                        found[entry.path] = (stat.st_size, stat.st_mtime)
+        return found
+
+    @staticmethod
+    def full_rescan(fix_orphans: bool = False, verify_hashes: bool = False,
+                    batch_size: int = 1000) -> ReconcileReport:
+        """Diff the whole upload tree against the File table in one pass
+
+        With `fix_orphans`, unreferenced blobs older than ORPHAN_GRACE_SECONDS
+        are deleted and Blob refcounts are recomputed from the File table.
+        Orphans outside the blob store are only reported, never deleted.
+        """
+        started = time.monotonic()
+        root = ReconcileService.root()
+        objects_dir = os.path.join(root, 'objects')
+        on_disk = ReconcileService.scan_disk(root)
+        logger.info(f"Scanned {len(on_disk)} files on disk in {time.monotonic() - started:.1f}s")
+
+        report = ReconcileReport()
+        referenced = set()
+        rows = db.session.execute(
+            select(*ReconcileService._columns()).where(File.is_folder.is_(False))
+            .execution_options(yield_per=batch_size)
+        )
+        for row in rows:
+            path = os.path.abspath(row.filepath)
+            referenced.add(path)
+            ReconcileService._diff(row, on_disk.get(path), objects_dir, report, verify_hashes)
+
+        report.orphans = sorted(set(on_disk) - referenced)
+        for path in report.orphans[:20]:
+            logger.warning(f"Orphaned file on disk: {path}")
+
+        if fix_orphans:
+            ReconcileService._remove_orphan_blobs(report, on_disk, objects_dir)
+            report.refcounts_fixed = ReconcileService._fix_refcounts()
+        ReconcileService._write(report)
+        logger.info(f"Reconcile finished in {time.monotonic() - started:.1f}s: {report.to_dict()}")
+        return report
+
+    @staticmethod
+    def _remove_orphan_blobs(report: ReconcileReport, on_disk: Dict[str, Tuple[int, float]],
+                             objects_dir: str) -> None:
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        store = get_blob_store()
+        blobs = [path for path in report.orphans
+                 if os.path.dirname(os.path.dirname(path)) == objects_dir and on_disk[path][1] < cutoff]
+        hashes = [os.path.basename(os.path.dirname(path)) + os.path.basename(path) for path in blobs]
+        for batch in _batches(hashes):
+            db.session.execute(delete(Blob).where(Blob.hash.in_(batch)))
+        db.session.commit()
+        # unlink() re-checks the Blob table, so content re-uploaded meanwhile survives
+        store.unlink(blobs)
+        store.prune_pins()
+        report.orphans_removed = len(blobs)
+
+    @staticmethod
+    def _fix_refcounts() -> int:
+        """Set every Blob.refcount to the number of File rows using it"""
+        counts = dict(db.session.execute(
+            select(File.file_hash, func.count()).where(File.file_hash.is_not(None)).group_by(File.file_hash)
+        ).all())
+        stale = [(blob_hash, counts.get(blob_hash, 0)) for blob_hash, refcount
+                 in db.session.execute(select(Blob.hash, Blob.refcount)) if counts.get(blob_hash, 0) != refcount]
+        blob_table = Blob.__table__
+        statement = update(blob_table).where(blob_table.c.hash == bindparam('blob_hash')).values(
+            refcount=bindparam('new_refcount'))
+        for batch in _batches(stale):
+            db.session.execute(statement, [{'blob_hash': h, 'new_refcount': c} for h, c in batch])
+        db.session.commit()
+        return len(stale)
+
+    @staticmethod
+    def _write(report: ReconcileReport) -> None:
+        for ids, flag in ((report.missing, True), (report.restored, False)):
+            for batch in _batches(ids):
+                db.session.execute(update(File).where(File.id.in_(batch)).values(is_missing=flag)
+                                   .execution_options(synchronize_session=False))
+        file_table = File.__table__
+        statement = update(file_table).where(file_table.c.id == bindparam('row_id')).values(
+            filesize=bindparam('new_size'), modified_at=bindparam('new_modified'))
+        for batch in _batches(report.resized):
+            db.session.execute(statement, batch)
+        changed = report.changed_ids()
+        if changed:
+            MetadataCacheService.invalidate(changed)
+            logger.info(f"Reconciled {len(changed)} files ({len(report.missing)} missing, "
+                        f"{len(report.restored)} restored, {len(report.resized)} resized)")
+        db.session.commit()
@@ -0,0 +1,235 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, request
+from pathlib import Path
+from typing import Optional
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # previews disabled
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Raster types Pillow can decode; SVG is already small and scalable
+SOURCE_MIMETYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+
+# format name -> (Pillow format, mimetype, extension)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+# Renditions read within this long are not touched again to refresh their LRU position
+TOUCH_INTERVAL = 24 * 60 * 60
+
+
+class RenditionError(Exception):
+    """The source image could not be decoded or the rendition timed out"""
+
+
+def _render(source: str, target: str, size: int, format_name: str, quality: int) -> int:
+    """Write a `size`-bounded rendition of `source` to `target` (pool worker); returns its size"""
+    pil_format = FORMATS[format_name][0]
+    with Image.open(source) as image:
+        # reducing_gap lets JPEGs decode at a reduced scale, which is most of the saving
+        image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('P', 'LA', 'PA') or (image.mode == 'RGBA' and pil_format == 'JPEG'):
+            image = image.convert('RGBA')
+        if image.mode == 'RGBA' and pil_format == 'JPEG':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+
+        Path(target).parent.mkdir(parents=True, exist_ok=True)
+        temp = f'{target}.{uuid.uuid4().hex}.tmp'
+        try:
+            image.save(temp, pil_format, quality=quality, method=4 if pil_format == 'WEBP' else 0,
+                       optimize=pil_format == 'JPEG')
+            os.replace(temp, target)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+    return os.path.getsize(target)
+
+
+class RenditionService:
+    """Thumbnail and preview renditions of uploaded images
+
+    Renditions are rendered on a process pool at a few fixed sizes, right
+    after upload for the grid size and lazily for the rest. They are keyed
+    by the source's content hash, so copies share them and they never go
+    stale, and are kept under ``UPLOAD_FOLDER/.renditions`` within
+    THUMBNAIL_CACHE_BYTES; the least recently used are evicted first.
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+    # Target path -> future, so concurrent requests for one rendition render it once
+    _pending = {}
+    _cache_bytes = None
+    _pruning = False
+
+    @staticmethod
+    def supports(mimetype: Optional[str]) -> bool:
+        return Image is not None and mimetype in SOURCE_MIMETYPES
+
+    @staticmethod
+    def choose_format() -> str:
+        """WebP for clients that list it explicitly, JPEG otherwise"""
+        if any(value == 'image/webp' for value, _ in request.accept_mimetypes) and features.check('webp'):
+            return 'webp'
+        return 'jpeg'
+
+    @staticmethod
+    def mimetype(format_name: str) -> str:
+        return FORMATS[format_name][1]
+
+    @staticmethod
+    def _cache_dir() -> Path:
+        return Path(current_app.config['UPLOAD_FOLDER']) / '.renditions'
+
+    @staticmethod
+    def rendition_path(content_key: str, size: int, format_name: str) -> Path:
+        key = hashlib.sha256(content_key.encode()).hexdigest()
+        return RenditionService._cache_dir() / key[:2] / f'{key[2:]}-{size}.{FORMATS[format_name][2]}'
+
+    @classmethod
+    def _get_executor(cls, workers: int) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                # spawn: workers must not inherit the web worker's threads or DB connections
+                cls._executor = ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            return cls._executor
+
+    @classmethod
+    def get(cls, source: str, content_key: str, size: int, format_name: str) -> Path:
+        """Path of the rendition, rendering it first if needed; raises RenditionError"""
+        target = cls.rendition_path(content_key, size, format_name)
+        try:
+            stat = target.stat()
+            if time.time() - stat.st_mtime > TOUCH_INTERVAL:
+                os.utime(target)
+            return target
+        except FileNotFoundError:
+            pass
+
+        future = cls._submit(source, target, size, format_name)
+        try:
+            future.result(timeout=current_app.config.get('THUMBNAIL_TIMEOUT', 30))
+        except FutureTimeoutError:
+            raise RenditionError(f"Rendering {source} timed out")
+        except Exception as e:
+            raise RenditionError(str(e))
+        finally:
+            # Waiters can wake before the done callback runs; drop a finished render now
+            if future.done():
+                cls._forget(str(target), future)
+        return target
+
+    @classmethod
+    def schedule(cls, source: str, mimetype: Optional[str], content_key: Optional[str]) -> None:
+        """Queue the grid-size renditions of a new upload without waiting for them
+
+        Never raises: a missing preview is rendered on first request instead.
+        """
+        if not content_key or not cls.supports(mimetype):
+            return
+        format_name = 'webp' if features.check('webp') else 'jpeg'
+        try:
+            for size in current_app.config.get('THUMBNAIL_PREGENERATE_SIZES', ()):
+                target = cls.rendition_path(content_key, size, format_name)
+                if not target.exists():
+                    cls._submit(source, target, size, format_name)
+        except Exception as e:
+            logger.warning(f"Could not queue renditions of {source}: {str(e)}")
+
+    @classmethod
+    def _submit(cls, source: str, target: Path, size: int, format_name: str):
+        config = current_app.config
+        key = str(target)
+        with cls._lock:
+            future = cls._pending.get(key)
+            # A failed render whose callback has not run yet is not reused
+            if future is not None and not future.done():
+                return future
+        budget = config.get('THUMBNAIL_CACHE_BYTES', 0)
+        cache_dir = cls._cache_dir()
+        executor = cls._get_executor(config.get('THUMBNAIL_WORKERS', 1))
+        try:
+            future = executor.submit(_render, str(source), key, size, format_name,
+                                     config.get('THUMBNAIL_QUALITY', 80))
+        except BrokenProcessPool:
+            # A crashed worker poisons the whole pool; start a fresh one
+            with cls._lock:
+                cls._executor = None
+            executor = cls._get_executor(config.get('THUMBNAIL_WORKERS', 1))
+            future = executor.submit(_render, str(source), key, size, format_name,
+                                     config.get('THUMBNAIL_QUALITY', 80))
+        with cls._lock:
+            cls._pending[key] = future
+        # Runs at once if the render already finished, so the entry never outlives it
+        future.add_done_callback(lambda f: cls._finished(key, f, cache_dir, budget))
+        return future
+
+    @classmethod
+    def _forget(cls, key: str, future) -> None:
+        with cls._lock:
+            if cls._pending.get(key) is future:
+                del cls._pending[key]
+
+    @classmethod
+    def _finished(cls, key: str, future, cache_dir: Path, budget: int) -> None:
+        cls._forget(key, future)
+        with cls._lock:
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                logger.warning(f"Rendition failed for {key}: {str(error)}")
+                return
+            if cls._cache_bytes is not None:
+                cls._cache_bytes += future.result()
+            over_budget = cls._cache_bytes is None or cls._cache_bytes > budget
+            if not over_budget or cls._pruning:
+                return
+            cls._pruning = True
+        threading.Thread(target=cls._prune, args=(cache_dir, budget), daemon=True).start()
+
+    @classmethod
+    def _prune(cls, cache_dir: Path, budget: int) -> None:
+        """Evict least recently used renditions down to 90% of the budget"""
+        try:
+            renditions = []
+            for path in cache_dir.glob('*/*'):
+                if path.suffix == '.tmp':
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                renditions.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in renditions)
+            if total > budget:
+                for _, size, path in sorted(renditions):
+                    if total <= budget * 0.9:
+                        break
+                    path.unlink(missing_ok=True)
+                    total -= size
+                logger.info(f"Pruned rendition cache to {total} bytes")
+            with cls._lock:
+                cls._cache_bytes = total
+        finally:
+            with cls._lock:
+                cls._pruning = False
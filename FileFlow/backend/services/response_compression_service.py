@@ -0,0 +1,316 @@
+from collections import OrderedDict
+from flask import current_app, request, Response
+from pathlib import Path
+from typing import Iterable, Optional
+from werkzeug.datastructures import Headers
+from werkzeug.wsgi import wrap_file
+import hashlib
+import logging
+import os
+import threading
+import uuid
+import zlib
+try:
+    from backend.services.compression_service import CompressionService
+except ImportError:
+    from services.compression_service import CompressionService
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Textual types worth compressing for HTTP (binary types are never guessed at)
+TEXT_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'application/xhtml+xml',
+    'application/rss+xml', 'application/atom+xml', 'application/x-ndjson', 'application/sql',
+    'application/x-yaml', 'application/yaml', 'application/x-sh', 'application/csv',
+    'image/svg+xml',
+}
+
+VARIANT_EXTENSIONS = {'br': 'br', 'gzip': 'gz'}
+
+
+class _Encoder:
+    """Incremental gzip or brotli encoder with one interface"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class ResponseCompressionService:
+    """Mimetype- and size-aware response compression
+
+    Replaces blanket flask-compress. Bodies are only compressed when the
+    type is textual and the response is a complete 200 representation:
+    partial (206) and 304 responses, offloaded files and media/archives are
+    always sent as-is.
+
+    - Small buffered bodies (JSON, HTML) are compressed whole; compressed
+      JSON is kept in a bounded in-memory LRU keyed by body digest, so
+      repeated listings cost a hash instead of a compression.
+    - Streamed bodies and text file downloads are compressed chunk by chunk
+      without buffering the payload.
+    - Text files served PRECOMPRESS_AFTER_HITS times get stored brotli/gzip
+      variants under ``UPLOAD_FOLDER/.variants``, which are then served like
+      any other file (sendfile-capable) with zero compression CPU.
+    """
+
+    DYNAMIC_LEVELS = {'br': 4, 'gzip': 6}
+    VARIANT_LEVELS = {'br': 11, 'gzip': 9}
+    CHUNK_SIZE = 256 * 1024
+    # Distinct files whose hit counts are remembered
+    MAX_TRACKED_FILES = 10000
+
+    _lock = threading.Lock()
+    _hits = OrderedDict()
+    _building = set()
+    _json_cache = OrderedDict()
+    _json_cache_bytes = 0
+
+    @classmethod
+    def init_app(cls, app) -> None:
+        app.after_request(cls.after_request)
+
+    @staticmethod
+    def is_text(mimetype: Optional[str]) -> bool:
+        """Check whether a response of this type should be compressed"""
+        if not mimetype:
+            return False
+        mimetype = mimetype.split(';')[0].strip().lower()
+        if not CompressionService.is_compressible(mimetype):
+            return False
+        return (mimetype.startswith('text/') or mimetype in TEXT_MIMETYPES
+                or mimetype.endswith(('+json', '+xml')))
+
+    @staticmethod
+    def choose_encoding() -> Optional[str]:
+        """Best encoding the client accepts: brotli when available, else gzip"""
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _add_vary(headers: Headers) -> None:
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+
+    @classmethod
+    def encode_stream(cls, chunks: Iterable[bytes], encoding: str):
+        """Compress an iterable of chunks lazily"""
+        encoder = _Encoder(encoding, cls.DYNAMIC_LEVELS[encoding])
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = encoder.compress(chunk)
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    @classmethod
+    def after_request(cls, response: Response) -> Response:
+        if (response.direct_passthrough
+                or response.status_code != 200
+                or request.method == 'HEAD'
+                or 'Content-Encoding' in response.headers
+                or 'Content-Range' in response.headers
+                or not cls.is_text(response.mimetype)):
+            return response
+        min_size = current_app.config.get('COMPRESS_MIN_SIZE', 1024)
+        if response.content_length is not None and response.content_length < min_size:
+            return response
+
+        cls._add_vary(response.headers)
+        encoding = cls.choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = cls.encode_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            return response
+
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        compressed = cls._compress_body(body, encoding, response.mimetype == 'application/json')
+        if len(compressed) >= len(body):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @classmethod
+    def _compress_body(cls, body: bytes, encoding: str, cacheable: bool) -> bytes:
+        key = None
+        if cacheable:
+            key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+            with cls._lock:
+                cached = cls._json_cache.get(key)
+                if cached is not None:
+                    cls._json_cache.move_to_end(key)
+                    return cached
+
+        encoder = _Encoder(encoding, cls.DYNAMIC_LEVELS[encoding])
+        compressed = encoder.compress(body) + encoder.finish()
+
+        if key is not None:
+            budget = current_app.config.get('COMPRESS_JSON_CACHE_BYTES', 0)
+            if len(compressed) <= budget // 8:
+                with cls._lock:
+                    if key not in cls._json_cache:
+                        cls._json_cache[key] = compressed
+                        cls._json_cache_bytes += len(compressed)
+                    while cls._json_cache_bytes > budget and cls._json_cache:
+                        _, evicted = cls._json_cache.popitem(last=False)
+                        cls._json_cache_bytes -= len(evicted)
+        return compressed
+
+    @classmethod
+    def file_response(cls, path: Path, size: int, mimetype: str, etag: str,
+                      headers: Headers) -> Optional[Response]:
+        """Compressed response for a whole-file download, or None to send it as-is
+
+        Called by the serving layer for 200 responses only; Range requests
+        always get identity bytes.
+        """
+        if not cls.is_text(mimetype):
+            return None
+        config = current_app.config
+        if size < config.get('COMPRESS_MIN_SIZE', 1024):
+            return None
+        cls._add_vary(headers)
+        encoding = cls.choose_encoding()
+        if encoding is None:
+            return None
+
+        variant = cls._variant_path(etag, encoding)
+        if variant.exists():
+            headers['Content-Encoding'] = encoding
+            headers['ETag'] = f'"{etag}-{VARIANT_EXTENSIONS[encoding]}"'
+            headers['Content-Length'] = str(variant.stat().st_size)
+            headers.pop('Accept-Ranges', None)
+            body = wrap_file(request.environ, open(variant, 'rb'), cls.CHUNK_SIZE)
+            return Response(body, mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+        if size > config.get('COMPRESS_MAX_FILE_SIZE', 0):
+            return None
+        cls._count_hit(path, etag, config)
+
+        def chunks():
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(cls.CHUNK_SIZE)
+                    if not data:
+                        break
+                    yield data
+
+        headers['Content-Encoding'] = encoding
+        headers['ETag'] = f'"{etag}-{VARIANT_EXTENSIONS[encoding]}"'
+        headers.pop('Accept-Ranges', None)
+        return Response(cls.encode_stream(chunks(), encoding), mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+
+    @staticmethod
+    def _variant_dir() -> Path:
+        return Path(current_app.config['UPLOAD_FOLDER']) / '.variants'
+
+    @classmethod
+    def _variant_path(cls, etag: str, encoding: str) -> Path:
+        key = hashlib.sha256(etag.encode()).hexdigest()
+        return cls._variant_dir() / key[:2] / f'{key[2:]}.{VARIANT_EXTENSIONS[encoding]}'
+
+    @classmethod
+    def _count_hit(cls, path: Path, etag: str, config) -> None:
+        threshold = config.get('PRECOMPRESS_AFTER_HITS', 0)
+        if not threshold:
+            return
+        with cls._lock:
+            hits = cls._hits.pop(etag, 0) + 1
+            cls._hits[etag] = hits
+            if len(cls._hits) > cls.MAX_TRACKED_FILES:
+                cls._hits.popitem(last=False)
+            if hits < threshold or etag in cls._building:
+                return
+            cls._building.add(etag)
+        targets = {encoding: cls._variant_path(etag, encoding) for encoding in VARIANT_EXTENSIONS
+                   if encoding != 'br' or brotli is not None}
+        worker = threading.Thread(target=cls._build_variants,
+                                  args=(Path(path), etag, targets, cls._variant_dir(),
+                                        config.get('PRECOMPRESS_CACHE_BYTES', 0)),
+                                  daemon=True)
+        worker.start()
+
+    @classmethod
+    def _build_variants(cls, path: Path, etag: str, targets: dict, variant_dir: Path, budget: int) -> None:
+        """Write stored variants of a frequently served file (background thread)"""
+        try:
+            for encoding, target in targets.items():
+                if target.exists():
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                temp = target.with_name(f'.{uuid.uuid4().hex}.tmp')
+                encoder = _Encoder(encoding, cls.VARIANT_LEVELS[encoding])
+                with open(path, 'rb') as src, open(temp, 'wb') as out:
+                    while True:
+                        data = src.read(cls.CHUNK_SIZE)
+                        if not data:
+                            break
+                        out.write(encoder.compress(data))
+                    out.write(encoder.finish())
+                os.replace(temp, target)
+            logger.info(f"Stored compressed variants of {path}")
+            cls._prune_variants(variant_dir, budget)
+        except OSError as e:
+            logger.warning(f"Could not precompress {path}: {str(e)}")
+        finally:
+            with cls._lock:
+                cls._building.discard(etag)
+
+    @staticmethod
+    def _prune_variants(variant_dir: Path, budget: int) -> None:
+        """Drop the least recently written variants beyond the disk budget"""
+        variants = []
+        for variant in variant_dir.glob('*/*'):
+            if variant.suffix == '.tmp':
+                continue
+            try:
+                stat = variant.stat()
+            except OSError:
+                continue
+            variants.append((stat.st_mtime, stat.st_size, variant))
+        total = sum(size for _, size, _ in variants)
+        for _, size, variant in sorted(variants):
+            if total <= budget:
+                break
+            variant.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,540 @@
+from flask import current_app
+from functools import partial
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import (MetaData, Table, Column, Integer, Float, Text, select, insert, update, delete, text,
+                        literal, or_, bindparam, event)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError, ProgrammingError
+import json
+import logging
+import re
+import time
+try:
+    from backend.models.database import db, File, Tag, FileTag
+    from backend.services.job_service import JobService
+except ImportError:
+    from models.database import db, File, Tag, FileTag
+    from services.job_service import JobService
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF text is simply not indexed without pypdf
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Mimetypes whose text is extracted into the index
+EXTRACTABLE_MIMETYPES = ('text/plain', 'text/csv', 'application/json', 'text/html', 'application/pdf')
+MAX_PDF_PAGES = 50
+
+# A background body write that meets a busy database tries again this often
+BODY_WRITE_ATTEMPTS = 5
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+
+class _HTMLText(HTMLParser):
+    """Collect the visible text of an HTML document"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def extract_text(path, mimetype: Optional[str], max_bytes: int) -> Optional[str]:
+    """Extract up to `max_bytes` of searchable text from a document, or None"""
+    if mimetype not in EXTRACTABLE_MIMETYPES:
+        return None
+    try:
+        if mimetype == 'application/pdf':
+            if PdfReader is None:
+                return None
+            reader = PdfReader(str(path))
+            parts, size = [], 0
+            for page in reader.pages[:MAX_PDF_PAGES]:
+                page_text = page.extract_text() or ''
+                parts.append(page_text)
+                size += len(page_text)
+                if size >= max_bytes:
+                    break
+            return ' '.join(parts)[:max_bytes]
+
+        with open(path, 'rb') as f:
+            raw = f.read(max_bytes).decode('utf-8', errors='ignore')
+        if mimetype == 'text/html':
+            parser = _HTMLText()
+            parser.feed(raw)
+            return ' '.join(parser.parts)
+        if mimetype == 'application/json':
+            # Index values and keys, not the punctuation (a truncated document stays raw)
+            try:
+                return ' '.join(TOKEN_RE.findall(json.dumps(json.loads(raw), ensure_ascii=False)))
+            except ValueError:
+                return raw
+        return raw
+    except Exception as e:
+        logger.warning(f"Could not extract text from {path}: {str(e)}")
+        return None
+
+
+def _entry(file: File, tags: Iterable[str] = ()) -> dict:
+    return {
+        'file_id': file.id,
+        'user_id': file.user_id,
+        'name': file.filename or '',
+        'tags': ' '.join(tags)
+    }
+
+
+def _tag_names(conn, file_ids) -> Dict[int, List[str]]:
+    """Tag names of each file, through the connection so it is safe inside a flush"""
+    names = {}
+    for file_id, name in conn.execute(
+        select(FileTag.file_id, Tag.name).join(Tag, Tag.id == FileTag.tag_id).where(FileTag.file_id.in_(file_ids))
+    ):
+        names.setdefault(file_id, []).append(name)
+    return names
+
+
+class LikeSearchBackend:
+    """Fallback when no full-text index exists: the original ILIKE scan"""
+
+    name = 'like'
+
+    def create(self, conn) -> None:
+        pass
+
+    def clear(self, conn) -> None:
+        pass
+
+    def upsert(self, conn, entries: List[dict]) -> None:
+        pass
+
+    def set_body(self, conn, file_id: int, body: str) -> None:
+        pass
+
+    def remove(self, conn, file_ids) -> None:
+        pass
+
+    def copy(self, conn, id_map: Dict[int, int]) -> None:
+        pass
+
+    def hits(self, user_id: int, query: str):
+        pattern = f'%{query}%'
+        # Tags match whole names through the (user_id, key) index
+        tagged = select(FileTag.file_id).join(Tag, Tag.id == FileTag.tag_id).where(
+            Tag.user_id == user_id, Tag.key == query.strip().lower())
+        return select(File.id.label('file_id'), literal(0.0).label('rank')).where(
+            File.user_id == user_id,
+            or_(File.filename.ilike(pattern), File.id.in_(tagged))
+        ).subquery('hits')
+
+
+class SqliteSearchBackend:
+    """SQLite FTS5: a word index with prefix support plus a trigram index on names
+
+    Both tables use the file id as their rowid. Word matches are ranked with
+    bm25 weighted name > tags > body; substring matches on the name (three
+    or more characters) come from the trigram table and rank below them.
+    """
+
+    name = 'fts5'
+    metadata = MetaData()
+    words = Table('file_search', metadata,
+                  Column('rowid', Integer, primary_key=True),
+                  Column('user_id', Integer), Column('name', Text), Column('tags', Text), Column('body', Text))
+    trigrams = Table('file_search_trigram', metadata,
+                     Column('rowid', Integer, primary_key=True),
+                     Column('user_id', Integer), Column('name', Text))
+
+    def create(self, conn) -> None:
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS file_search USING fts5("
+            "user_id UNINDEXED, name, tags, body, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS file_search_trigram USING fts5("
+            "user_id UNINDEXED, name, tokenize = 'trigram')"
+        )
+
+    def clear(self, conn) -> None:
+        conn.execute(delete(self.words))
+        conn.execute(delete(self.trigrams))
+
+    def upsert(self, conn, entries: List[dict]) -> None:
+        if not entries:
+            return
+        ids = [e['file_id'] for e in entries]
+        existing = set(conn.execute(select(self.words.c.rowid).where(self.words.c.rowid.in_(ids))).scalars())
+        rows = [{'rowid': e['file_id'], 'user_id': e['user_id'], 'name': e['name'], 'tags': e['tags']}
+                for e in entries]
+        # Update in place so previously extracted body text survives a rename
+        changed = [{'row_id': r['rowid'], 'new_user_id': r['user_id'], 'new_name': r['name'], 'new_tags': r['tags']}
+                   for r in rows if r['rowid'] in existing]
+        if changed:
+            conn.execute(
+                update(self.words).where(self.words.c.rowid == bindparam('row_id')).values(
+                    user_id=bindparam('new_user_id'), name=bindparam('new_name'), tags=bindparam('new_tags')),
+                changed
+            )
+        added = [dict(r, body='') for r in rows if r['rowid'] not in existing]
+        if added:
+            conn.execute(insert(self.words), added)
+
+        conn.execute(delete(self.trigrams).where(self.trigrams.c.rowid.in_(ids)))
+        conn.execute(insert(self.trigrams), [{'rowid': r['rowid'], 'user_id': r['user_id'], 'name': r['name']}
+                                             for r in rows])
+
+    def set_body(self, conn, file_id: int, body: str) -> None:
+        conn.execute(update(self.words).where(self.words.c.rowid == file_id).values(body=body))
+
+    def remove(self, conn, file_ids) -> None:
+        conn.execute(delete(self.words).where(self.words.c.rowid.in_(file_ids)))
+        conn.execute(delete(self.trigrams).where(self.trigrams.c.rowid.in_(file_ids)))
+
+    def copy(self, conn, id_map: Dict[int, int]) -> None:
+        if not id_map:
+            return
+        pairs = [{'old_id': old, 'new_id': new} for old, new in id_map.items()]
+        conn.execute(text(
+            "INSERT INTO file_search (rowid, user_id, name, tags, body) "
+            "SELECT :new_id, user_id, name, tags, body FROM file_search WHERE rowid = :old_id"
+        ), pairs)
+        conn.execute(text(
+            "INSERT INTO file_search_trigram (rowid, user_id, name) "
+            "SELECT :new_id, user_id, name FROM file_search_trigram WHERE rowid = :old_id"
+        ), pairs)
+
+    def hits(self, user_id: int, query: str):
+        tokens = TOKEN_RE.findall(query)
+        phrase = query.strip()
+        parts, params = [], {'user_id': user_id}
+        if tokens:
+            # user_id is the first (unindexed) column, hence its zero weight
+            parts.append("SELECT rowid AS file_id, bm25(file_search, 0.0, 10.0, 5.0, 1.0) AS rank "
+                         "FROM file_search WHERE file_search MATCH :words AND user_id = :user_id")
+            params['words'] = ' '.join(f'"{token}"*' for token in tokens)
+        if len(phrase) >= 3:
+            parts.append("SELECT rowid AS file_id, 0.5 * bm25(file_search_trigram) AS rank "
+                         "FROM file_search_trigram WHERE file_search_trigram MATCH :phrase AND user_id = :user_id")
+            params['phrase'] = '"' + phrase.replace('"', '""') + '"'
+        if not parts:
+            return LikeSearchBackend().hits(user_id, query)
+        return text(
+            f"SELECT file_id, MIN(rank) AS rank FROM ({' UNION ALL '.join(parts)}) GROUP BY file_id"
+        ).bindparams(**params).columns(file_id=Integer, rank=Float).subquery('hits')
+
+
+class PostgresSearchBackend:
+    """Postgres: a weighted tsvector with prefix queries plus pg_trgm on names
+
+    The tsvector is a generated column, so it follows name/tags/body edits
+    without any trigger. Trigram matching is used when the pg_trgm
+    extension is available.
+    """
+
+    name = 'tsvector'
+    metadata = MetaData()
+    table = Table('file_search', metadata,
+                  Column('file_id', Integer, primary_key=True),
+                  Column('user_id', Integer), Column('name', Text), Column('tags', Text), Column('body', Text))
+
+    def __init__(self, trigram: bool = False):
+        self.trigram = trigram
+
+    def create(self, conn) -> None:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS file_search ("
+            "file_id INTEGER PRIMARY KEY REFERENCES file (id) ON DELETE CASCADE, "
+            "user_id INTEGER NOT NULL, "
+            "name TEXT NOT NULL DEFAULT '', tags TEXT NOT NULL DEFAULT '', body TEXT NOT NULL DEFAULT '', "
+            "document tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', name), 'A') || "
+            "setweight(to_tsvector('simple', tags), 'B') || "
+            "setweight(to_tsvector('simple', body), 'C')) STORED)"
+        )
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_file_search_document ON file_search USING GIN (document)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_file_search_user ON file_search (user_id)")
+        try:
+            with conn.begin_nested():
+                conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_file_search_name_trgm ON file_search USING GIN (name gin_trgm_ops)"
+            )
+            self.trigram = True
+        except (OperationalError, ProgrammingError) as e:
+            logger.warning(f"pg_trgm unavailable, substring name search disabled: {str(e)}")
+
+    def clear(self, conn) -> None:
+        conn.execute(delete(self.table))
+
+    def upsert(self, conn, entries: List[dict]) -> None:
+        if not entries:
+            return
+        statement = postgresql.insert(self.table).values(entries)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=['file_id'],
+            set_={'user_id': statement.excluded.user_id, 'name': statement.excluded.name,
+                  'tags': statement.excluded.tags}
+        ))
+
+    def set_body(self, conn, file_id: int, body: str) -> None:
+        # Postgres text cannot hold NUL bytes
+        conn.execute(update(self.table).where(self.table.c.file_id == file_id).values(body=body.replace('\x00', '')))
+
+    def remove(self, conn, file_ids) -> None:
+        conn.execute(delete(self.table).where(self.table.c.file_id.in_(file_ids)))
+
+    def copy(self, conn, id_map: Dict[int, int]) -> None:
+        if not id_map:
+            return
+        conn.execute(text(
+            "INSERT INTO file_search (file_id, user_id, name, tags, body) "
+            "SELECT :new_id, user_id, name, tags, body FROM file_search WHERE file_id = :old_id"
+        ), [{'old_id': old, 'new_id': new} for old, new in id_map.items()])
+
+    def hits(self, user_id: int, query: str):
+        tokens = [token.lower() for token in TOKEN_RE.findall(query)]
+        phrase = query.strip()
+        parts, params = [], {'user_id': user_id}
+        if tokens:
+            parts.append("SELECT file_id, -ts_rank(document, to_tsquery('simple', :words)) AS rank "
+                         "FROM file_search WHERE user_id = :user_id AND document @@ to_tsquery('simple', :words)")
+            params['words'] = ' & '.join(f'{token}:*' for token in tokens)
+        if self.trigram and len(phrase) >= 3:
+            parts.append("SELECT file_id, -0.5 * similarity(name, :phrase) AS rank "
+                         "FROM file_search WHERE user_id = :user_id AND name ILIKE :pattern ESCAPE '\\'")
+            params['phrase'] = phrase
+            params['pattern'] = '%' + re.sub(r'([\\%_])', r'\\\1', phrase) + '%'
+        if not parts:
+            return LikeSearchBackend().hits(user_id, query)
+        return text(
+            f"SELECT file_id, MIN(rank) AS rank FROM ({' UNION ALL '.join(parts)}) AS matches GROUP BY file_id"
+        ).bindparams(**params).columns(file_id=Integer, rank=Float).subquery('hits')
+
+
+# Backend in use per database, detected from the tables that exist
+_backends = {}
+
+
+def _detect_backend(conn):
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'file_search'").first()
+        return SqliteSearchBackend() if exists else LikeSearchBackend()
+    if dialect == 'postgresql':
+        exists = conn.exec_driver_sql("SELECT to_regclass('file_search')").scalar()
+        if not exists:
+            return LikeSearchBackend()
+        trigram = conn.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first()
+        return PostgresSearchBackend(trigram=trigram is not None)
+    return LikeSearchBackend()
+
+
+def get_backend(conn):
+    """Get the search backend for the database behind `conn`"""
+    key = str(conn.engine.url)
+    backend = _backends.get(key)
+    if backend is None:
+        backend = _backends[key] = _detect_backend(conn)
+    return backend
+
+
+class SearchService:
+    """Full-text search over file names, tags and extracted document text
+
+    The index lives in dialect-specific tables next to ``file`` and is kept
+    current in the same transaction as the rows it mirrors: ORM inserts,
+    renames and deletes through mapper events, bulk tree operations through
+    explicit calls. Document text is extracted on the job pool after the
+    upload commits and added once it is ready. Without an index the
+    original ILIKE scan is used.
+    """
+
+    BACKENDS = {'sqlite': SqliteSearchBackend, 'postgresql': PostgresSearchBackend}
+
+    @staticmethod
+    def create_index() -> bool:
+        """Create the index tables for the current database; True if they were new"""
+        backend_class = SearchService.BACKENDS.get(db.engine.dialect.name)
+        if backend_class is None:
+            logger.warning(f"No full-text search backend for {db.engine.dialect.name}; using LIKE")
+            return False
+        with db.engine.begin() as conn:
+            existed = _detect_backend(conn).name != 'like'
+            try:
+                backend_class().create(conn)
+            except OperationalError as e:
+                logger.warning(f"Full-text index unavailable, using LIKE search: {str(e)}")
+                return False
+        _backends.clear()
+        return not existed
+
+    @staticmethod
+    def rebuild(with_content: bool = False, batch_size: int = 1000) -> int:
+        """Re-index every file from scratch (optionally re-extracting document text)"""
+        conn = db.session.connection()
+        backend = get_backend(conn)
+        backend.clear(conn)
+        batch, count = [], 0
+        for file in db.session.scalars(select(File).execution_options(yield_per=batch_size)):
+            batch.append(file)
+            if len(batch) >= batch_size:
+                count += SearchService._index_batch(backend, conn, batch, with_content)
+                batch = []
+        count += SearchService._index_batch(backend, conn, batch, with_content)
+        db.session.commit()
+        logger.info(f"Search index rebuilt: {count} files ({backend.name})")
+        return count
+
+    @staticmethod
+    def _index_batch(backend, conn, files, with_content) -> int:
+        tags = _tag_names(conn, [f.id for f in files]) if files else {}
+        backend.upsert(conn, [_entry(f, tags.get(f.id, ())) for f in files])
+        if with_content:
+            for f in files:
+                SearchService.index_content(f)
+        return len(files)
+
+    @staticmethod
+    def index_content(file: File) -> None:
+        """Index the extracted text of an uploaded document (caller commits)"""
+        if not file.is_folder:
+            SearchService.index_contents([(file.id, file.filepath, file.mimetype)])
+
+    @staticmethod
+    def index_contents(files: Iterable[Tuple[int, str, Optional[str]]]) -> None:
+        """Index the extracted text of ``(file_id, filepath, mimetype)`` documents (caller commits)"""
+        if not current_app.config.get('SEARCH_INDEX_CONTENT'):
+            return
+        conn = db.session.connection()
+        backend = get_backend(conn)
+        for file_id, filepath, mimetype in files:
+            body = extract_text(Path(filepath), mimetype, current_app.config['SEARCH_MAX_EXTRACT_BYTES'])
+            if body:
+                backend.set_body(conn, file_id, body)
+
+    @staticmethod
+    def schedule_contents(files: Iterable[Tuple[int, str, Optional[str]]]) -> None:
+        """Index the text of committed ``(file_id, filepath, mimetype)`` documents in the background
+
+        Extraction runs on the job pool so a large PDF never holds up the
+        upload; the body is written from this process once it is ready.
+        Never raises: a document whose text is not indexed is still found
+        by name and tags.
+        """
+        app = current_app._get_current_object()
+        if not app.config.get('SEARCH_INDEX_CONTENT'):
+            return
+        max_bytes = app.config['SEARCH_MAX_EXTRACT_BYTES']
+        try:
+            for file_id, filepath, mimetype in files:
+                if mimetype in EXTRACTABLE_MIMETYPES:
+                    future = JobService.run(app, extract_text, str(filepath), mimetype, max_bytes)
+                    future.add_done_callback(partial(SearchService._store_body, app, file_id))
+        except Exception as e:
+            logger.warning(f"Could not queue content indexing: {str(e)}")
+
+    @staticmethod
+    def _store_body(app, file_id: int, future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            logger.warning(f"Content extraction failed for file {file_id}: "
+                           f"{'cancelled' if future.cancelled() else future.exception()}")
+            return
+        body = future.result()
+        if not body:
+            return
+        with app.app_context():
+            for attempt in range(1, BODY_WRITE_ATTEMPTS + 1):
+                try:
+                    # A file deleted meanwhile has no index row left to update
+                    conn = db.session.connection()
+                    get_backend(conn).set_body(conn, file_id, body)
+                    db.session.commit()
+                    return
+                except OperationalError as e:
+                    # SQLite turns a second writer away while an upload commits
+                    db.session.rollback()
+                    if attempt == BODY_WRITE_ATTEMPTS:
+                        logger.warning(f"Could not index the content of file {file_id}: {str(e)}")
+                        return
+                    time.sleep(0.1 * attempt)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"Could not index the content of file {file_id}: {str(e)}")
+                    return
+
+    @staticmethod
+    def remove(file_ids: Iterable[int]) -> None:
+        """Drop rows from the index; `file_ids` may be a list or an id SELECT (caller commits)"""
+        conn = db.session.connection()
+        get_backend(conn).remove(conn, file_ids)
+
+    @staticmethod
+    def add(user_id: int, names: Dict[int, str]) -> None:
+        """Index rows created by bulk Core inserts, which skip the mapper events (caller commits)"""
+        conn = db.session.connection()
+        get_backend(conn).upsert(conn, [{'file_id': file_id, 'user_id': user_id, 'name': name or '', 'tags': ''}
+                                        for file_id, name in names.items()])
+
+    @staticmethod
+    def reindex(file_ids: Iterable[int]) -> None:
+        """Refresh the names and tags of rows changed by bulk statements (caller commits)"""
+        conn = db.session.connection()
+        backend = get_backend(conn)
+        if backend.name == 'like':
+            return
+        file_ids = list(file_ids)
+        for i in range(0, len(file_ids), BATCH_SIZE):
+            batch = file_ids[i:i + BATCH_SIZE]
+            tags = _tag_names(conn, batch)
+            rows = conn.execute(select(File.id, File.user_id, File.filename).where(File.id.in_(batch))).all()
+            backend.upsert(conn, [_entry(row, tags.get(row.id, ())) for row in rows])
+
+    @staticmethod
+    def copy(id_map: Dict[int, int]) -> None:
+        """Index copies under their new ids, reusing the originals' entries (caller commits)"""
+        conn = db.session.connection()
+        get_backend(conn).copy(conn, id_map)
+
+    @staticmethod
+    def hits(user_id: int, query: str):
+        """Subquery of (file_id, rank) for the user's matches; lower rank is better"""
+        return get_backend(db.session.connection()).hits(user_id, query)
+
+
+@event.listens_for(File, 'after_insert')
+def _index_inserted(mapper, connection, target):
+    get_backend(connection).upsert(connection, [_entry(target)])
+
+
+@event.listens_for(File, 'after_update')
+def _index_updated(mapper, connection, target):
+    if db.inspect(target).attrs.filename.history.has_changes():
+        tags = _tag_names(connection, [target.id]).get(target.id, ())
+        get_backend(connection).upsert(connection, [_entry(target, tags)])
+
+
+@event.listens_for(File, 'after_delete')
+def _index_deleted(mapper, connection, target):
+    get_backend(connection).remove(connection, [target.id])
@@ -0,0 +1,234 @@
+from flask import current_app, request, Response
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, parse_date, parse_range_header
+from werkzeug.wsgi import wrap_file
+import logging
+import unicodedata
+import uuid
+try:
+    from backend.services.response_compression_service import ResponseCompressionService, VARIANT_EXTENSIONS
+except ImportError:
+    from services.response_compression_service import ResponseCompressionService, VARIANT_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+class _RangeFile:
+    """File object limited to one byte range, for ``wsgi.file_wrapper``
+
+    gunicorn's file wrapper calls ``os.sendfile`` from the descriptor's
+    current offset for Content-Length bytes, so the range goes from the page
+    cache to the socket without passing through Python. Servers without
+    sendfile fall back to ``read()``, which stops at the end of the range.
+    """
+
+    def __init__(self, path: Path, start: int, length: int):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ServingService:
+    """Serve stored file bytes with conditional, Range and offload support
+
+    Authorisation always happens in the view; this only decides how the
+    bytes travel. In 'python' mode full and single-range bodies go through
+    ``wsgi.file_wrapper`` (zero-copy sendfile under gunicorn) and
+    multi-range requests get a multipart/byteranges body. In 'x-accel' and
+    'x-sendfile' mode the response only carries headers and the front web
+    server streams the file itself, including any Range handling.
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+    # More ranges than this in one request is treated as abuse and ignored
+    MAX_RANGES = 32
+
+    @staticmethod
+    def send(path: Path, mimetype: Optional[str], download_name: Optional[str] = None,
+             as_attachment: bool = False, max_age: int = 3600, etag: Optional[str] = None,
+             size: Optional[int] = None, mtime: Optional[float] = None) -> Response:
+        """Build the response for a file the current user may read
+
+        Callers that already know `size` and `mtime` (see MetadataCacheService)
+        spare the stat() call, so a matching conditional GET touches nothing.
+        """
+        path = Path(path)
+        if size is None or mtime is None:
+            stat = path.stat()
+            size, mtime = stat.st_size, stat.st_mtime
+        mimetype = mimetype or 'application/octet-stream'
+        etag = etag or f'{mtime}-{size}'
+        last_modified = int(mtime)
+
+        headers = Headers()
+        headers['Accept-Ranges'] = 'bytes'
+        headers['ETag'] = f'"{etag}"'
+        headers['Last-Modified'] = http_date(last_modified)
+        headers['Cache-Control'] = f'public, max-age={max_age}'
+        if as_attachment or download_name:
+            ServingService._set_disposition(headers, download_name or path.name, as_attachment)
+
+        matched = ServingService._not_modified(etag, last_modified)
+        if matched is not None:
+            if matched != etag:
+                # The client holds a compressed variant; confirm that one
+                headers['ETag'] = f'"{matched}"'
+                headers['Vary'] = 'Accept-Encoding'
+            return Response(status=304, headers=headers)
+
+        mode = current_app.config.get('FILE_SERVING_MODE', 'python')
+        if mode != 'python':
+            offloaded = ServingService._offload(mode, path, mimetype, headers)
+            if offloaded is not None:
+                return offloaded
+
+        ranges = ServingService._requested_ranges(size, etag, last_modified)
+        if ranges == []:
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers)
+
+        if ranges is None:
+            # Text files may go out compressed; partial responses never are
+            compressed = ResponseCompressionService.file_response(path, size, mimetype, etag, headers)
+            if compressed is not None:
+                return compressed
+            return ServingService._file_response(path, 0, size, 200, mimetype, headers)
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+            return ServingService._file_response(path, start, stop - start, 206, mimetype, headers)
+        return ServingService._multipart_response(path, ranges, size, mimetype, headers)
+
+    @staticmethod
+    def _set_disposition(headers: Headers, name: str, as_attachment: bool) -> None:
+        disposition = 'attachment' if as_attachment else 'inline'
+        try:
+            name.encode('ascii')
+            headers.set('Content-Disposition', disposition, filename=name)
+        except UnicodeEncodeError:
+            simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+            quoted = quote(name, safe="!#$&+^`|~")
+            headers.set('Content-Disposition', disposition, filename=simple,
+                        **{'filename*': f"UTF-8''{quoted}"})
+
+    @staticmethod
+    def _not_modified(etag: str, last_modified: int) -> Optional[str]:
+        """The ETag a 304 should carry if the client's copy is current, else None"""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if request.if_none_match:
+            # Compressed variants carry the encoding as an ETag suffix
+            for tag in [etag] + [f'{etag}-{ext}' for ext in VARIANT_EXTENSIONS.values()]:
+                if request.if_none_match.contains_weak(tag):
+                    return tag
+            return None
+        if request.if_modified_since and last_modified <= request.if_modified_since.timestamp():
+            return etag
+        return None
+
+    @staticmethod
+    def _requested_ranges(size: int, etag: str, last_modified: int) -> Optional[List[Tuple[int, int]]]:
+        """Satisfiable ``(start, stop)`` ranges; None for the whole file, [] if unsatisfiable"""
+        header = request.headers.get('Range')
+        if not header or request.method not in ('GET', 'HEAD'):
+            return None
+
+        if_range = request.headers.get('If-Range')
+        if if_range:
+            if if_range.startswith('"'):
+                if if_range.strip('"') != etag:
+                    return None
+            else:
+                date = parse_date(if_range)
+                if date is None or int(date.timestamp()) != last_modified:
+                    return None
+
+        parsed = parse_range_header(header)
+        if parsed is None or parsed.units != 'bytes' or len(parsed.ranges) > ServingService.MAX_RANGES:
+            return None
+
+        ranges = []
+        for begin, end in parsed.ranges:
+            if begin < 0:
+                start, stop = max(size + begin, 0), size
+            else:
+                start, stop = begin, size if end is None else min(end, size)
+            if start < stop:
+                ranges.append((start, stop))
+        return ranges
+
+    @staticmethod
+    def _file_response(path: Path, start: int, length: int, status: int, mimetype: str,
+                       headers: Headers) -> Response:
+        headers['Content-Length'] = str(length)
+        body = wrap_file(request.environ, _RangeFile(path, start, length), ServingService.BLOCK_SIZE)
+        return Response(body, status=status, mimetype=mimetype, headers=headers, direct_passthrough=True)
+
+    @staticmethod
+    def _multipart_response(path: Path, ranges: List[Tuple[int, int]], size: int, mimetype: str,
+                            headers: Headers) -> Response:
+        boundary = uuid.uuid4().hex
+        part_headers = [
+            (f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+             f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+            for start, stop in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        headers['Content-Length'] = str(
+            sum(len(h) for h in part_headers) + sum(stop - start for start, stop in ranges) + len(closing)
+        )
+
+        def generate():
+            with open(path, 'rb') as f:
+                for part_header, (start, stop) in zip(part_headers, ranges):
+                    yield part_header
+                    f.seek(start)
+                    remaining = stop - start
+                    while remaining > 0:
+                        data = f.read(min(ServingService.BLOCK_SIZE, remaining))
+                        if not data:
+                            return
+                        remaining -= len(data)
+                        yield data
+            yield closing
+
+        return Response(generate(), status=206, headers=headers, direct_passthrough=True,
+                        content_type=f'multipart/byteranges; boundary={boundary}')
+
+    @staticmethod
+    def _offload(mode: str, path: Path, mimetype: str, headers: Headers) -> Optional[Response]:
+        """Hand the file to the front web server; None if it cannot serve this path"""
+        if mode == 'x-sendfile':
+            headers['X-Sendfile'] = str(path.resolve())
+        elif mode == 'x-accel':
+            upload_root = Path(current_app.config['UPLOAD_FOLDER']).resolve()
+            try:
+                relative = path.resolve().relative_to(upload_root)
+            except ValueError:
+                logger.warning(f"Not offloading file outside UPLOAD_FOLDER: {path}")
+                return None
+            prefix = current_app.config.get('X_ACCEL_PREFIX', '/_protected_files').rstrip('/')
+            headers['X-Accel-Redirect'] = f'{prefix}/{quote(relative.as_posix())}'
+        else:
+            logger.warning(f"Unknown FILE_SERVING_MODE {mode!r}; serving from Python")
+            return None
+        # The front server fills in the body, length and Range handling
+        return Response(status=200, mimetype=mimetype, headers=headers)
@@ -0,0 +1,228 @@
+from typing import Dict, Iterable, List
+from sqlalchemy import select, insert, update, delete, bindparam, func, inspect, table, column
+from sqlalchemy.exc import IntegrityError
+import logging
+try:
+    from backend.models.database import db, Tag, FileTag
+    from backend.services.search_service import SearchService
+except ImportError:
+    from models.database import db, Tag, FileTag
+    from services.search_service import SearchService
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+# Tag.name and Tag.key are String(100)
+MAX_TAG_LENGTH = 100
+
+
+def _batches(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class TagExists(ValueError):
+    """Another tag of the user already has the name"""
+
+
+class TagService:
+    """Per-user tags linked to files through the ``file_tag`` association
+
+    Names are matched case-insensitively through ``Tag.key``, so "Work" and
+    "work" are one tag and "art" never matches "party". Tag filters and the
+    facet are joins on the (user_id, key) and (tag_id, file_id) indexes
+    instead of LIKE scans over a comma-joined string. The search index keeps
+    a copy of each file's tag names, so every write re-indexes the files it
+    touched (caller commits).
+    """
+
+    @staticmethod
+    def key(name: str) -> str:
+        return name.lower()
+
+    @staticmethod
+    def clean(names: Iterable[str]) -> List[str]:
+        """Strip names, drop empty ones and commas, and dedupe by key; raises ValueError if one is too long"""
+        cleaned, seen = [], set()
+        for name in names:
+            name = ' '.join(name.replace(',', ' ').split())
+            if len(name) > MAX_TAG_LENGTH:
+                raise ValueError(f"Tag names are at most {MAX_TAG_LENGTH} characters")
+            if name and TagService.key(name) not in seen:
+                seen.add(TagService.key(name))
+                cleaned.append(name)
+        return cleaned
+
+    @staticmethod
+    def lookup(user_id: int, names: Iterable[str]) -> Dict[str, Tag]:
+        """The user's existing tags for `names`, by key"""
+        keys = sorted({TagService.key(name) for name in names})
+        found = {}
+        for batch in _batches(keys):
+            for tag in db.session.scalars(select(Tag).where(Tag.user_id == user_id, Tag.key.in_(batch))):
+                found[tag.key] = tag
+        return found
+
+    @staticmethod
+    def ensure(user_id: int, names: Iterable[str]) -> Dict[str, int]:
+        """Tag ids for `names` by key, creating the missing tags in one INSERT"""
+        names = {TagService.key(name): name for name in names}
+        ids = {key: tag.id for key, tag in TagService.lookup(user_id, names.values()).items()}
+        missing = [{'user_id': user_id, 'name': name, 'key': key} for key, name in names.items() if key not in ids]
+        if missing:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(Tag), missing)
+            except IntegrityError:
+                # Another request created some of them; add the rest one by one
+                for row in missing:
+                    try:
+                        with db.session.begin_nested():
+                            db.session.execute(insert(Tag), [row])
+                    except IntegrityError:
+                        pass
+            ids.update({key: tag.id for key, tag in TagService.lookup(user_id, names.values()).items()})
+        return ids
+
+    @staticmethod
+    def names_for(file_ids: Iterable[int]) -> Dict[int, List[str]]:
+        """Tag names of each file, sorted; files without tags are absent"""
+        file_ids = list(file_ids)
+        names = {}
+        for batch in _batches(file_ids):
+            for file_id, name in db.session.execute(
+                select(FileTag.file_id, Tag.name).join(Tag, Tag.id == FileTag.tag_id)
+                .where(FileTag.file_id.in_(batch)).order_by(FileTag.file_id, Tag.name)
+            ):
+                names.setdefault(file_id, []).append(name)
+        return names
+
+    @staticmethod
+    def set_tags(user_id: int, file_tags: Dict[int, List[str]]) -> None:
+        """Replace the tags of each file with the given cleaned names
+
+        Only the difference is written: one DELETE and one INSERT for all
+        files together.
+        """
+        if not file_tags:
+            return
+        ids = TagService.ensure(user_id, [name for names in file_tags.values() for name in names])
+        wanted = {file_id: {ids[TagService.key(name)] for name in names} for file_id, names in file_tags.items()}
+        current = {}
+        for batch in _batches(list(file_tags)):
+            for file_id, tag_id in db.session.execute(
+                select(FileTag.file_id, FileTag.tag_id).where(FileTag.file_id.in_(batch))
+            ):
+                current.setdefault(file_id, set()).add(tag_id)
+
+        removed = [{'row_file_id': file_id, 'row_tag_id': tag_id}
+                   for file_id, tag_ids in current.items() for tag_id in tag_ids - wanted[file_id]]
+        added = [{'file_id': file_id, 'tag_id': tag_id}
+                 for file_id, tag_ids in wanted.items() for tag_id in tag_ids - current.get(file_id, set())]
+        file_tag = FileTag.__table__
+        if removed:
+            db.session.execute(
+                delete(file_tag).where(file_tag.c.file_id == bindparam('row_file_id'),
+                                       file_tag.c.tag_id == bindparam('row_tag_id')),
+                removed
+            )
+        if added:
+            db.session.execute(insert(file_tag), added)
+        changed = {row['row_file_id'] for row in removed} | {row['file_id'] for row in added}
+        if changed:
+            SearchService.reindex(sorted(changed))
+
+    @staticmethod
+    def rename(tag: Tag, name: str) -> None:
+        """Rename a tag; raises TagExists if another tag has the name, ValueError if it is invalid"""
+        cleaned = TagService.clean([name])
+        if not cleaned:
+            raise ValueError("Tag name is required")
+        name = cleaned[0]
+        other = TagService.lookup(tag.user_id, [name]).get(TagService.key(name))
+        if other is not None and other.id != tag.id:
+            raise TagExists(f"Tag '{other.name}' already exists")
+        tag.name, tag.key = name, TagService.key(name)
+        db.session.flush()
+        SearchService.reindex(db.session.scalars(select(FileTag.file_id).where(FileTag.tag_id == tag.id)).all())
+
+    @staticmethod
+    def delete(tag: Tag) -> None:
+        """Delete a tag and take it off every file"""
+        file_ids = db.session.scalars(select(FileTag.file_id).where(FileTag.tag_id == tag.id)).all()
+        db.session.execute(delete(FileTag).where(FileTag.tag_id == tag.id))
+        db.session.delete(tag)
+        db.session.flush()
+        SearchService.reindex(file_ids)
+
+    @staticmethod
+    def copy(id_map: Dict[int, int]) -> None:
+        """Give copied files the tags of their originals"""
+        rows = []
+        for batch in _batches(list(id_map)):
+            rows.extend({'file_id': id_map[file_id], 'tag_id': tag_id} for file_id, tag_id in db.session.execute(
+                select(FileTag.file_id, FileTag.tag_id).where(FileTag.file_id.in_(batch))
+            ))
+        for batch in _batches(rows):
+            db.session.execute(insert(FileTag.__table__), batch)
+
+    @staticmethod
+    def matching(user_id: int, names: Iterable[str], match_all: bool = False):
+        """SELECT of the ids of the user's files carrying any (or all) of `names`"""
+        keys = {TagService.key(name) for name in TagService.clean(names)}
+        query = select(FileTag.file_id).join(Tag, Tag.id == FileTag.tag_id).where(
+            Tag.user_id == user_id, Tag.key.in_(sorted(keys)))
+        if match_all and len(keys) > 1:
+            # (file_id, tag_id) is the primary key, so each tag counts once per file
+            query = query.group_by(FileTag.file_id).having(func.count() == len(keys))
+        return query
+
+    @staticmethod
+    def facet(user_id: int, file_ids=None) -> List[dict]:
+        """The user's tags with how many files carry each, most used first
+
+        `file_ids` (a list or an id SELECT) restricts the counts to those
+        files, e.g. a search result; tags they do not carry are left out.
+        """
+        count = func.count(FileTag.file_id)
+        query = select(Tag.id, Tag.name, count.label('count')).where(Tag.user_id == user_id)
+        if file_ids is None:
+            query = query.outerjoin(FileTag, FileTag.tag_id == Tag.id)
+        else:
+            query = query.join(FileTag, FileTag.tag_id == Tag.id).where(FileTag.file_id.in_(file_ids))
+        query = query.group_by(Tag.id, Tag.name).order_by(count.desc(), Tag.name)
+        return [{'id': row.id, 'name': row.name, 'count': row.count} for row in db.session.execute(query)]
+
+    @staticmethod
+    def split_legacy(batch_size: int = 1000) -> int:
+        """Move the comma-joined strings of the old ``file.tags`` column into tag rows
+
+        Migrated rows get NULL, so running it again only picks up what is
+        left. Returns the number of files migrated.
+        """
+        if 'tags' not in {c['name'] for c in inspect(db.engine).get_columns('file')}:
+            return 0
+        legacy = table('file', column('id'), column('user_id'), column('tags'))
+        migrated, last_id = 0, 0
+        while True:
+            rows = db.session.execute(
+                select(legacy.c.id, legacy.c.user_id, legacy.c.tags)
+                .where(legacy.c.id > last_id, legacy.c.tags.is_not(None), legacy.c.tags != '')
+                .order_by(legacy.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            by_user = {}
+            for row in rows:
+                names = TagService.clean(name[:MAX_TAG_LENGTH] for name in row.tags.split(','))
+                by_user.setdefault(row.user_id, {})[row.id] = names
+            for user_id, file_tags in by_user.items():
+                TagService.set_tags(user_id, file_tags)
+            db.session.execute(update(legacy).where(legacy.c.id.in_([row.id for row in rows])).values(tags=None))
+            db.session.commit()
+            migrated += len(rows)
+            last_id = rows[-1].id
+            logger.info(f"Split legacy tags: {migrated} files")
+        return migrated
@@ -0,0 +1,261 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, insert, update, delete, func, or_, false
+from pathlib import Path
+try:
+    from backend.models.database import db, File, FileTag, ShareLink, UploadSession
+    from backend.services.search_service import SearchService
+    from backend.services.tag_service import TagService
+    from backend.services.metadata_cache_service import MetadataCacheService
+    from backend.services.usage_service import UsageService
+    from backend.services.mimetype_service import MimetypeService
+except ImportError:
+    from models.database import db, File, FileTag, ShareLink, UploadSession
+    from services.search_service import SearchService
+    from services.tag_service import TagService
+    from services.metadata_cache_service import MetadataCacheService
+    from services.usage_service import UsageService
+    from services.mimetype_service import MimetypeService
+
+
+class TreeService:
+    """Set-based operations on folder subtrees
+
+    Every File row carries a materialized path of its ancestor ids
+    ('/1/5/9/'), so a subtree is an indexed range scan on ``File.path`` and
+    the ancestors of a row are parsed straight out of its path. Deleting,
+    sizing, validating or copying a tree costs a handful of statements
+    instead of one query per folder.
+    """
+
+    @staticmethod
+    def root_paths(root_ids: Iterable[int], user_id: int) -> List[str]:
+        """Paths of the given roots that belong to `user_id`"""
+        return db.session.execute(
+            select(File.path).where(File.id.in_(list(root_ids)), File.user_id == user_id)
+        ).scalars().all()
+
+    @staticmethod
+    def subtree_condition(paths: Iterable[str]):
+        """Condition selecting every row in the subtrees rooted at `paths`"""
+        conditions = [File.subtree_filter(path) for path in paths if path]
+        return or_(*conditions) if conditions else false()
+
+    @staticmethod
+    def depth_column():
+        """Absolute depth of a row, counted from the separators in its path"""
+        return (func.length(File.path) - func.length(func.replace(File.path, '/', '')) - 1).label('depth')
+
+    @staticmethod
+    def subtree_rows(root_ids: Iterable[int], user_id: int, *columns):
+        """Fetch `columns` of every row in the subtrees, shallowest first"""
+        condition = TreeService.subtree_condition(TreeService.root_paths(root_ids, user_id))
+        depth = TreeService.depth_column()
+        query = select(*columns, depth).where(condition).order_by(depth, File.id)
+        return db.session.execute(query).all()
+
+    @staticmethod
+    def subtree_size(root_ids: Iterable[int], user_id: int) -> Tuple[int, int]:
+        """Total bytes and number of files in the subtrees"""
+        condition = TreeService.subtree_condition(TreeService.root_paths(root_ids, user_id))
+        total, count = db.session.execute(
+            select(func.coalesce(func.sum(File.filesize), 0), func.count(File.id))
+            .where(condition, File.is_folder.is_(False))
+        ).one()
+        return int(total), int(count)
+
+    @staticmethod
+    def ancestors(node: File, user_id: int) -> List[File]:
+        """The folders above `node` and `node` itself, root first, in one query"""
+        ids = node.ancestor_ids
+        if not ids:
+            return [node] if node.user_id == user_id else []
+        rows = {f.id: f for f in File.query.filter(File.id.in_(ids), File.user_id == user_id)}
+        return [rows[i] for i in ids if i in rows]
+
+    @staticmethod
+    def breadcrumbs(node: File, user_id: int) -> List[dict]:
+        """Breadcrumb trail from the root down to `node`"""
+        return [{'id': f.id, 'name': f.filename} for f in TreeService.ancestors(node, user_id)]
+
+    @staticmethod
+    def would_create_cycle(item_ids: Iterable[int], destination_id: Optional[int]) -> bool:
+        """Check whether moving items into `destination_id` would put a folder inside itself
+
+        Only the destination's own path is read; its ancestors are in it.
+        """
+        if destination_id is None:
+            return False
+        destination = db.session.get(File, destination_id)
+        if destination is None:
+            return False
+        return bool(set(item_ids) & set(destination.ancestor_ids))
+
+    @staticmethod
+    def delete_subtrees(root_ids: Iterable[int], user_id: int, store) -> List[Path]:
+        """Delete the subtrees in bulk statements (caller commits)
+
+        Returns the blob paths to pass to ``store.unlink`` once the
+        transaction has committed.
+        """
+        UsageService.release_roots(root_ids, user_id)
+        condition = TreeService.subtree_condition(TreeService.root_paths(root_ids, user_id))
+        released = db.session.execute(
+            select(File.file_hash, File.filepath).where(condition, File.is_folder.is_(False))
+        ).all()
+        unreferenced = store.release(released)
+
+        subtree_ids = select(File.id).where(condition)
+        MetadataCacheService.invalidate(db.session.scalars(subtree_ids).all())
+        SearchService.remove(subtree_ids)
+        db.session.execute(delete(ShareLink).where(ShareLink.file_id.in_(subtree_ids)))
+        db.session.execute(delete(FileTag).where(FileTag.file_id.in_(subtree_ids)))
+        db.session.execute(
+            update(UploadSession).where(UploadSession.parent_folder_id.in_(subtree_ids)).values(parent_folder_id=None)
+        )
+        db.session.execute(
+            delete(File).where(File.id.in_(subtree_ids)).execution_options(synchronize_session=False)
+        )
+        db.session.expire_all()
+        return unreferenced
+
+    @staticmethod
+    def copy_subtrees(root_ids: Iterable[int], destination_id: Optional[int], user_id: int, store) -> Dict[int, int]:
+        """Copy the subtrees under `destination_id`, one bulk INSERT per tree level
+
+        Blob references are added in bulk; files that predate the blob store
+        are imported into it so the copies never share an unmanaged path.
+        The copied bytes are charged against the user's quota, raising
+        QuotaExceeded if they do not fit. Returns a mapping of original id to
+        new id (caller commits).
+        """
+        root_ids = list(root_ids)
+        columns = [File.id, File.filename, File.filepath, File.is_folder, File.parent_folder_id,
+                   File.filesize, File.mimetype, File.file_hash, File.tree_size]
+        rows = TreeService.subtree_rows(root_ids, user_id, *columns)
+
+        imported = {}
+        for row in rows:
+            if not row.is_folder and not row.file_hash and row.filepath not in imported:
+                imported[row.filepath] = store.import_file(Path(row.filepath))
+
+        new_ids = {}
+        references = {}
+        copied_bytes = 0
+        levels = {}
+        for row in rows:
+            levels.setdefault(row.depth, []).append(row)
+
+        roots = set(root_ids)
+        for depth in sorted(levels):
+            level = levels[depth]
+            values = []
+            for row in level:
+                file_hash, filepath, filesize = row.file_hash, row.filepath, row.filesize
+                if not row.is_folder:
+                    if not file_hash:
+                        file_hash, filesize, stored_path = imported[row.filepath]
+                        filepath = str(stored_path)
+                    references.setdefault(file_hash, [0, filesize])[0] += 1
+                    copied_bytes += filesize or 0
+                values.append({
+                    'filename': row.filename,
+                    'filepath': filepath,
+                    'user_id': user_id,
+                    'is_folder': row.is_folder,
+                    'parent_folder_id': destination_id if row.id in roots else new_ids[row.parent_folder_id],
+                    'filesize': filesize,
+                    'mimetype': row.mimetype,
+                    'file_hash': file_hash,
+                    'tree_size': row.tree_size or 0
+                })
+            inserted = db.session.execute(
+                insert(File).returning(File.id, sort_by_parameter_order=True), values
+            ).scalars().all()
+            new_ids.update(zip((row.id for row in level), inserted))
+            # Core inserts bypass the ORM events that maintain File.path
+            db.session.execute(File.path_update(inserted))
+
+        UsageService.charge(user_id, destination_id, copied_bytes, enforce=True)
+        store.add_references({h: tuple(v) for h, v in references.items()})
+        SearchService.copy(new_ids)
+        TagService.copy(new_ids)
+        return new_ids
+
+    @staticmethod
+    def register_tree(entries: List[dict], destination_id: Optional[int], user_id: int, store,
+                      root_name: Optional[str]) -> Dict[str, int]:
+        """Create rows for an extracted hierarchy under a new `root_name` folder
+
+        `entries` carry a '/'-separated relative ``path`` and ``is_folder``;
+        files also carry ``file_hash``, ``filesize``, ``filepath`` and
+        ``mimetype``. Folders that only appear as a path prefix are created
+        too. Rows go in with one bulk INSERT per tree level, folder sizes are
+        summed in memory and blob references added in bulk; the total is
+        charged against the user's quota, raising QuotaExceeded if it does
+        not fit. Returns relative path to new id, the root under '' (caller
+        commits). Without a `root_name` the entries go straight into the
+        destination, which '' then maps to.
+        """
+        nodes = {'': {'path': '', 'is_folder': True}}
+        for entry in entries:
+            parts = entry['path'].split('/')
+            for i in range(1, len(parts)):
+                prefix = '/'.join(parts[:i])
+                if not nodes.get(prefix, {}).get('is_folder'):
+                    nodes[prefix] = {'path': prefix, 'is_folder': True}
+            existing = nodes.get(entry['path'])
+            if entry['is_folder']:
+                nodes.setdefault(entry['path'], entry)
+            elif existing is None or not existing['is_folder']:
+                # A folder of the same name wins; its contents would lose their parent otherwise
+                nodes[entry['path']] = entry
+
+        tree_sizes = {}
+        references = {}
+        total = 0
+        for path, node in nodes.items():
+            if node['is_folder']:
+                continue
+            total += node['filesize']
+            references.setdefault(node['file_hash'], [0, node['filesize']])[0] += 1
+            parts = path.split('/')
+            for i in range(len(parts)):
+                prefix = '/'.join(parts[:i])
+                tree_sizes[prefix] = tree_sizes.get(prefix, 0) + node['filesize']
+        UsageService.charge(user_id, destination_id, total, enforce=True)
+
+        levels = {}
+        for path in nodes:
+            levels.setdefault(path.count('/') + 1 if path else 0, []).append(path)
+
+        new_ids = {}
+        if root_name is None:
+            new_ids[''] = destination_id
+            del levels[0]
+        for depth in sorted(levels):
+            level = levels[depth]
+            values = []
+            for path in level:
+                node = nodes[path]
+                parent = path.rpartition('/')[0]
+                values.append({
+                    'filename': path.rpartition('/')[2] if path else root_name,
+                    'filepath': '' if node['is_folder'] else node['filepath'],
+                    'user_id': user_id,
+                    'is_folder': node['is_folder'],
+                    'parent_folder_id': destination_id if not path else new_ids[parent],
+                    'filesize': 0 if node['is_folder'] else node['filesize'],
+                    'mimetype': None if node['is_folder'] else node['mimetype'],
+                    'file_hash': None if node['is_folder'] else node['file_hash'],
+                    'tree_size': tree_sizes.get(path, 0) if node['is_folder'] else 0
+                })
+            inserted = db.session.execute(
+                insert(File).returning(File.id, sort_by_parameter_order=True), values
+            ).scalars().all()
+            new_ids.update(zip(level, inserted))
+            db.session.execute(File.path_update(inserted))
+            SearchService.add(user_id, {file_id: v['filename'] for file_id, v in zip(inserted, values)})
+
+        store.add_references({h: tuple(v) for h, v in references.items()})
+        MimetypeService.remember({n['file_hash']: n.get('sniffed') for n in nodes.values() if not n['is_folder']})
+        return new_ids
@@ -0,0 +1,264 @@
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File as FilePart, Epilogue, NEED_DATA
+from werkzeug.utils import secure_filename
+import logging
+import tarfile
+import uuid
+try:
+    from backend.models.database import db, UploadSession
+    from backend.services.compression_service import CompressionService
+    from backend.utils.validators import Validators
+except ImportError:
+    from models.database import db, UploadSession
+    from services.compression_service import CompressionService
+    from utils.validators import Validators
+
+logger = logging.getLogger(__name__)
+
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk does not start at the last acknowledged offset"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+
+class _MultipartFiles:
+    """Pull-style reader over a multipart body, one file part at a time
+
+    Parts are decoded as the request streams in and handed out as file-like
+    objects, so no part is spooled to memory or disk on the way to the blob
+    store. Each part must be read to the end (or skipped) before the next.
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, stream, boundary: bytes):
+        self._stream = stream
+        # Bounds the decoder's buffer; it is drained after every chunk fed in
+        self._decoder = MultipartDecoder(boundary, max_form_memory_size=4 * self.READ_SIZE)
+        self._pending = b''
+        self._part_open = False
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if event is not NEED_DATA:
+                return event
+            self._decoder.receive_data(self._stream.read(self.READ_SIZE) or None)
+
+    def __iter__(self):
+        """Yield ``(field name, filename, reader)`` for every file part; other fields are skipped"""
+        while True:
+            while self._part_open:
+                self.read(self.READ_SIZE)
+            event = self._next_event()
+            if isinstance(event, Epilogue):
+                return
+            if isinstance(event, (Field, FilePart)):
+                self._part_open = True
+                if isinstance(event, FilePart):
+                    yield event.name, event.filename, self
+
+    def read(self, size: int = -1) -> bytes:
+        while self._part_open and (size < 0 or len(self._pending) < size):
+            event = self._next_event()
+            self._pending += event.data
+            self._part_open = event.more_data
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+class UploadService:
+    """Service for resumable, chunked uploads
+
+    Chunks are streamed from the request body straight into a staging file,
+    so no chunk (and never the whole upload) is held in memory. The upload
+    session row records the last acknowledged offset; a client that loses
+    its connection asks for the status and resumes from there.
+    """
+
+    COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, base_upload_path: str):
+        self.staging_dir = Path(base_upload_path) / '.staging'
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+
+    def create_session(self, user_id: int, filename: str, total_size: int,
+                       parent_folder_id: Optional[int] = None) -> UploadSession:
+        """Register a new upload and create its empty staging file"""
+        upload_id = uuid.uuid4().hex
+        staging_path = self.staging_dir / upload_id
+        staging_path.touch()
+
+        session = UploadSession(id=upload_id,
+                                user_id=user_id,
+                                filename=filename,
+                                parent_folder_id=parent_folder_id,
+                                total_size=total_size,
+                                received=0,
+                                staging_path=str(staging_path))
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def write_chunk(self, session: UploadSession, offset: int, stream, length: int) -> int:
+        """Append `length` bytes from `stream` at `offset`; returns the new acknowledged offset
+
+        The offset only advances once the whole chunk is on disk. A chunk cut
+        short by a dropped connection is simply overwritten by the retry.
+        """
+        if offset != session.received:
+            raise UploadOffsetMismatch(session.received)
+        if length > session.total_size - offset:
+            raise ValueError("Chunk extends past the declared upload size")
+
+        remaining = length
+        with open(session.staging_path, 'r+b') as staging:
+            staging.seek(offset)
+            while remaining > 0:
+                data = stream.read(min(self.COPY_BUFFER_SIZE, remaining))
+                if not data:
+                    raise IOError("Connection closed before the chunk was complete")
+                staging.write(data)
+                remaining -= len(data)
+
+        session.received = offset + length
+        db.session.commit()
+        return session.received
+
+    def finalize(self, session: UploadSession, store) -> Tuple[str, int, Path]:
+        """Hand a completed staging file to the blob store and drop the session row
+
+        Returns ``(file_hash, size, object_path)`` from the store. The caller
+        creates the File row in the same transaction.
+        """
+        if session.received != session.total_size:
+            raise ValueError(f"Upload incomplete: {session.received} of {session.total_size} bytes received")
+
+        stored = store.ingest_file(Path(session.staging_path))
+        db.session.delete(session)
+        return stored
+
+    def abort(self, session: UploadSession) -> None:
+        """Discard an upload and its staged bytes"""
+        try:
+            Path(session.staging_path).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Error deleting staging file {session.staging_path}: {str(e)}")
+        db.session.delete(session)
+        db.session.commit()
+
+    def expire_stale(self, ttl_seconds: int) -> int:
+        """Abort every upload that has not received a chunk within `ttl_seconds`"""
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+        stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+        for session in stale:
+            try:
+                Path(session.staging_path).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Error deleting staging file {session.staging_path}: {str(e)}")
+            db.session.delete(session)
+        db.session.commit()
+        return len(stale)
+
+    @staticmethod
+    def entry_path(name: str) -> str:
+        """Sanitised '/'-separated relative path of a bulk entry; raises ValueError if unusable"""
+        parts = []
+        for part in name.replace('\\', '/').split('/'):
+            if part in ('', '.'):
+                continue
+            if part == '..':
+                raise ValueError("Path traversal is not allowed")
+            part = secure_filename(part)
+            if not part:
+                raise ValueError("Invalid name")
+            parts.append(part)
+        if not parts:
+            raise ValueError("Invalid name")
+        return '/'.join(parts)
+
+    @staticmethod
+    def ingest_multipart(stream, boundary: bytes, store, budget, allowed_extensions: List[str]):
+        """Stream every file part of a multipart body into the blob store
+
+        A part's filename is its path relative to the destination
+        ('docs/2024/report.pdf'), which is how browsers send a folder
+        selection. Returns ``(entries, manifest)``; see :meth:`_ingest`.
+        """
+        return UploadService._ingest(
+            ((filename, False, part) for _, filename, part in _MultipartFiles(stream, boundary)),
+            store, budget, allowed_extensions)
+
+    @staticmethod
+    def ingest_tar(stream, store, budget, allowed_extensions: List[str]):
+        """Stream the members of a (possibly compressed) tar body into the blob store
+
+        The tar is read in one forward pass; links and device nodes are
+        ignored. Returns ``(entries, manifest)``; see :meth:`_ingest`.
+        """
+        def members(tarf):
+            for member in tarf:
+                if member.isdir():
+                    yield member.name, True, None
+                elif member.isfile():
+                    yield member.name, False, tarf.extractfile(member)
+
+        with tarfile.open(fileobj=stream, mode='r|*') as tarf:
+            return UploadService._ingest(members(tarf), store, budget, allowed_extensions)
+
+    @staticmethod
+    def _ingest(items: Iterable[Tuple[str, bool, object]], store, budget, allowed_extensions: List[str]):
+        """Store ``(name, is_folder, fileobj)`` items; returns ``(entries, manifest)``
+
+        `entries` are what TreeService.register_tree takes, one per distinct
+        path (a later duplicate replaces an earlier one). `manifest` has one
+        dict per item in request order with its ``name``, ``path`` and a
+        ``status`` of 'stored', 'replaced' or 'rejected' (with ``error``).
+        Rejected files are never read. `budget` limits the entry count and
+        bytes; if it runs out, or the body is malformed, the blobs written
+        so far are unlinked and the error propagates.
+        """
+        entries = {}
+        manifest = []
+        written = []
+        try:
+            for name, is_folder, fileobj in items:
+                record = {'name': name}
+                manifest.append(record)
+                try:
+                    path = UploadService.entry_path(name)
+                except ValueError as e:
+                    record.update(status='rejected', error=str(e))
+                    continue
+                record['path'] = path
+                if not is_folder and not Validators.allowed_file(path, allowed_extensions):
+                    record.update(status='rejected', error='File type not allowed')
+                    continue
+                if is_folder:
+                    budget.admit()
+                    entries.setdefault(path, {'path': path, 'is_folder': True})
+                else:
+                    budget.admit()
+                    entry = CompressionService.store_member(store, path, fileobj, budget)
+                    written.append(entry['filepath'])
+                    entries[path] = entry
+                record['status'] = 'stored'
+        except BaseException:
+            store.unlink(written)
+            raise
+
+        latest = {}
+        for record in manifest:
+            if record['status'] == 'stored':
+                previous = latest.get(record['path'])
+                if previous is not None and not entries[record['path']]['is_folder']:
+                    previous['status'] = 'replaced'
+                latest[record['path']] = record
+        return list(entries.values()), manifest
@@ -0,0 +1,195 @@
+from flask import current_app
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import aliased
+from typing import Dict, Iterable, Optional
+import logging
+try:
+    from backend.models.database import db, File, User
+except ImportError:
+    from models.database import db, File, User
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """Storing `requested` more bytes would take a user past their quota"""
+
+    def __init__(self, used: int, quota: int, requested: int):
+        self.used = used
+        self.quota = quota
+        self.requested = requested
+        super().__init__(f"Storage quota exceeded: {used} of {quota} bytes used, {requested} more requested")
+
+
+class UsageService:
+    """Materialized storage usage per user and per folder
+
+    ``User.storage_used`` is the sum of the user's file sizes and
+    ``File.tree_size`` the same sum for everything below a folder. Both are
+    adjusted in the caller's transaction whenever bytes are added, removed
+    or moved, so reading usage or a folder's size is a primary-key lookup
+    instead of an aggregate over the user's files. A folder's ancestors are
+    parsed from its materialized path, so one UPDATE covers the whole chain.
+
+    :meth:`reconcile` recomputes both counters with set-based statements and
+    corrects whatever drifted (bytes changed outside the app, a crash
+    between two writes); schedule ``flask reconcile-usage`` to run it
+    periodically (render.yaml runs it as a cron job).
+    """
+
+    @staticmethod
+    def quota_for(user: User) -> Optional[int]:
+        """The user's quota in bytes; None means unlimited"""
+        quota = user.storage_quota if user.storage_quota is not None else current_app.config.get('STORAGE_QUOTA')
+        return quota or None
+
+    @staticmethod
+    def usage(user_id: int) -> dict:
+        # Requests only carry a cached principal; the counters are read fresh
+        user = db.session.get(User, user_id)
+        used = user.storage_used or 0
+        quota = UsageService.quota_for(user)
+        return {
+            'used': used,
+            'quota': quota,
+            'available': max(quota - used, 0) if quota is not None else None
+        }
+
+    @staticmethod
+    def check(user_id: int, incoming: int) -> None:
+        """Raise QuotaExceeded if `incoming` more bytes would not fit; call before writing them"""
+        user = db.session.get(User, user_id)
+        quota = UsageService.quota_for(user)
+        used = user.storage_used or 0
+        if quota is not None and incoming > 0 and used + incoming > quota:
+            raise QuotaExceeded(used, quota, incoming)
+
+    @staticmethod
+    def _folder_chain(folder_id: Optional[int]) -> list:
+        """Ids of `folder_id` and every folder above it"""
+        if folder_id is None:
+            return []
+        path = db.session.execute(select(File.path).where(File.id == folder_id)).scalar()
+        return [int(part) for part in (path or '').split('/') if part]
+
+    @staticmethod
+    def _add_to_folders(folder_ids: Iterable[int], delta: int) -> None:
+        folder_ids = list(folder_ids)
+        if folder_ids and delta:
+            db.session.execute(
+                update(File).where(File.id.in_(folder_ids), File.is_folder.is_(True))
+                .values(tree_size=func.coalesce(File.tree_size, 0) + delta)
+                .execution_options(synchronize_session=False)
+            )
+
+    @staticmethod
+    def charge(user_id: int, folder_id: Optional[int], delta: int, enforce: bool = False) -> None:
+        """Add `delta` bytes (negative to release) to a user and the folders above `folder_id`
+
+        With `enforce`, the user's counter is only raised if the result stays
+        within quota; otherwise QuotaExceeded is raised and nothing changes.
+        Runs in the caller's transaction (caller commits).
+        """
+        if not delta:
+            return
+        increment = update(User).where(User.id == user_id).values(
+            storage_used=func.coalesce(User.storage_used, 0) + delta
+        ).execution_options(synchronize_session=False)
+        quota = UsageService.quota_for(db.session.get(User, user_id)) if enforce and delta > 0 else None
+        if quota is not None:
+            # The guard is part of the UPDATE, so concurrent uploads cannot both fit
+            increment = increment.where(func.coalesce(User.storage_used, 0) + delta <= quota)
+        if not db.session.execute(increment).rowcount and quota is not None:
+            used = db.session.execute(select(User.storage_used).where(User.id == user_id)).scalar() or 0
+            raise QuotaExceeded(used, quota, delta)
+        UsageService._add_to_folders(UsageService._folder_chain(folder_id), delta)
+        user = db.session.identity_map.get(db.session.identity_key(User, user_id))
+        if user is not None:
+            db.session.expire(user, ['storage_used'])
+
+    @staticmethod
+    def transfer(user_id: int, size: int, from_folder_id: Optional[int], to_folder_id: Optional[int]) -> None:
+        """Move `size` bytes between folders of one user (caller commits)
+
+        Only the folders that are not common ancestors of both ends change.
+        """
+        if not size or from_folder_id == to_folder_id:
+            return
+        UsageService.lock(user_id)
+        source = set(UsageService._folder_chain(from_folder_id))
+        destination = set(UsageService._folder_chain(to_folder_id))
+        UsageService._add_to_folders(source - destination, -size)
+        UsageService._add_to_folders(destination - source, size)
+
+    @staticmethod
+    def size_of(file: File) -> int:
+        """Bytes a row accounts for: its own size, or its subtree's for a folder"""
+        return (file.tree_size if file.is_folder else file.filesize) or 0
+
+    @staticmethod
+    def release_roots(root_ids: Iterable[int], user_id: int) -> None:
+        """Release the bytes of subtrees that are about to be deleted (caller commits)"""
+        rows = db.session.execute(
+            select(File.id, File.parent_folder_id, File.path, File.is_folder, File.filesize, File.tree_size)
+            .where(File.id.in_(list(root_ids)), File.user_id == user_id)
+        ).all()
+        ids = {row.id for row in rows}
+        for row in rows:
+            # A root inside another selected root is already counted by it
+            ancestors = [int(part) for part in (row.path or '').split('/') if part][:-1]
+            if ids.intersection(ancestors):
+                continue
+            size = (row.tree_size if row.is_folder else row.filesize) or 0
+            UsageService.charge(user_id, row.parent_folder_id, -size)
+
+    @staticmethod
+    def lock(user_id: int) -> None:
+        """Lock the user's row until the transaction ends
+
+        Every write to a user's counters holds this lock: charge() through
+        its UPDATE, transfer() and reconcile() explicitly. A recount
+        therefore never interleaves with a concurrent charge or move.
+        """
+        db.session.execute(select(User.id).where(User.id == user_id).with_for_update())
+
+    @staticmethod
+    def reconcile(user_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """Recompute user and folder counters from the File table and fix drift
+
+        Each user is recounted in its own short transaction holding the lock
+        on their row, so concurrent uploads, deletes and moves wait for
+        the recount instead of being overwritten by it, and are then applied
+        on top of it. Folder totals are range scans over the path index.
+        """
+        if user_ids is None:
+            user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+            db.session.commit()
+
+        owned = aliased(File)
+        child = aliased(File)
+        users_fixed = folders_fixed = 0
+        for user_id in user_ids:
+            UsageService.lock(user_id)
+            user_total = select(func.coalesce(func.sum(owned.filesize), 0)).where(
+                owned.user_id == user_id, owned.is_folder.is_(False)).scalar_subquery()
+            users_fixed += db.session.execute(
+                update(User).where(User.id == user_id, func.coalesce(User.storage_used, -1) != user_total)
+                .values(storage_used=user_total).execution_options(synchronize_session=False)
+            ).rowcount
+
+            folder_total = select(func.coalesce(func.sum(child.filesize), 0)).where(
+                child.user_id == user_id,
+                child.path > File.path,
+                child.path < func.substr(File.path, 1, func.length(File.path) - 1) + '0',
+                child.is_folder.is_(False)
+            ).scalar_subquery()
+            folders_fixed += db.session.execute(
+                update(File).where(File.user_id == user_id, File.is_folder.is_(True),
+                                   func.coalesce(File.tree_size, -1) != folder_total)
+                .values(tree_size=folder_total).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+
+        if users_fixed or folders_fixed:
+            logger.info(f"Usage reconciled: {users_fixed} users and {folders_fixed} folders corrected")
+        return {'users_fixed': users_fixed, 'folders_fixed': folders_fixed}
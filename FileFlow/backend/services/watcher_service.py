@@ -1,28 +1,137 @@
-import time
+from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+import logging
+import os
+import threading
+import time
+try:
+    from backend.services.reconcile_service import ReconcileService
+except ImportError:
+    from services.reconcile_service import ReconcileService
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process may watch
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ReconcilingEventHandler(FileSystemEventHandler):
+    """Collect changed paths and hand them to the reconciler in batches
+
+    Events only add a path to a set. A flusher thread applies the set once
+    no event has arrived for `debounce` seconds, right away when it grows
+    past `max_batch`, and at the latest MAX_DELAY_FACTOR debounce periods
+    after its first path, so a burst of writes becomes one bulk update.
+    """
+
+    MAX_DELAY_FACTOR = 10
 
+    def __init__(self, app, debounce: float = 2.0, max_batch: int = 5000):
+        self.app = app
+        self.root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self._paths = set()
+        self._first_event = self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
 
-class MyEventHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        print(f"Created: {event.src_path}")
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        paths = [p for p in paths if p and not ReconcileService.is_ignored(p, self.root)]
+        if not paths:
+            return
+        with self._lock:
+            if not self._paths:
+                self._first_event = time.monotonic()
+            self._paths.update(paths)
+            self._last_event = time.monotonic()
+            full = len(self._paths) >= self.max_batch
+        if full:
+            self._wake.set()
 
-    def on_modified(self, event):
-        print(f"Modified: {event.src_path}")
+    def run(self) -> None:
+        """Flusher loop; returns after stop()"""
+        while not self._stopped.is_set():
+            self._wake.wait(self.debounce)
+            self._wake.clear()
+            with self._lock:
+                now = time.monotonic()
+                due = (now - self._last_event >= self.debounce
+                       or now - self._first_event >= self.debounce * self.MAX_DELAY_FACTOR
+                       or len(self._paths) >= self.max_batch)
+                if not self._paths or not due:
+                    continue
+                paths, self._paths = self._paths, set()
+            self._flush(paths)
 
-    def on_deleted(self, event):
-        print(f"Deleted: {event.src_path}")
+    def _flush(self, paths) -> None:
+        with self.app.app_context():
+            try:
+                report = ReconcileService.apply(paths)
+                logger.debug(f"Reconciled {len(paths)} changed paths: {report.to_dict()}")
+            except Exception as e:
+                logger.error(f"Reconcile of {len(paths)} paths failed: {str(e)}", exc_info=True)
 
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
 
-def start_watching(path):
-    event_handler = MyEventHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path, recursive=True)
-    observer.start()
+
+class WatcherService:
+    """Run the watchdog observer and reconciler for one app
+
+    Only one process per host should watch: gunicorn workers race for an
+    exclusive lock on ``UPLOAD_FOLDER/.watcher.lock`` and the losers skip.
+    """
+
+    _lock_file = None
+    _observer = None
+    _handler = None
+
+    @classmethod
+    def start(cls, app) -> bool:
+        """Start watching in background threads; False if another process already is"""
+        if cls._observer is not None:
+            return True
+        upload_folder = Path(app.config['UPLOAD_FOLDER'])
+        upload_folder.mkdir(parents=True, exist_ok=True)
+        if fcntl is not None:
+            lock_file = open(upload_folder / '.watcher.lock', 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            cls._lock_file = lock_file
+
+        handler = ReconcilingEventHandler(app, app.config.get('WATCHER_DEBOUNCE', 2.0),
+                                          app.config.get('WATCHER_MAX_BATCH', 5000))
+        observer = Observer()
+        observer.schedule(handler, str(upload_folder), recursive=True)
+        observer.daemon = True
+        observer.start()
+        threading.Thread(target=handler.run, name='reconciler', daemon=True).start()
+        cls._observer, cls._handler = observer, handler
+        logger.info(f"Watching {upload_folder} for changes (pid {os.getpid()})")
+        return True
+
+
+def start_watching(app):
+    """Watch in the foreground until interrupted (``flask watch``)"""
+    if not WatcherService.start(app):
+        logger.warning("Another process is already watching the upload folder")
+        return
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
-
+        WatcherService._handler.stop()
+        WatcherService._observer.stop()
+    WatcherService._observer.join()
@@ -0,0 +1,72 @@
+"""Shared fixtures: the app on a throwaway SQLite database and upload folder"""
+from io import BytesIO
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Config reads the environment at import time
+_TMP = tempfile.mkdtemp(prefix='fileflow-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{Path(_TMP) / 'test.db'}"
+os.environ.setdefault('SECRET_KEY', 'test')
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from backend.app import app as flask_app, init_db  # noqa: E402
+from backend.models.database import db, User  # noqa: E402
+from backend.services.metadata_cache_service import MetadataCacheService  # noqa: E402
+from backend.services.principal_cache_service import PrincipalCacheService  # noqa: E402
+from backend.services.search_service import SearchService  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app.config.update(TESTING=True, UPLOAD_FOLDER=tmp_path / 'user_files')
+    with flask_app.app_context():
+        db.drop_all()
+        init_db()
+        SearchService.rebuild()
+    MetadataCacheService.clear()
+    PrincipalCacheService.clear()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+def make_user(username, password='password'):
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def login(app, username):
+    """A test client logged in as a new user `username`; returns (client, user id)"""
+    with app.app_context():
+        user_id = make_user(username)
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': 'password'})
+    assert response.status_code == 302
+    return client, user_id
+
+
+@pytest.fixture
+def client(app):
+    return login(app, 'alice')[0]
+
+
+def upload(client, data, name, folder_id=None):
+    form = {'file': (BytesIO(data), name)}
+    if folder_id is not None:
+        form['folder_id'] = str(folder_id)
+    response = client.post('/upload', data=form, headers={'Accept': 'application/json'})
+    assert response.status_code in (200, 201), response.get_data(as_text=True)
+    return response.json['file']['id']
+
+
+def create_folder(client, name, parent_id=None):
+    response = client.post('/create_folder', json={'folder_name': name, 'parent_folder_id': parent_id})
+    assert response.status_code in (200, 201), response.get_data(as_text=True)
+    return response.json['folder']['id']
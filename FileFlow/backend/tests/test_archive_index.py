@@ -0,0 +1,50 @@
+from io import BytesIO
+import os
+import zipfile
+
+import pytest
+
+from backend.models.database import ArchiveMember
+from backend.services.archive_index_service import ArchiveIndexService
+from backend.services.compression_service import CompressionService
+from backend.tests.conftest import upload
+
+
+@pytest.mark.parametrize('codec', ['gz', 'bz2', 'xz'])
+def test_parallel_tar_round_trip(tmp_path, codec):
+    # Repetitive members shrink to a few hundred bytes per block, so several
+    # compressed streams end inside one read and the next may start mid-header
+    contents = {}
+    for i in range(12):
+        data = (b'a' * (1024 * 1024 + i * 4099)) if i % 3 else os.urandom(70000 + i)
+        path = tmp_path / f'member{i}.bin'
+        path.write_bytes(data)
+        contents[path.name] = data
+    archive = tmp_path / f'archive.tar.{codec}'
+    CompressionService._create_tar_parallel([str(tmp_path / name) for name in contents], str(archive), codec, 2)
+
+    index, members = ArchiveIndexService.build(str(archive), f'tar.{codec}')
+    assert sorted(member.name for member in members) == sorted(contents)
+    for member in members:
+        assert member.size == len(contents[member.name])
+        assert b''.join(ArchiveIndexService.open_member(str(archive), index, member)) == contents[member.name]
+
+
+def test_member_download(client, app):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('docs/', b'')
+        zf.writestr('docs/readme.txt', b'read me')
+        zf.writestr('data.bin', b'\x00' * 5000, compress_type=zipfile.ZIP_DEFLATED)
+    archive = upload(client, buffer.getvalue(), 'bundle.zip')
+
+    # The first read indexes the archive, the second finds the member in the stored index
+    for _ in range(2):
+        response = client.get(f'/api/compress/member/{archive}?name=docs/readme.txt')
+        assert response.status_code == 200
+        assert response.data == b'read me'
+    assert client.get(f'/api/compress/member/{archive}?name=data.bin').data == b'\x00' * 5000
+    with app.app_context():
+        assert ArchiveMember.query.count() == 3
+    assert client.get(f'/api/compress/member/{archive}?name=docs/').status_code == 404
+    assert client.get(f'/api/compress/member/{archive}?name=missing.txt').status_code == 404
@@ -0,0 +1,72 @@
+from concurrent.futures import Executor, Future
+import asyncio
+import json
+import threading
+
+from backend.asgi import AsyncFlaskApp
+from backend.tests.conftest import upload
+
+
+class _ThreadPerTask(Executor):
+    """Runs every task on a new thread, like a busy pool handing chunks to whichever thread is free"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        threading.Thread(target=run).start()
+        return future
+
+
+def _call(asgi_app, path, query=b'', cookie=''):
+    """Run one GET through the ASGI app; returns (status, body)"""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'root_path': '',
+             'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode('latin-1'))],
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 5000), 'scheme': 'http', 'http_version': '1.1'}
+    sent = []
+
+    async def run():
+        requested = False
+        disconnected = asyncio.Event()
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi_app(scope, receive, send)
+
+    asyncio.run(run())
+    status = sent[0]['status']
+    return status, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def test_paginated_listing_streams_through_asgi(app, client):
+    for i in range(25):
+        upload(client, b'x' * i, f'file{i:02d}.txt')
+    cookie = f"session={client.get_cookie('session').value}"
+    asgi_app = AsyncFlaskApp(app, threads=1, spool_memory=1024, max_body=None, spool_dir=app.config['UPLOAD_FOLDER'])
+    asgi_app.executor.shutdown()
+    asgi_app.executor = _ThreadPerTask()
+
+    names, cursor = [], None
+    while True:
+        query = b'limit=10' + (f'&cursor={cursor}'.encode() if cursor else b'')
+        status, body = _call(asgi_app, '/api/files', query, cookie)
+        assert status == 200, body
+        page = json.loads(body)
+        names.extend(item['name'] for item in page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert names == [f'file{i:02d}.txt' for i in range(25)]
@@ -0,0 +1,37 @@
+import pytest
+
+from backend.models.database import db, BackfillCheckpoint, File
+from backend.utils import backfill
+from backend.utils.backfill import run_backfill
+from backend.tests.conftest import upload
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_size_backfill_resumes_from_checkpoint(client, app, monkeypatch):
+    ids = [upload(client, b'x' * (i + 1), f'{i}.txt') for i in range(5)]
+    with app.app_context():
+        db.session.query(File).update({File.filesize: 0})
+        db.session.commit()
+
+        # Stop the run right after its first page has committed
+        def interrupt(self, force=False):
+            raise Interrupted()
+        monkeypatch.setattr(backfill._Progress, 'report', interrupt)
+        with pytest.raises(Interrupted):
+            run_backfill('size', workers=1, batch_size=2)
+        checkpoint = db.session.get(BackfillCheckpoint, 'size')
+        assert (checkpoint.last_id, checkpoint.processed, checkpoint.finished_at) == (ids[1], 2, None)
+        assert [db.session.get(File, i).filesize for i in ids] == [1, 2, 0, 0, 0]
+
+        monkeypatch.undo()
+        result = run_backfill('size', workers=1, batch_size=2)
+        assert (result['processed'], result['updated'], result['errors']) == (5, 5, 0)
+        db.session.expire_all()
+        assert [db.session.get(File, i).filesize for i in ids] == [1, 2, 3, 4, 5]
+
+        # A finished task starts over; nothing is left to change
+        result = run_backfill('size', workers=1)
+        assert (result['processed'], result['updated']) == (5, 0)
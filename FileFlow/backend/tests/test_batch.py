@@ -0,0 +1,55 @@
+from backend.tests.conftest import create_folder, upload
+
+
+def listing(client, folder_id=None):
+    query = f'?folder_id={folder_id}' if folder_id is not None else ''
+    return {item['name']: item for item in client.get(f'/api/files{query}').json}
+
+
+def folder_size(client, folder_id):
+    return client.get(f'/api/usage?folder_id={folder_id}').json['folder']['size']
+
+
+def test_batch_round_trip(client):
+    projects = create_folder(client, 'projects')
+    archive = create_folder(client, 'archive')
+    nested = create_folder(client, 'nested', projects)
+    a = upload(client, b'a' * 10, 'a.txt', nested)
+    b = upload(client, b'b' * 20, 'b.txt', projects)
+    c = upload(client, b'c' * 30, 'c.txt')
+    assert folder_size(client, projects) == 30
+
+    response = client.post('/api/batch', json={'operations': [
+        {'op': 'move', 'ids': [nested, c, archive], 'destination_folder_id': archive},
+        {'op': 'rename', 'items': [{'id': b, 'new_name': 'renamed.txt'}, {'id': 999, 'new_name': 'x.txt'}]},
+        {'op': 'tag', 'ids': [a, b], 'add': ['work']},
+        {'op': 'delete', 'ids': [b]},
+    ]})
+    assert response.status_code == 200
+    results = [(r['op'], r['id'], r['success']) for r in response.json['results']]
+    assert results == [('move', nested, True), ('move', c, True), ('move', archive, False),
+                       ('rename', b, True), ('rename', 999, False),
+                       ('tag', a, True), ('tag', b, True), ('delete', b, True)]
+    assert response.json['success'] is False
+
+    assert sorted(listing(client, archive)) == ['c.txt', 'nested']
+    assert sorted(listing(client, nested)) == ['a.txt']
+    assert listing(client, projects) == {}
+    assert folder_size(client, projects) == 0
+    assert folder_size(client, archive) == 40
+    assert client.get('/api/usage').json['used'] == 40
+    assert client.get(f'/api/files/{a}/tags').json['tags'] == ['work']
+    assert [item['name'] for item in client.get('/api/breadcrumbs/' + str(nested)).json] == ['archive', 'nested']
+
+
+def test_batch_refusals(client):
+    folder = create_folder(client, 'folder')
+    inner = create_folder(client, 'inner', folder)
+    assert client.post('/api/batch', json={'operations': [{'op': 'explode', 'ids': [folder]}]}).status_code == 400
+    assert client.post('/api/batch', json={}).status_code == 400
+
+    # A folder cannot move into its own subtree
+    response = client.post('/api/batch', json={'operations': [
+        {'op': 'move', 'ids': [folder], 'destination_folder_id': inner}]})
+    assert [r['success'] for r in response.json['results']] == [False]
+    assert sorted(listing(client)) == ['folder']
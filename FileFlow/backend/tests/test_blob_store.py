@@ -0,0 +1,62 @@
+from io import BytesIO
+import os
+
+from backend.models.database import db, Blob
+from backend.services import blob_service
+from backend.services.blob_service import BlobStore
+from backend.services.mimetype_service import MimetypeService
+
+
+def test_references_and_release(app):
+    with app.app_context():
+        store = BlobStore(app.config['UPLOAD_FOLDER'])
+        file_hash, size, path = store.write_stream(BytesIO(b'content'))
+        assert path.read_bytes() == b'content'
+        store.add_references({file_hash: (2, size)})
+        db.session.commit()
+
+        assert store.release([(file_hash, str(path))]) == []
+        db.session.commit()
+        unreferenced = store.release([(file_hash, str(path))])
+        db.session.commit()
+        assert unreferenced == [path]
+        store.unlink(unreferenced)
+        assert not path.exists()
+
+
+def test_reused_object_survives_concurrent_unlink(app):
+    """A write re-uses an object whose last reference was just released"""
+    with app.app_context():
+        store = BlobStore(app.config['UPLOAD_FOLDER'])
+        file_hash, size, path = store.write_stream(BytesIO(b'shared'))
+        store.add_reference(file_hash, size)
+        db.session.commit()
+        released = store.release([(file_hash, str(path))])
+        db.session.commit()
+
+        # The upload sees the object and drops its own copy before the unlink runs...
+        assert store.write_stream(BytesIO(b'shared'))[2] == path
+        store.unlink(released)
+        # ...so the object must still be there when its reference commits
+        assert path.read_bytes() == b'shared'
+
+        # Once the pin is stale, releasing it removes the object again
+        stale = os.stat(store.pins_dir / file_hash).st_mtime - blob_service.PIN_SECONDS - 1
+        os.utime(store.pins_dir / file_hash, (stale, stale))
+        store.unlink(released)
+        assert not path.exists()
+        assert not (store.pins_dir / file_hash).exists()
+
+
+def test_failed_upload_leaves_no_object(client, app, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('sniffing failed')
+    monkeypatch.setattr(MimetypeService, 'for_blob', fail)
+
+    response = client.post('/upload', data={'file': (BytesIO(b'orphan'), 'orphan.txt')},
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 500
+    with app.app_context():
+        assert Blob.query.count() == 0
+    objects = app.config['UPLOAD_FOLDER'] / 'objects'
+    assert [p for p in objects.rglob('*') if p.is_file() and p.relative_to(objects).parts[0] != 'tmp'] == []
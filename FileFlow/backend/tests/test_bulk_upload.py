@@ -0,0 +1,56 @@
+from io import BytesIO
+import tarfile
+
+from backend.models.database import db, User
+
+
+def test_bulk_multipart(client):
+    form = {'file': [(BytesIO(b'one'), 'docs/one.txt'), (BytesIO(b'two'), 'docs/deep/two.txt'),
+                     (BytesIO(b'bad'), 'run.exe')]}
+    response = client.post('/api/upload/bulk', data=form, content_type='multipart/form-data')
+    assert response.status_code == 200
+    statuses = {entry['path']: entry['status'] for entry in response.json['entries']}
+    assert statuses['docs/one.txt'] == 'stored'
+    assert statuses['docs/deep/two.txt'] == 'stored'
+    assert statuses['run.exe'] != 'stored'
+
+    root = {item['name']: item for item in client.get('/api/files').json}
+    assert list(root) == ['docs']
+    docs = {item['name']: item for item in client.get(f"/api/files?folder_id={root['docs']['id']}").json}
+    assert sorted(docs) == ['deep', 'one.txt']
+    assert client.get(f"/download_file/{docs['one.txt']['id']}").data == b'one'
+    assert client.get('/api/usage').json['used'] == 6
+
+
+def test_bulk_tar(client):
+    buffer = BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, data in (('photos/a.txt', b'a' * 100), ('photos/b.txt', b'b' * 200)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, BytesIO(data))
+    response = client.post('/api/upload/bulk', data=buffer.getvalue(), content_type='application/gzip')
+    assert response.status_code == 200, response.json
+    stored = {entry['path']: entry for entry in response.json['entries'] if entry['status'] == 'stored'}
+    assert stored['photos/b.txt']['size'] == 200
+    assert client.get(f"/download_file/{stored['photos/a.txt']['id']}").data == b'a' * 100
+    photos = client.get('/api/files').json[0]
+    assert photos['name'] == 'photos'
+    assert client.get(f"/api/files/{photos['id']}/size").json == {'id': photos['id'], 'size': 300, 'file_count': 2}
+
+
+def test_bulk_refusals(client, app):
+    response = client.post('/api/upload/bulk', data=b'not a tar stream' * 100, content_type='application/x-tar')
+    assert response.status_code == 400
+
+    with app.app_context():
+        db.session.query(User).update({User.storage_quota: 100})
+        db.session.commit()
+    form = {'file': [(BytesIO(b'a' * 60), 'a.txt'), (BytesIO(b'b' * 60), 'b.txt')]}
+    response = client.post('/api/upload/bulk', data=form, content_type='multipart/form-data')
+    assert response.status_code == 413
+    # Nothing of a refused upload is kept
+    assert client.get('/api/files').json == []
+    assert client.get('/api/usage').json['used'] == 0
+    objects = app.config['UPLOAD_FOLDER'] / 'objects'
+    assert [p for p in objects.rglob('*') if p.is_file() and p.relative_to(objects).parts[0] != 'tmp'] == []
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from backend.models.database import db, UploadSession
+from backend.tests.conftest import login
+
+
+def test_chunked_upload_round_trip(client):
+    data = bytes(range(256)) * 40
+    response = client.post('/api/upload/init', json={'filename': 'chunks.txt', 'size': len(data)})
+    assert response.status_code == 201
+    upload_id = response.json['upload_id']
+
+    assert client.put(f'/api/upload/{upload_id}?offset=0', data=data[:4000]).json['offset'] == 4000
+    response = client.put(f'/api/upload/{upload_id}?offset=0', data=data[:4000])
+    assert response.status_code == 409
+    assert response.json['offset'] == 4000
+    assert client.post(f'/api/upload/{upload_id}/finalize').status_code == 409
+
+    response = client.put(f'/api/upload/{upload_id}?offset=4000', data=data[4000:])
+    assert response.json['complete'] is True
+    response = client.post(f'/api/upload/{upload_id}/finalize')
+    assert response.status_code == 200
+    file_id = response.json['file']['id']
+    assert client.get(f'/download_file/{file_id}').data == data
+
+
+def test_resume_and_abort(client, app):
+    upload_id = client.post('/api/upload/init', json={'filename': 'big.txt', 'size': 100}).json['upload_id']
+    client.put(f'/api/upload/{upload_id}?offset=0', data=b'x' * 30)
+
+    # A client that lost its connection asks where to carry on
+    status = client.get(f'/api/upload/{upload_id}').json
+    assert (status['offset'], status['complete']) == (30, False)
+    other, _ = login(app, 'mallory')
+    assert other.get(f'/api/upload/{upload_id}').status_code == 403
+    assert other.delete(f'/api/upload/{upload_id}').status_code == 403
+
+    with app.app_context():
+        staging = Path(db.session.get(UploadSession, upload_id).staging_path)
+    assert staging.stat().st_size == 30
+    assert client.delete(f'/api/upload/{upload_id}').json['success']
+    assert not staging.exists()
+    assert client.get(f'/api/upload/{upload_id}').status_code == 404
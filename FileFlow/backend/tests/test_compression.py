@@ -0,0 +1,71 @@
+from io import BytesIO
+import os
+import tarfile
+import zipfile
+import zlib
+
+import pytest
+
+from backend.services.compression_service import CompressionService, _ZipWriter
+
+
+@pytest.fixture
+def members(tmp_path):
+    contents = {
+        'notes.txt': b'compressible text\n' * 200000,
+        'empty.txt': b'',
+        'photo.jpg': os.urandom(CompressionService.PARALLEL_BLOCK_SIZE + 123),
+        'résumé.txt': b'unicode name',
+    }
+    entries = []
+    for i, (name, data) in enumerate(contents.items()):
+        path = tmp_path / f'blob{i}'
+        path.write_bytes(data)
+        entries.append((str(path), name))
+    return entries, contents
+
+
+def test_parallel_zip_opens_with_zipfile(tmp_path, members):
+    entries, contents = members
+    archive = tmp_path / 'parallel.zip'
+    done = []
+    CompressionService.create_archive(entries, str(archive), 'zip', workers=2,
+                                      progress=lambda nbytes=0, count=0: done.append((nbytes, count)))
+
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(contents)
+        for name, data in contents.items():
+            assert zf.read(name) == data
+        # Already-compressed types are stored, the rest deflated
+        assert zf.getinfo('photo.jpg').compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo('notes.txt').compress_type == zipfile.ZIP_DEFLATED
+    assert sum(nbytes for nbytes, _ in done) == sum(map(len, contents.values()))
+    assert sum(count for _, count in done) == len(contents)
+
+
+def test_parallel_tar_matches_serial(tmp_path, members):
+    entries, contents = members
+    CompressionService.create_archive(entries, str(tmp_path / 'serial.tar.gz'), 'tar.gz')
+    CompressionService.create_archive(entries, str(tmp_path / 'parallel.tar.gz'), 'tar.gz', workers=2)
+    with tarfile.open(tmp_path / 'serial.tar.gz') as serial, tarfile.open(tmp_path / 'parallel.tar.gz') as parallel:
+        assert parallel.getnames() == serial.getnames()
+        for name, data in contents.items():
+            assert parallel.extractfile(name).read() == data
+
+
+def test_zip64_end_records():
+    """Past 65535 members the writer adds the ZIP64 end of central directory"""
+    buffer = BytesIO()
+    writer = _ZipWriter(buffer)
+    zinfo = zipfile.ZipInfo('member')
+    for i in range(0x10000 + 5):
+        zinfo.filename = f'{i}.txt'
+        member = writer.begin(zinfo, deflated=False)
+        writer.write(member, b'%d' % i)
+        writer.end(member, zlib.crc32(b'%d' % i), len(b'%d' % i))
+    writer.close()
+
+    with zipfile.ZipFile(buffer) as zf:
+        assert len(zf.infolist()) == 0x10000 + 5
+        assert zf.read('65539.txt') == b'65539'
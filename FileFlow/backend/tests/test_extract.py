@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+import json
+import zipfile
+
+import py7zr
+import pytest
+
+from backend.api.compression import _register_extracted_tree
+from backend.services.blob_service import BlobStore
+from backend.services.compression_service import (CompressionService, ExtractionBudget,
+                                                  ExtractionBudgetExceeded, ExtractionFailed)
+from backend.tests.conftest import upload
+
+
+def _objects(store):
+    return sorted(p for p in store.objects_dir.rglob('*') if p.is_file() and store.tmp_dir not in p.parents)
+
+
+def test_7z_members_stream_into_store(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'docs').mkdir(parents=True)
+    (source / 'docs' / 'a.txt').write_bytes(b'a' * 100000)
+    (source / 'b.bin').write_bytes(b'\x00\x01' * 5000)
+    archive = tmp_path / 'archive.7z'
+    with py7zr.SevenZipFile(archive, 'w') as szf:
+        szf.writeall(source, 'src')
+
+    store = BlobStore(tmp_path / 'store')
+    entries = CompressionService.extract_to_store(str(archive), '7z', store, ExtractionBudget(100, 10 ** 6))
+    files = {entry['path']: entry for entry in entries if not entry['is_folder']}
+    assert sorted(files) == ['src/b.bin', 'src/docs/a.txt']
+    assert {entry['path'] for entry in entries if entry['is_folder']} == {'src', 'src/docs'}
+    with open(files['src/docs/a.txt']['filepath'], 'rb') as f:
+        assert f.read() == b'a' * 100000
+    assert [p for p in store.tmp_dir.iterdir() if p.is_file()] == []
+
+    with pytest.raises(ExtractionBudgetExceeded):
+        CompressionService.extract_to_store(str(archive), '7z', BlobStore(tmp_path / 'small'), ExtractionBudget(100, 1000))
+    assert _objects(BlobStore(tmp_path / 'small')) == []
+
+
+def test_failed_extraction_releases_only_unreferenced_blobs(app, client):
+    shared = b'already uploaded'
+    upload(client, shared, 'kept.txt')
+    archive = app.config['UPLOAD_FOLDER'] / 'bomb.zip'
+    with zipfile.ZipFile(archive, 'w') as zipf:
+        zipf.writestr('kept.txt', shared)
+        zipf.writestr('new.txt', b'fresh content')
+        zipf.writestr('huge.txt', b'x' * 50000)
+
+    result = CompressionService.run_extract_job({
+        'archive_path': str(archive), 'upload_folder': str(app.config['UPLOAD_FOLDER']), 'format': 'zip',
+        'max_members': 10, 'max_bytes': 1000
+    })
+    assert 'Archive expands' in result['error']
+    assert len(result['written']) == 2
+
+    with app.app_context():
+        store = BlobStore(app.config['UPLOAD_FOLDER'])
+        before = _objects(store)
+        job = SimpleNamespace(params=json.dumps({'parent_folder_id': None, 'folder_name': 'bomb'}), user_id=1)
+        with pytest.raises(ExtractionFailed):
+            _register_extracted_tree(job, result)
+        after = _objects(store)
+    # The blob another file references survives; the one only this extraction wrote is gone
+    assert len(before) - len(after) == 1
+    assert client.get('/api/files').json[0]['name'] == 'kept.txt'
@@ -0,0 +1,79 @@
+import json
+import time
+
+import pytest
+
+from backend.models.database import db, Job
+from backend.services.job_service import JobService
+from backend.tests.conftest import login, upload
+
+
+@pytest.fixture
+def jobs(app):
+    app.config.update(JOB_WORKERS=1, COMPRESSION_WORKERS=1)
+    yield JobService
+    if JobService._executor is not None:
+        JobService._executor.shutdown()
+        JobService._executor = None
+
+
+def check_password(params, progress):
+    """Work function run in the pool; pickled by reference, so module level"""
+    progress(nbytes=len(params['password']), members=1)
+    return {'password_seen': params['password'] == 'secret'}
+
+
+def wait_for(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').json
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_archive_create_and_extract(client, jobs):
+    ids = [upload(client, b'alpha' * 1000, 'alpha.txt'), upload(client, b'beta', 'beta.txt')]
+
+    response = client.post('/api/compress/create', json={'file_ids': ids, 'archive_name': 'bundle', 'format': 'zip'})
+    assert response.status_code == 202
+    job = wait_for(client, response.json['job_id'])
+    assert job['status'] == 'done', job['error']
+    assert job['members_done'] == 2
+    archive_id = job['result']['file_id']
+    assert client.get(f'/api/compress/list/{archive_id}').json['contents'] == ['alpha.txt', 'beta.txt']
+
+    response = client.post(f'/api/compress/extract/{archive_id}', json={})
+    assert response.status_code == 202
+    job = wait_for(client, response.json['job_id'])
+    assert job['status'] == 'done', job['error']
+    folder_id = job['result']['folder_id']
+    names = sorted(item['name'] for item in client.get(f'/api/files?folder_id={folder_id}').json)
+    assert names == ['alpha.txt', 'beta.txt']
+    archive_size = client.get(f'/api/files/{archive_id}/size').json['size']
+    assert client.get('/api/usage').json['used'] == 2 * (5000 + 4) + archive_size
+    assert client.get(f'/api/usage?folder_id={folder_id}').json['folder']['size'] == 5000 + 4
+
+
+def test_failed_job_reports_error(client, jobs):
+    archive_id = upload(client, b'not a zip', 'broken.zip')
+    response = client.post(f'/api/compress/extract/{archive_id}', json={})
+    job = wait_for(client, response.json['job_id'])
+    assert job['status'] == 'failed'
+    assert job['error']
+
+
+def test_secret_params_reach_the_worker_only(app, jobs):
+    client, user_id = login(app, 'bob')
+    with app.app_context():
+        job_id = JobService.submit(app, user_id, 'check', {'password': 'secret', 'name': 'x'},
+                                   check_password).id
+        assert json.loads(db.session.get(Job, job_id).params) == {'name': 'x'}
+
+    job = wait_for(client, job_id)
+    assert job['status'] == 'done', job['error']
+    assert job['result'] == {'password_seen': True}
+    assert job['members_done'] == 1
+    other, _ = login(app, 'mallory')
+    assert other.get(f'/api/jobs/{job_id}').status_code == 403
@@ -0,0 +1,41 @@
+from backend.models.database import db, File
+from backend.services.metadata_cache_service import MetadataCacheService, TTLCache
+from backend.tests.conftest import upload
+
+
+def test_metadata_cache_and_conditional_get(client, app):
+    file_id = upload(client, b'0123456789' * 10, 'digits.txt')
+    response = client.get(f'/download_file/{file_id}')
+    etag = response.headers['ETag']
+    assert response.data == b'0123456789' * 10
+
+    assert client.get(f'/download_file/{file_id}', headers={'If-None-Match': etag}).status_code == 304
+    response = client.get(f'/view_file/{file_id}', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.data == b'0123456789'
+
+    with app.app_context():
+        assert MetadataCacheService.get(file_id).filename == 'digits.txt'
+    client.post(f'/rename_file/{file_id}', json={'new_name': 'numbers.txt'})
+    with app.app_context():
+        assert MetadataCacheService.get(file_id).filename == 'numbers.txt'
+        db.session.delete(db.session.get(File, file_id))
+        db.session.commit()
+    assert client.get(f'/download_file/{file_id}').status_code == 404
+
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('backend.services.metadata_cache_service.time.monotonic', lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+    now[0] += 11
+    assert cache.get('a', 'expired') == 'expired'
+    assert len(cache) == 1
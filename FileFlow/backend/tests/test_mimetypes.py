@@ -0,0 +1,46 @@
+import pytest
+
+from backend.models.database import db, Blob, File
+from backend.services.mimetype_service import MimetypeService
+from backend.tests.conftest import upload
+
+
+@pytest.mark.parametrize('sniffed, filename, expected', [
+    # A specific sniffed format beats the extension
+    ('application/pdf', 'report.txt', 'application/pdf'),
+    ('image/png', 'photo.jpg', 'image/png'),
+    # Generic verdicts defer to a more precise extension
+    ('text/plain', 'table.csv', 'text/csv'),
+    ('application/zip', 'letter.docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    ('text/plain', 'README', 'text/plain'),
+    (None, 'page.html', 'text/html'),
+    (None, None, 'application/octet-stream'),
+    ('inode/x-empty', 'blank', 'application/octet-stream'),
+    # Binary bytes behind a text extension stay binary
+    ('application/octet-stream', 'notes.txt', 'application/octet-stream'),
+    # Sniffing alone never yields a type browsers execute
+    ('text/html', 'notes.txt', 'text/plain'),
+    ('image/svg+xml', 'logo.png', 'image/png'),
+    ('text/html', 'download', 'text/plain'),
+    ('text/html', 'index.html', 'text/html'),
+])
+def test_resolve(sniffed, filename, expected):
+    assert MimetypeService.resolve(sniffed, filename) == expected
+
+
+@pytest.mark.skipif(not MimetypeService.available(), reason='libmagic is not installed')
+def test_verdict_is_kept_per_blob(client, app):
+    pdf = b'%PDF-1.4\n' + b'0' * 100
+    first = upload(client, pdf, 'scan.txt')
+    html = upload(client, b'<!DOCTYPE html><html><body>hi</body></html>', 'page.txt')
+    with app.app_context():
+        assert db.session.get(File, first).mimetype == 'application/pdf'
+        assert db.session.get(File, html).mimetype == 'text/plain'
+        blob = db.session.get(Blob, db.session.get(File, first).file_hash)
+        assert blob.mimetype == 'application/pdf'
+        # The stored verdict is reused for the same content under any name
+        blob.mimetype = 'application/x-tar'
+        db.session.commit()
+    again = upload(client, pdf, 'copy.pdf')
+    with app.app_context():
+        assert db.session.get(File, again).mimetype == 'application/x-tar'
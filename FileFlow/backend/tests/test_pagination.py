@@ -0,0 +1,37 @@
+from backend.tests.conftest import create_folder, upload
+
+
+def search(client, **body):
+    response = client.post('/api/search', json=body)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.json
+
+
+def test_keyset_pages(client):
+    ids = [upload(client, f'file {i}'.encode(), f'file{i:02}.txt') for i in range(7)]
+
+    seen, cursor = [], None
+    while True:
+        query = '/api/files?limit=3&fields=id' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(query).json
+        assert len(page['items']) <= 3
+        seen.extend(item['id'] for item in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == ids
+
+    page = search(client, query='file', limit=5)
+    assert len(page['items']) == 5
+    rest = search(client, query='file', limit=5, cursor=page['next_cursor'])
+    assert rest['next_cursor'] is None
+    assert sorted(item['id'] for item in page['items'] + rest['items']) == ids
+
+    # Folders are listed before files, each in name order, across page boundaries
+    folder = create_folder(client, 'zz folder')
+    page = client.get('/api/files?limit=2&fields=id,name').json
+    assert [item['name'] for item in page['items']] == ['zz folder', 'file00.txt']
+    assert page['items'][0]['id'] == folder
+
+    assert client.get('/api/files?cursor=garbage').status_code == 400
+    assert client.get('/api/files?fields=id,secret').status_code == 400
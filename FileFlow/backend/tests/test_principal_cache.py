@@ -0,0 +1,48 @@
+from backend.models.database import db, User
+from backend.services.principal_cache_service import PrincipalCacheService
+from backend.tests.conftest import login
+
+
+def test_principal_cache(app):
+    app.config['PRINCIPAL_CACHE_URL'] = 'local://'
+    PrincipalCacheService._cache = PrincipalCacheService._shared = None
+    try:
+        client, user_id = login(app, 'bob')
+        assert client.get('/api/usage').status_code == 200
+        with app.app_context():
+            principal = PrincipalCacheService.get(user_id)
+            assert (principal.id, principal.username) == (user_id, 'bob')
+            # Served by the shared tier once this process forgets it
+            PrincipalCacheService.clear()
+            assert PrincipalCacheService._shared.get(f'principal:{user_id}') is not None
+            assert PrincipalCacheService.get(user_id).email == 'bob@example.com'
+
+            user = db.session.get(User, user_id)
+            user.email = 'robert@example.com'
+            db.session.commit()
+            assert PrincipalCacheService.get(user_id).email == 'robert@example.com'
+
+            db.session.delete(db.session.get(User, user_id))
+            db.session.commit()
+            assert PrincipalCacheService.get(user_id) is None
+        # The session now points at a deleted account
+        assert client.get('/api/usage').status_code in (302, 401)
+    finally:
+        app.config.pop('PRINCIPAL_CACHE_URL')
+        PrincipalCacheService._cache = PrincipalCacheService._shared = None
+
+
+
+def test_unsupported_shared_store(app):
+    app.config['PRINCIPAL_CACHE_URL'] = 'memcached://localhost'
+    PrincipalCacheService._cache = PrincipalCacheService._shared = None
+    try:
+        client, user_id = login(app, 'carol')
+        # Principals are still cached, per process only
+        assert client.get('/api/usage').status_code == 200
+        assert PrincipalCacheService._shared is None
+        with app.app_context():
+            assert PrincipalCacheService.get(user_id).username == 'carol'
+    finally:
+        app.config.pop('PRINCIPAL_CACHE_URL')
+        PrincipalCacheService._cache = PrincipalCacheService._shared = None
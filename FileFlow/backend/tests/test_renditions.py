@@ -0,0 +1,44 @@
+from io import BytesIO
+import os
+
+import pytest
+from PIL import Image
+
+from backend.services.rendition_service import RenditionError, RenditionService
+
+
+@pytest.fixture
+def renditions():
+    yield RenditionService
+    if RenditionService._executor is not None:
+        RenditionService._executor.shutdown()
+        RenditionService._executor = None
+    RenditionService._pending.clear()
+
+
+def test_render_round_trip(app, renditions, tmp_path):
+    source = tmp_path / 'photo.png'
+    Image.new('RGB', (400, 200), (200, 30, 30)).save(source)
+    with app.app_context():
+        target = renditions.get(str(source), 'photo-key', 64, 'jpeg')
+        with Image.open(target) as image:
+            assert image.format == 'JPEG'
+            assert max(image.size) == 64
+        assert renditions._pending == {}
+        # A second request is served from the cache
+        assert renditions.get(str(source), 'photo-key', 64, 'jpeg') == target
+
+
+def test_failed_render_is_not_pending(app, renditions, tmp_path):
+    source = tmp_path / 'broken.png'
+    source.write_bytes(b'not an image')
+    with app.app_context():
+        with pytest.raises(RenditionError):
+            renditions.get(str(source), 'broken-key', 64, 'jpeg')
+        assert renditions._pending == {}
+
+        # Once the source is fixed the same rendition renders again
+        buffer = BytesIO()
+        Image.new('RGB', (32, 32)).save(buffer, 'PNG')
+        source.write_bytes(buffer.getvalue())
+        assert os.path.exists(renditions.get(str(source), 'broken-key', 64, 'jpeg'))
@@ -0,0 +1,49 @@
+import gzip
+import time
+
+from backend.tests.conftest import upload
+
+
+def test_response_compression(client):
+    text = b'compressible line of text\n' * 500
+    file_id = upload(client, text, 'big.txt')
+    response = client.get(f'/download_file/{file_id}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == text
+
+    # Revalidating the compressed copy confirms its own ETag
+    etag = response.headers['ETag']
+    response = client.get(f'/download_file/{file_id}', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    # Ranges are always served from the identity encoding
+    response = client.get(f'/download_file/{file_id}', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-9'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == text[:10]
+
+
+def test_stored_variants(client, app):
+    text = b'frequently served text\n' * 500
+    file_id = upload(client, text, 'popular.txt')
+    url = f'/download_file/{file_id}'
+    for _ in range(app.config['PRECOMPRESS_AFTER_HITS']):
+        assert 'Content-Length' not in client.get(url, headers={'Accept-Encoding': 'gzip'}).headers
+
+    variants = app.config['UPLOAD_FOLDER'] / '.variants'
+    deadline = time.monotonic() + 10
+    while not list(variants.rglob('*.gz')) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # The stored variant is sent with its length
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert gzip.decompress(response.data) == text
+
+
+def test_skipped_bodies(client):
+    small = upload(client, b'tiny text', 'small.txt')
+    image = upload(client, b'\x89PNG\r\n\x1a\n' + b'\x00' * 4000, 'image.png')
+    for file_id in (small, image):
+        response = client.get(f'/download_file/{file_id}', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
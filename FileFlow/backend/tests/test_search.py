@@ -0,0 +1,46 @@
+import time
+
+from backend.services.search_service import extract_text
+from backend.tests.conftest import upload
+
+
+def search(client, **body):
+    response = client.post('/api/search', json=body)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.json
+
+
+def test_content_search(client):
+    notes = upload(client, b'quarterly budget review for the finance team', 'notes.txt')
+    budget = upload(client, b'nothing relevant in here', 'budget.txt')
+    upload(client, b'holiday photos', 'trip.txt')
+
+    # Document text is indexed in the background after the upload commits
+    deadline = time.monotonic() + 60
+    while not search(client, query='finance') and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    found = search(client, query='budget', fields='id,name')
+    assert sorted(item['id'] for item in found) == sorted([notes, budget])
+    assert set(found[0]) == {'id', 'name'}
+    assert [item['id'] for item in search(client, query='finance')] == [notes]
+    assert search(client, query='finance', size_max=10) == []
+
+    client.put(f'/api/files/{budget}/tags', json={'tags': ['finance']})
+    assert [item['id'] for item in search(client, tags=['Finance'])] == [budget]
+
+    # Renames are re-indexed
+    client.post('/api/batch', json={'operations': [{'op': 'rename', 'items': [{'id': budget, 'new_name': 'plan.txt'}]}]})
+    assert [item['id'] for item in search(client, query='budget')] == [notes]
+
+
+def test_extract_text(tmp_path):
+    html = tmp_path / 'page.html'
+    html.write_text('<html><script>var hidden;</script><p>visible words</p></html>')
+    assert extract_text(html, 'text/html', 1000).split() == ['visible', 'words']
+    data = tmp_path / 'data.json'
+    data.write_text('{"city": "Oslo", "tags": ["north"]}')
+    assert extract_text(data, 'application/json', 1000) == 'city Oslo tags north'
+    assert extract_text(data, 'application/json', 10) == '{"city": "'
+    assert extract_text(data, 'image/png', 1000) is None
+
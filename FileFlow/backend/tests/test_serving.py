@@ -0,0 +1,68 @@
+from email.utils import formatdate
+import re
+
+from backend.models.database import db, File
+from backend.tests.conftest import upload
+
+DATA = bytes(range(256)) * 8
+
+
+def test_ranges(client):
+    file_id = upload(client, DATA, 'data.txt')
+    url = f'/view_file/{file_id}'
+
+    response = client.get(url, headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 2038-2047/2048'
+    assert response.data == DATA[-10:]
+
+    response = client.get(url, headers={'Range': 'bytes=0-4,100-109'})
+    assert response.status_code == 206
+    boundary = re.search(r'boundary=(\w+)', response.headers['Content-Type']).group(1)
+    assert int(response.headers['Content-Length']) == len(response.data)
+    parts = response.data.split(f'--{boundary}'.encode())[1:-1]
+    bodies = [part.split(b'\r\n\r\n', 1)[1][:-2] for part in parts]
+    assert bodies == [DATA[0:5], DATA[100:110]]
+    assert b'Content-Range: bytes 100-109/2048' in parts[1]
+
+    response = client.get(url, headers={'Range': f'bytes={len(DATA)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+    # An unparseable header is ignored rather than refused
+    assert client.get(url, headers={'Range': 'lines=1-2'}).status_code == 200
+
+
+def test_if_range(client):
+    file_id = upload(client, DATA, 'data.txt')
+    url = f'/view_file/{file_id}'
+    full = client.get(url)
+    etag, last_modified = full.headers['ETag'], full.headers['Last-Modified']
+
+    for validator in (etag, last_modified):
+        response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': validator})
+        assert (response.status_code, response.data) == (206, DATA[:10])
+    # A changed file is sent whole
+    for validator in ('"stale"', formatdate(0, usegmt=True)):
+        response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': validator})
+        assert (response.status_code, response.data) == (200, DATA)
+
+
+def test_offload(client, app, monkeypatch):
+    file_id = upload(client, DATA, 'data.txt')
+    with app.app_context():
+        filepath = db.session.get(File, file_id).filepath
+    relative = filepath[len(str(app.config['UPLOAD_FOLDER'])):]
+
+    monkeypatch.setitem(app.config, 'FILE_SERVING_MODE', 'x-accel')
+    monkeypatch.setitem(app.config, 'X_ACCEL_PREFIX', '/internal/')
+    response = client.get(f'/download_file/{file_id}', headers={'Range': 'bytes=0-9'})
+    # The front server does the Range handling too
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f'/internal{relative}'
+    assert response.data == b''
+    assert 'data.txt' in response.headers['Content-Disposition']
+
+    monkeypatch.setitem(app.config, 'FILE_SERVING_MODE', 'x-sendfile')
+    response = client.get(f'/view_file/{file_id}')
+    assert response.headers['X-Sendfile'] == filepath
+    assert client.get(f'/view_file/{file_id}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,34 @@
+from backend.tests.conftest import upload
+
+
+def test_tag_round_trip(client):
+    report = upload(client, b'report', 'report.txt')
+    photo = upload(client, b'photo', 'photo.txt')
+
+    response = client.put(f'/api/files/{report}/tags', json={'tags': ['Work', 'urgent', 'work']})
+    assert response.json['tags'] == ['urgent', 'Work']
+    client.put(f'/api/files/{photo}/tags', json={'tags': ['work']})
+    assert client.get(f'/api/files/{photo}/tags').json['tags'] == ['Work']
+
+    facet = {tag['name']: tag['count'] for tag in client.get('/api/tags').json}
+    assert facet == {'Work': 2, 'urgent': 1}
+
+    files = client.get('/api/tags/files?tags=work,urgent').json
+    assert [item['id'] for item in files] == [report]
+    files = client.get('/api/tags/files?tags=work,urgent&match=any').json
+    assert sorted(item['id'] for item in files) == sorted([report, photo])
+
+
+def test_rename_tag(client):
+    work = client.post('/api/tags', json={'name': 'work'}).json['id']
+    client.post('/api/tags', json={'name': 'home'})
+
+    response = client.put(f'/api/tags/{work}', json={'name': 'Home'})
+    assert response.status_code == 409
+    assert response.json['error'] == "Tag 'home' already exists"
+    assert client.put(f'/api/tags/{work}', json={'name': ' '}).status_code == 400
+    assert client.put(f'/api/tags/{work}', json={'name': 'x' * 101}).status_code == 400
+
+    response = client.put(f'/api/tags/{work}', json={'name': 'Office'})
+    assert response.status_code == 200
+    assert response.json == {'id': work, 'name': 'Office'}
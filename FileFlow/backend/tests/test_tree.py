@@ -0,0 +1,31 @@
+from backend.tests.conftest import create_folder, upload
+
+
+def listing(client, folder_id=None):
+    query = f'?folder_id={folder_id}' if folder_id is not None else ''
+    return {item['name']: item for item in client.get(f'/api/files{query}').json}
+
+
+def test_copy_and_delete_subtree(client, app):
+    folder = create_folder(client, 'folder')
+    inner = create_folder(client, 'inner', folder)
+    upload(client, b'shared', 'one.txt', inner)
+    upload(client, b'other', 'two.txt', folder)
+
+    response = client.post(f'/copy_file/{folder}', json={})
+    assert response.json['copied'] == 4
+    copy = response.json['file_id']
+    assert client.get(f'/api/files/{copy}/size').json == {'id': copy, 'size': 11, 'file_count': 2}
+    assert client.get('/api/usage').json['used'] == 22
+
+    # Copies share blobs, so deleting the original keeps the content
+    assert client.delete(f'/delete_file/{folder}').status_code == 200
+    assert sorted(listing(client)) == ['folder']
+    copied_inner = listing(client, copy)['inner']['id']
+    one = listing(client, copied_inner)['one.txt']['id']
+    assert client.get(f'/download_file/{one}').data == b'shared'
+    assert client.get('/api/usage').json['used'] == 11
+
+    assert client.delete(f'/delete_file/{copy}').status_code == 200
+    objects = app.config['UPLOAD_FOLDER'] / 'objects'
+    assert [p for p in objects.rglob('*') if p.is_file() and p.relative_to(objects).parts[0] != 'tmp'] == []
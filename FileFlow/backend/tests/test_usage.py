@@ -0,0 +1,92 @@
+from io import BytesIO
+
+from sqlalchemy import update
+
+from backend.models.database import db, File, User
+from backend.services.usage_service import UsageService
+from backend.tests.conftest import create_folder, login, upload
+
+
+def usage(client, folder_id=None):
+    query = f'?folder_id={folder_id}' if folder_id is not None else ''
+    return client.get(f'/api/usage{query}').json
+
+
+def stored_objects(app):
+    objects = app.config['UPLOAD_FOLDER'] / 'objects'
+    return [p for p in objects.rglob('*') if p.is_file() and p.relative_to(objects).parts[0] != 'tmp']
+
+
+def test_counters_follow_move_and_delete(client):
+    outer = create_folder(client, 'outer')
+    inner = create_folder(client, 'inner', outer)
+    other = create_folder(client, 'other')
+    first = upload(client, b'1' * 100, 'first.txt', inner)
+    upload(client, b'2' * 50, 'second.txt', outer)
+    assert (usage(client, outer)['folder']['size'], usage(client, inner)['folder']['size']) == (150, 100)
+
+    assert client.post(f'/move_file/{first}', json={'destination_folder_id': other}).json['success']
+    assert usage(client, outer)['folder']['size'] == 50
+    assert usage(client, inner)['folder']['size'] == 0
+    assert usage(client, other)['folder']['size'] == 100
+    assert usage(client)['used'] == 150
+
+    assert client.post(f'/move_file/{outer}', json={'destination_folder_id': other}).json['success']
+    assert usage(client, other)['folder']['size'] == 150
+
+    assert client.delete(f'/delete_file/{outer}').status_code == 200
+    assert usage(client, other)['folder']['size'] == 100
+    assert usage(client)['used'] == 100
+
+
+def test_quota_refuses_overflow(client, app):
+    with app.app_context():
+        db.session.query(User).update({User.storage_quota: 1000})
+        db.session.commit()
+    upload(client, b'a' * 600, 'a.txt')
+
+    response = client.post('/upload', data={'file': (BytesIO(b'b' * 600), 'b.txt')},
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 413
+    assert (response.json['used'], response.json['quota']) == (600, 1000)
+    assert usage(client) == {'used': 600, 'quota': 1000, 'available': 400}
+    # The refused bytes were not kept
+    assert len(stored_objects(app)) == 1
+
+    response = client.post('/api/upload/init', json={'filename': 'big.txt', 'size': 401})
+    assert response.status_code == 413
+    assert client.post(f'/copy_file/{upload(client, b"c" * 300, "c.txt")}', json={}).status_code == 413
+    assert usage(client)['used'] == 900
+
+
+def test_upload_into_foreign_folder(client, app):
+    other, _ = login(app, 'mallory')
+    foreign = create_folder(other, 'private')
+    own_file = upload(client, b'not a folder', 'file.txt')
+
+    for folder_id, status in ((foreign, 403), (own_file, 404), (123456, 404), ('abc', 404)):
+        response = client.post('/upload', data={'file': (BytesIO(b'data'), 'x.txt'), 'folder_id': str(folder_id)},
+                               headers={'Accept': 'application/json'})
+        assert response.status_code == status
+    with app.app_context():
+        assert db.session.get(File, foreign).tree_size == 0
+        assert File.query.filter_by(filename='x.txt').count() == 0
+    assert usage(other)['used'] == 0
+    assert usage(client)['used'] == len(b'not a folder')
+
+
+def test_reconcile(client, app):
+    folder = create_folder(client, 'folder')
+    upload(client, b'x' * 50, 'x.txt', folder)
+    other, other_id = login(app, 'bob')
+    upload(other, b'y' * 20, 'y.txt')
+    with app.app_context():
+        db.session.execute(update(User).values(storage_used=7))
+        db.session.execute(update(File).where(File.id == folder).values(tree_size=0))
+        db.session.commit()
+        assert UsageService.reconcile([other_id]) == {'users_fixed': 1, 'folders_fixed': 0}
+        assert UsageService.reconcile() == {'users_fixed': 1, 'folders_fixed': 1}
+        assert UsageService.reconcile() == {'users_fixed': 0, 'folders_fixed': 0}
+    assert usage(client, folder)['folder']['size'] == 50
+    assert usage(client)['used'] == 50
+    assert usage(other)['used'] == 20
@@ -0,0 +1,51 @@
+from io import BytesIO
+import zipfile
+
+from backend.tests.conftest import create_folder, login, upload
+
+
+def read_zip(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(BytesIO(response.data))
+    assert archive.testzip() is None
+    return archive
+
+
+def test_folder_download(client):
+    folder = create_folder(client, 'photos')
+    inner = create_folder(client, 'empty', folder)
+    upload(client, b'text ' * 1000, 'notes.txt', folder)
+    upload(client, b'nested', 'deep.txt', create_folder(client, 'deep', folder))
+
+    response = client.get(f'/download_file/{folder}')
+    assert 'photos.zip' in response.headers['Content-Disposition']
+    archive = read_zip(response)
+    assert sorted(archive.namelist()) == ['photos/', 'photos/deep/', 'photos/deep/deep.txt',
+                                          'photos/empty/', 'photos/notes.txt']
+    assert archive.read('photos/notes.txt') == b'text ' * 1000
+    assert archive.read('photos/deep/deep.txt') == b'nested'
+    assert client.get(f'/download_file/{inner}').status_code == 200
+
+
+def test_selection_download(client, app):
+    first = upload(client, b'one', 'same.txt')
+    folder = create_folder(client, 'folder')
+    second = upload(client, b'two', 'same.txt', folder)
+
+    response = client.get(f'/download_zip?ids={first},{folder}&ids={second}&name=picked.zip')
+    assert 'picked.zip' in response.headers['Content-Disposition']
+    archive = read_zip(response)
+    # A file selected along with its folder is only stored once
+    assert sorted(archive.namelist()) == ['folder/', 'folder/same.txt', 'same.txt']
+    assert archive.read('same.txt') == b'one'
+    assert archive.read('folder/same.txt') == b'two'
+
+    # Names only clash at the archive root, where the later one is numbered
+    archive = read_zip(client.get(f'/download_zip?ids={first},{second}'))
+    assert archive.namelist() == ['same.txt', 'same (1).txt']
+    assert archive.read('same (1).txt') == b'two'
+
+    other, _ = login(app, 'mallory')
+    assert other.get(f'/download_zip?ids={first}').status_code == 404
+    assert client.get('/download_zip?ids=abc').status_code == 400
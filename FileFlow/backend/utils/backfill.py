@@ -0,0 +1,249 @@
+"""
+Backfill engine for derived File columns (mimetype, content hash, size).
+
+Rows are read in keyset pages by id, the per-file work (libmagic sniffing,
+SHA-256 hashing, stat) runs on a process pool, and each page is written
+back with one bulk_update_mappings call and its own commit. After every
+commit the last handled id is stored in the backfill_checkpoint table, so
+an interrupted run resumes where it stopped.
+
+Usage:
+    flask --app backend.app backfill mimetype
+    flask --app backend.app backfill hash --workers 8 --batch-size 2000
+    flask --app backend.app backfill size --restart
+
+    Or from Flask shell:
+    from backend.utils.backfill import run_backfill
+    run_backfill('mimetype')
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import current_app
+from functools import partial
+from pathlib import Path
+from sqlalchemy import select, func, or_
+import logging
+import multiprocessing
+import os
+import time
+
+try:
+    from backend.models.database import db, File, BackfillCheckpoint
+    from backend.services.blob_service import BlobStore, get_blob_store
+    from backend.services.metadata_cache_service import MetadataCacheService
+    from backend.services.mimetype_service import MimetypeService
+except ImportError:
+    from models.database import db, File, BackfillCheckpoint
+    from services.blob_service import BlobStore, get_blob_store
+    from services.metadata_cache_service import MetadataCacheService
+    from services.mimetype_service import MimetypeService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Seconds between progress log lines
+REPORT_INTERVAL = 10
+
+
+# Per-file work functions run in pool processes: they get a plain dict of
+# the row's columns plus the task params and return the columns to change
+# (or None). They must stay module-level so the pool can pickle them.
+
+def sniff_mimetype(row: dict, params: dict):
+    try:
+        with open(row['filepath'], 'rb') as f:
+            head = f.read(MimetypeService.SNIFF_BYTES)
+    except OSError:
+        return None
+    mimetype = MimetypeService.detect(head, row['filename'])
+    return {'mimetype': mimetype} if mimetype != row['mimetype'] else None
+
+
+def hash_into_store(row: dict, params: dict):
+    """Adopt a legacy file into the blob store; the original is removed after commit"""
+    if not os.path.exists(row['filepath']):
+        return None
+    file_hash, size, object_path = BlobStore(params['upload_folder']).adopt_file(Path(row['filepath']))
+    return {'file_hash': file_hash, 'filesize': size, 'filepath': str(object_path),
+            '_original': row['filepath']}
+
+
+def measure_size(row: dict, params: dict):
+    try:
+        size = os.stat(row['filepath']).st_size
+    except OSError:
+        return None
+    return {'filesize': size} if size != row['filesize'] else None
+
+
+def _call(work, params, row):
+    """Run one unit of work, turning exceptions into results so one bad file cannot stop a page"""
+    try:
+        return row['id'], work(row, params), None
+    except Exception as e:
+        return row['id'], None, f"{type(e).__name__}: {e}"
+
+
+class BackfillTask:
+    """One kind of backfill: which rows need it, what to read and the per-file work
+
+    `before_commit(mappings)` runs with each page's updates before they
+    commit; `after_commit(paths)` gets the ``_original`` paths the work
+    returned once they have.
+    """
+
+    def __init__(self, name, work, columns, condition=None, params=None, before_commit=None, after_commit=None):
+        self.name = name
+        self.work = work
+        self.columns = columns
+        self.condition = condition
+        self.params = params or {}
+        self.before_commit = before_commit
+        self.after_commit = after_commit
+
+
+def _register_blobs(mappings) -> None:
+    """Blob references for the files hash_into_store adopted"""
+    references = {}
+    for mapping in mappings:
+        count, _ = references.get(mapping['file_hash'], (0, mapping['filesize']))
+        references[mapping['file_hash']] = (count + 1, mapping['filesize'])
+    get_blob_store().add_references(references)
+
+
+def _remove_originals(paths) -> None:
+    """Unlink the legacy copies once their rows point at the blob store"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove adopted file {path}: {str(e)}")
+
+
+TASK_NAMES = ('mimetype', 'hash', 'size')
+
+
+def get_task(name: str, all_rows: bool = False) -> BackfillTask:
+    """The task called `name`; `all_rows` re-sniffs mimetypes that are already set"""
+    if name == 'mimetype':
+        condition = None if all_rows else or_(File.mimetype.is_(None), File.mimetype == '',
+                                               File.mimetype == 'application/octet-stream')
+        return BackfillTask('mimetype', sniff_mimetype, (File.id, File.filepath, File.filename, File.mimetype),
+                            condition)
+    if name == 'hash':
+        return BackfillTask('hash', hash_into_store, (File.id, File.filepath), File.file_hash.is_(None),
+                            params={'upload_folder': str(current_app.config['UPLOAD_FOLDER'])},
+                            before_commit=_register_blobs, after_commit=_remove_originals)
+    if name == 'size':
+        return BackfillTask('size', measure_size, (File.id, File.filepath, File.filesize))
+    raise ValueError(f"Unknown backfill task: {name}")
+
+
+class _Progress:
+    def __init__(self, name: str, total: int, checkpoint: BackfillCheckpoint):
+        self.name = name
+        self.total = total
+        self.checkpoint = checkpoint
+        self.started = time.monotonic()
+        self.done_at_start = checkpoint.processed or 0
+        self.last_report = self.started
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.last_report < REPORT_INTERVAL:
+            return
+        self.last_report = now
+        done = (self.checkpoint.processed or 0) - self.done_at_start
+        rate = done / max(now - self.started, 1e-9)
+        remaining = max(self.total - done, 0)
+        eta = f"{remaining / rate:.0f}s" if rate else '?'
+        logger.info(f"Backfill {self.name}: {done}/{self.total} rows this run, {rate:.0f} rows/s, "
+                    f"{self.checkpoint.updated or 0} updated, {self.checkpoint.errors or 0} errors, ETA {eta}")
+
+
+def run_backfill(name: str, workers: int = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 restart: bool = False, all_rows: bool = False) -> dict:
+    """Run (or resume) a backfill task; returns totals for the whole task"""
+    task = get_task(name, all_rows)
+    workers = workers or os.cpu_count() or 1
+
+    checkpoint = db.session.get(BackfillCheckpoint, name)
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(name=name, last_id=0, processed=0, updated=0, errors=0)
+        db.session.add(checkpoint)
+    elif restart or checkpoint.finished_at is not None:
+        checkpoint.last_id, checkpoint.processed, checkpoint.updated, checkpoint.errors = 0, 0, 0, 0
+        checkpoint.started_at, checkpoint.finished_at = datetime.utcnow(), None
+    db.session.commit()
+    if checkpoint.last_id:
+        logger.info(f"Resuming backfill {name} after file id {checkpoint.last_id}")
+
+    conditions = [File.is_folder.is_(False)]
+    if task.condition is not None:
+        conditions.append(task.condition)
+    total = db.session.execute(
+        select(func.count()).select_from(File).where(*conditions, File.id > checkpoint.last_id)
+    ).scalar()
+    progress = _Progress(name, total, checkpoint)
+    call = partial(_call, task.work, task.params)
+
+    # spawn: workers must not inherit the app's DB connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        while True:
+            # Keyset pages: no cursor has to stay open across the per-page commits
+            rows = db.session.execute(
+                select(*task.columns).where(*conditions, File.id > checkpoint.last_id)
+                .order_by(File.id).limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            results = list(executor.map(call, [dict(row) for row in rows],
+                                        chunksize=max(1, len(rows) // (workers * 4))))
+
+            mappings, originals = [], []
+            for file_id, changes, error in results:
+                if error:
+                    checkpoint.errors += 1
+                    logger.warning(f"Backfill {name} failed for file {file_id}: {error}")
+                elif changes:
+                    original = changes.pop('_original', None)
+                    if original:
+                        originals.append(original)
+                    mappings.append({'id': file_id, **changes})
+
+            if mappings:
+                if task.before_commit is not None:
+                    task.before_commit(mappings)
+                db.session.bulk_update_mappings(File, mappings)
+                MetadataCacheService.invalidate(m['id'] for m in mappings)
+            checkpoint.last_id = rows[-1]['id']
+            checkpoint.processed += len(rows)
+            checkpoint.updated += len(mappings)
+            db.session.commit()
+            if task.after_commit is not None and originals:
+                task.after_commit(originals)
+            progress.report()
+
+    checkpoint.finished_at = datetime.utcnow()
+    db.session.commit()
+    progress.report(force=True)
+    return {
+        'success': True,
+        'task': name,
+        'processed': checkpoint.processed,
+        'updated': checkpoint.updated,
+        'errors': checkpoint.errors
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    try:
+        from backend.app import app
+    except ImportError:
+        from app import app
+    with app.app_context():
+        print(run_backfill(sys.argv[1] if len(sys.argv) > 1 else 'mimetype'))
@@ -0,0 +1,138 @@
+"""
+Utility script to bring an existing database up to the current models.
+db.create_all() only creates missing tables; this also adds missing columns
+and indexes to tables that already exist and backfills derived data.
+
+Usage:
+    flask --app backend.app migrate-db
+
+    Or from Flask shell:
+    from backend.utils.migrate_schema import migrate_schema
+    migrate_schema()
+"""
+
+from sqlalchemy import inspect, select, update, bindparam, cast, String, literal
+from sqlalchemy.orm import aliased
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def upgrade_schema(db):
+    """Create missing tables, columns and indexes for every model"""
+    engine = db.engine
+    db.create_all()
+    inspector = inspect(engine)
+    added = []
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+                added.append(f"{table.name}.{column.name}")
+                logger.info(f"Added column {table.name}.{column.name} ({column_type})")
+
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        existing = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                added.append(index.name)
+                logger.info(f"Created index {index.name}")
+    return added
+
+
+def backfill_paths(db, File):
+    """Recompute File.path for every row from parent_folder_id
+
+    The tree is walked top-down with a single recursive CTE and only rows
+    whose stored path is wrong are rewritten, in batches.
+    """
+    tree = select(File.id.label('id'), (literal('/') + cast(File.id, String) + '/').label('path')).where(
+        File.parent_folder_id.is_(None)
+    ).cte('tree', recursive=True)
+    child = aliased(File)
+    tree = tree.union_all(
+        select(child.id, tree.c.path + cast(child.id, String) + '/').where(child.parent_folder_id == tree.c.id)
+    )
+    stale = select(tree.c.id, tree.c.path).join(File, File.id == tree.c.id).where(
+        (File.path.is_(None)) | (File.path != tree.c.path)
+    )
+
+    file_table = File.__table__
+    statement = update(file_table).where(file_table.c.id == bindparam('row_id')).values(path=bindparam('new_path'))
+    rows = db.session.execute(stale).all()
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch = rows[i:i + BATCH_SIZE]
+        db.session.execute(statement, [{'row_id': r.id, 'new_path': r.path} for r in batch])
+        logger.info(f"Backfilled paths: {i + len(batch)}/{len(rows)}")
+    db.session.commit()
+    return len(rows)
+
+
+def migrate_schema(db=None, File=None):
+    """
+    Upgrade the schema and backfill derived columns.
+    If called from Flask shell, db and File will be injected.
+    """
+    try:
+        if db is None or File is None:
+            try:
+                from backend.models.database import db, File
+            except ImportError:
+                from models.database import db, File
+
+        try:
+            from backend.services.search_service import SearchService
+            from backend.services.usage_service import UsageService
+            from backend.services.tag_service import TagService
+        except ImportError:
+            from services.search_service import SearchService
+            from services.usage_service import UsageService
+            from services.tag_service import TagService
+
+        added = upgrade_schema(db)
+        paths = backfill_paths(db, File)
+        # Comma-joined File.tags strings become tag rows before the index reads them
+        tagged = TagService.split_legacy()
+        # A new search index starts empty; fill it with names and tags
+        indexed = SearchService.rebuild() if SearchService.create_index() else 0
+        # New usage counters start empty; paths must be right before folders are summed
+        usage = UsageService.reconcile()
+        logger.info(f"Schema migration complete: {len(added)} columns/indexes added, {paths} paths backfilled, "
+                    f"{tagged} files' tags split, {indexed} files indexed for search, "
+                    f"{usage['users_fixed']} usage counters filled")
+        return {
+            'success': True,
+            'added': added,
+            'paths_backfilled': paths,
+            'tags_split': tagged,
+            'search_indexed': indexed,
+            'usage_fixed': usage
+        }
+
+    except Exception as e:
+        if db:
+            db.session.rollback()
+        logger.error(f"Schema migration failed: {str(e)}", exc_info=True)
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+if __name__ == '__main__':
+    try:
+        from backend.app import app
+    except ImportError:
+        from app import app
+    with app.app_context():
+        print(migrate_schema())
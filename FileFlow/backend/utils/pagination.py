@@ -0,0 +1,193 @@
+from flask import Response, stream_with_context
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, or_, literal, select, func
+import base64
+import json
+try:
+    from backend.models.database import db, File, Tag, FileTag
+except ImportError:
+    from models.database import db, File, Tag, FileTag
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Flush the streamed JSON body in pieces of roughly this size
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _split_tags(value):
+    return sorted(value.split(','), key=str.lower) if value else []
+
+
+# Comma-joined tag names of each listed row, read through the file_tag primary key
+TAG_NAMES = select(func.aggregate_strings(Tag.name, ',')).join(FileTag, FileTag.tag_id == Tag.id).where(
+    FileTag.file_id == File.id).scalar_subquery().label('tags')
+
+
+class Projection:
+    """Maps public field names to columns so responses select only what they return"""
+
+    def __init__(self, fields: Dict[str, Tuple[object, Optional[Callable]]]):
+        self.fields = fields
+
+    def parse(self, requested, default: Sequence[str]) -> List[str]:
+        """Validate a ``fields=`` value (comma string or list); raises ValueError"""
+        if not requested:
+            return list(default)
+        if isinstance(requested, str):
+            requested = requested.split(',')
+        names = [name.strip() for name in requested if name and name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return list(dict.fromkeys(names)) or list(default)
+
+    def columns(self, names: Iterable[str]) -> list:
+        """Distinct columns needed for `names`, labelled by column key"""
+        columns = {}
+        for name in names:
+            column = self.fields[name][0]
+            columns.setdefault(column.key, column)
+        return list(columns.values())
+
+    def serialize(self, row, names: Iterable[str]) -> dict:
+        item = {}
+        for name in names:
+            column, convert = self.fields[name]
+            value = getattr(row, column.key)
+            item[name] = convert(value) if convert else value
+        return item
+
+
+# Every field the file listing and search APIs can return
+FILE_FIELDS = Projection({
+    'id': (File.id, None),
+    'name': (File.filename, None),
+    'filename': (File.filename, None),
+    'filepath': (File.filepath, None),
+    'is_folder': (File.is_folder, None),
+    'parent_folder_id': (File.parent_folder_id, None),
+    'size': (File.filesize, None),
+    'filesize': (File.filesize, None),
+    'tree_size': (File.tree_size, None),
+    'mimetype': (File.mimetype, None),
+    'created_at': (File.created_at, _isoformat),
+    'modified_at': (File.modified_at, _isoformat),
+    'is_favorite': (File.is_favorite, None),
+    'tags': (TAG_NAMES, _split_tags),
+    'file_hash': (File.file_hash, None),
+    'is_missing': (File.is_missing, bool),
+})
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque cursor for the sort key values of the last row on a page"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str, length: int) -> list:
+    """Decode a cursor from encode_cursor; raises ValueError if it is malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def parse_limit(value) -> Optional[int]:
+    """Page size from a request value; None keeps the unpaginated response"""
+    if value in (None, ''):
+        return None
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_filter(order: Sequence[Tuple[object, bool]], values: Sequence):
+    """Rows strictly after `values` in an ORDER BY of ``(column, descending)`` keys
+
+    Expanded to ``k1 > v1 OR (k1 = v1 AND k2 > v2) ...`` because the keys
+    mix directions, which a row-value comparison cannot express.
+    """
+    # Bind through literal() so booleans compare with < and > like any value
+    values = [literal(value, column.type) for (column, _), value in zip(order, values)]
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def iter_json(rows: Iterable, serialize: Callable, limit: Optional[int] = None,
+              cursor_for: Optional[Callable] = None):
+    """Encode rows as a JSON document piece by piece
+
+    Without `limit` this is the bare list the API always returned. With it,
+    at most `limit` items are emitted as ``{"items": [...], "next_cursor"}``;
+    `rows` should hold one extra row so the presence of a next page is known
+    without a COUNT.
+    """
+    paginated = limit is not None
+    buffer = ['{"items":[' if paginated else '[']
+    size = 0
+    last = None
+    next_cursor = None
+    for count, row in enumerate(rows):
+        if paginated and count == limit:
+            next_cursor = cursor_for(last)
+            break
+        piece = json.dumps(serialize(row), separators=(',', ':'))
+        buffer.append(piece if count == 0 else ',' + piece)
+        size += len(piece)
+        last = row
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if paginated:
+        buffer.append('],"next_cursor":' + json.dumps(next_cursor) + '}')
+    else:
+        buffer.append(']')
+    yield ''.join(buffer)
+
+
+def keyset_page(statement, names: Sequence[str], order: Sequence[Tuple[object, bool]],
+                limit: Optional[int] = None, cursor: Optional[str] = None,
+                projection: Projection = FILE_FIELDS) -> Response:
+    """Stream `statement` as JSON, selecting only the projected columns
+
+    `order` is the complete ``(column, descending)`` sort key and must end in
+    a unique column. A cursor without a limit uses DEFAULT_PAGE_SIZE.
+    Raises ValueError for a malformed cursor before anything is sent.
+    """
+    after = decode_cursor(cursor, len(order)) if cursor else None
+    if cursor and limit is None:
+        limit = DEFAULT_PAGE_SIZE
+
+    columns = {column.key: column for column in projection.columns(names)}
+    for column, _ in order:
+        columns.setdefault(column.key, column)
+    statement = statement.with_only_columns(*columns.values()).order_by(
+        *(column.desc() if descending else column for column, descending in order))
+    if after is not None:
+        statement = statement.where(keyset_filter(order, after))
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    rows = db.session.execute(statement.execution_options(yield_per=1000))
+
+    def cursor_for(row):
+        return encode_cursor([getattr(row, column.key) for column, _ in order])
+
+    body = iter_json(rows, lambda row: projection.serialize(row, names), limit, cursor_for)
+    return Response(stream_with_context(body), mimetype='application/json')
@@ -1,22 +1,15 @@
 #!/bin/bash
 # Render build and deployment script
-# This initializes the database on first deployment
+# This creates the database on first deployment and migrates it on every later one
 
 set -e
 
 echo "📦 Installing dependencies..."
 pip install -r FileFlow/backend/requirements.txt
 
-echo "🗄️ Initializing database..."
+echo "🗄️ Migrating database..."
 cd FileFlow
-python -c "
-import os
-os.environ['FLASK_ENV'] = 'production'
-from backend.app import app, db
-
-with app.app_context():
-    db.create_all()
-    print('✓ Database initialized successfully')
-"
+# Creates missing tables, adds new columns and indexes, backfills derived data
+FLASK_ENV=production FLASK_APP=backend.app flask migrate-db
 
 echo "✅ Build complete!"